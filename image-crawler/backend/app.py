@@ -1,15 +1,31 @@
 # app.py
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, request, render_template, jsonify, url_for, send_file, abort, stream_with_context
 import os
-import boto3 # AWS SDK für Python
 from botocore.exceptions import ClientError # Für Boto3 Fehlerbehandlung
 import logging
 import json # Für das Erstellen der SQS Nachricht
+import base64 # Für opake Galerie-Cursor
+import time
+import socket # Für die Kennung der beanspruchenden Instanz
+import startup_timing
 
 # Importiere Funktionen und Konfigurationen aus crawler.py
 # Stelle sicher, dass crawler.py im PYTHONPATH ist oder im selben Verzeichnis liegt.
-from crawler import search_media_by_hashtag, process_media, getCreds, crawled_media_table # crawled_media_table importieren
-from boto3.dynamodb.conditions import Key, Attr # Für DynamoDB FilterExpressions
+with startup_timing.timed('import:crawler'):
+    from crawler import search_media_by_hashtag, process_media, getCreds, get_crawled_media_table
+    from crawler import get_gallery_version, gallery_version_listeners, get_utc_timestamp
+    from crawler import get_crawl_state, claim_crawl, release_crawl, record_suppressed_crawl
+    from crawler import CrawlFailed, crawl_failure_reason
+import aws_clients
+import lazy_init
+from lazy_init import lazy_import
+from jobs import JobRegistry
+from coalescer import CrawlCoalescer
+from rate_limit import graph_governor
+from presign_cache import PresignedUrlCache
+from gallery_cache import GalleryResponseCache
+from metrics import metrics
+from storage import create_storage, DEFAULT_LOCAL_ROOT, IMMUTABLE_CACHE_CONTROL
 
 app = Flask(
     __name__,
@@ -25,202 +41,493 @@ S3_BUCKET_NAME = creds.get('s3_bucket_name')
 S3_REGION = creds.get('s3_bucket_region', creds.get('dynamodb_region')) # Fallback für S3 Region
 SQS_QUEUE_URL = creds.get('sqs_queue_url')
 SQS_REGION = creds.get('sqs_queue_region', S3_REGION) # Fallback für SQS Region
+# GSI auf CrawledMedia: Partition Key 'hashtag_source', Sort Key 'download_timestamp_utc'
+GALLERY_INDEX_NAME = creds.get('dynamodb_gallery_index', 'hashtag_source-download_timestamp_utc-index')
+GALLERY_DEFAULT_PAGE_SIZE = int(creds.get('gallery_default_page_size', 60))
+GALLERY_MAX_PAGE_SIZE = int(creds.get('gallery_max_page_size', 200))
+# NDJSON-Modus: Items je DynamoDB-Query (bestimmt den Speicherbedarf) und max. Items je Antwort
+GALLERY_STREAM_PAGE_SIZE = int(creds.get('gallery_stream_page_size', 100))
+GALLERY_STREAM_MAX_ITEMS = int(creds.get('gallery_stream_max_items', 10000))
+# Über ?fields= anforderbare Attribute; 'display_url' wird aus den Storage-Attributen berechnet
+GALLERY_FIELDS = ('media_id', 'media_type', 'parent_id', 'hashtag_source', 'permalink', 'caption', 'media_url_original',
+                  'download_timestamp_utc', 'is_hashtag_result', 'content_sha256', 'phash', 'duplicate_of', 'size_bytes',
+                  'storage', 's3_key', 's3_bucket', 'derivatives', 'display_url')
+DISPLAY_URL_SOURCE_FIELDS = ('media_id', 'storage', 's3_key', 's3_bucket', 'derivatives')
+# Suchaufträge: 'local' crawlt in diesem Prozess, 'sqs' überlässt den Crawl der Lambda-Funktion
+CRAWL_JOB_MODE = creds.get('crawl_job_mode', 'sqs' if SQS_QUEUE_URL else 'local')
+JOB_LIMIT_PER_HASHTAG = int(creds.get('job_limit_per_hashtag', 7))
+JOB_TIME_BUDGET_SECONDS = float(creds.get('job_time_budget_seconds', 300))
+JOB_SQS_POLL_SECONDS = float(creds.get('job_sqs_poll_seconds', 2))
+JOB_SQS_IDLE_SECONDS = float(creds.get('job_sqs_idle_seconds', 60)) # Ohne neue Bilder gilt der Job danach als beendet
+JOB_SQS_MAX_WAIT_SECONDS = float(creds.get('job_sqs_max_wait_seconds', 900)) # Max. Lambda-Laufzeit
+JOB_SSE_KEEPALIVE_SECONDS = float(creds.get('job_sse_keepalive_seconds', 15))
+JOB_SSE_RETRY_MS = int(creds.get('job_sse_retry_ms', 2000))
+# Bildablage wie im Crawler: 's3' (Presigned URLs) oder 'local' (Auslieferung über /media/)
+STORAGE_BACKEND = creds.get('storage_backend', 's3').lower()
+LOCAL_STORAGE_ROOT = creds.get('local_storage_root', DEFAULT_LOCAL_ROOT)
+LOCAL_STORAGE_URL_PREFIX = creds.get('local_storage_url_prefix', '/media/') # z.B. CDN/Edge-Cache vor /media/
+# Hinter nginx/Apache: Datei per X-Sendfile vom Webserver ausliefern lassen
+app.config['USE_X_SENDFILE'] = bool(creds.get('media_use_x_sendfile', False))
 
 # Überprüfung der Konfiguration (vereinfacht, da bereits im Original vorhanden)
 # ... (Ihre bestehenden Konfigurationsprüfungen) ...
 
-# S3 und SQS Clients initialisieren
-s3_client_app = None
-sqs_client_app = None
-try:
-    if S3_BUCKET_NAME and S3_REGION:
-        s3_client_app = boto3.client('s3', region_name=S3_REGION)
-    else:
-        print("WARNUNG: S3 Client nicht initialisiert, da S3_BUCKET_NAME oder S3_REGION fehlen.")
+# Presigned URLs werden wiederverwendet, bis ihre Restlaufzeit unter die Schwelle fällt
+presigned_url_cache = PresignedUrlCache(
+    max_entries=int(creds.get('presign_cache_max_entries', 10000)),
+    expires_in=int(creds.get('presign_expires_seconds', 3600)), # 1 Stunde Gültigkeit
+    min_remaining_seconds=int(creds.get('presign_min_remaining_seconds', 900)),
+    max_cache_seconds=int(creds.get('presign_max_cache_seconds', 1800)) # Deutlich unter der Laufzeit temporärer Rollen-Credentials
+)
+
+# Galerie-Antworten pro Hashtag cachen; der Crawler erhöht die Version bei neuen Bildern
+gallery_response_cache = GalleryResponseCache(
+    version_source=get_gallery_version,
+    max_entries=int(creds.get('gallery_cache_max_entries', 256)),
+    ttl_seconds=int(creds.get('gallery_cache_ttl_seconds', 300)), # Deutlich unter presign_min_remaining_seconds
+    version_check_interval_seconds=float(creds.get('gallery_version_check_seconds', 5))
+)
+gallery_version_listeners.append(gallery_response_cache.notify_version) # Crawls im selben Prozess invalidieren sofort
+
+# Suchaufträge laufen in eigenen Threads, Web-Worker antworten sofort
+crawl_jobs = JobRegistry(
+    max_workers=int(creds.get('job_max_workers', 2)),
+    max_jobs=int(creds.get('job_max_jobs', 200)),
+    job_ttl_seconds=int(creds.get('job_ttl_seconds', 3600))
+)
+# Doppelte Suchaufträge zusammenfassen: im Prozess über die Job-Liste, zwischen Instanzen über CrawlTasks
+CRAWL_CLAIM_OWNER = f"{socket.gethostname()}:{os.getpid()}" # Kennung dieser Instanz in crawl_claim_owner
+crawl_coalescer = CrawlCoalescer(
+    crawl_jobs,
+    claim=lambda hashtag: claim_crawl(hashtag, CRAWL_CLAIM_OWNER),
+    on_suppressed=record_suppressed_crawl,
+    recent_seconds=int(creds.get('crawl_recent_seconds', 120))
+)
+
+# S3 und SQS Clients werden erst bei Bedarf erzeugt (und mit crawler.py geteilt, falls gleiche Region)
+if not (S3_BUCKET_NAME and S3_REGION):
+    print("WARNUNG: S3 Client nicht verfügbar, da S3_BUCKET_NAME oder S3_REGION fehlen.")
+if not (SQS_QUEUE_URL and SQS_REGION):
+    print("WARNUNG: SQS Client nicht verfügbar, da SQS_QUEUE_URL oder SQS_REGION fehlen.")
+
+
+def get_s3_client_app():
+    if not (S3_BUCKET_NAME and S3_REGION):
+        return None
+    try:
+        return aws_clients.get_s3_client(S3_REGION)
+    except Exception as e:
+        app.logger.error(f"Fehler bei der Initialisierung des S3 Clients in app.py: {e}")
+        return None
 
-    if SQS_QUEUE_URL and SQS_REGION:
-        sqs_client_app = boto3.client('sqs', region_name=SQS_REGION)
-    else:
-        print("WARNUNG: SQS Client nicht initialisiert, da SQS_QUEUE_URL oder SQS_REGION fehlen.")
-except Exception as e:
-    print(f"Schwerwiegender Fehler bei der Initialisierung von AWS Clients in app.py: {e}")
+
+def get_storage_app():
+    # Gleiches Backend wie der Crawler; S3 nutzt den Presigned-URL-Cache dieses Workers
+    return lazy_init.memoized('app:storage', lambda: create_storage(
+        STORAGE_BACKEND,
+        s3_client_factory=get_s3_client_app,
+        bucket=S3_BUCKET_NAME,
+        url_cache=presigned_url_cache,
+        local_root=LOCAL_STORAGE_ROOT,
+        local_url_prefix=LOCAL_STORAGE_URL_PREFIX
+    ))
+
+
+def get_sqs_client_app():
+    if not (SQS_QUEUE_URL and SQS_REGION):
+        return None
+    try:
+        return aws_clients.get_sqs_client(SQS_REGION)
+    except Exception as e:
+        app.logger.error(f"Fehler bei der Initialisierung des SQS Clients in app.py: {e}")
+        return None
 
 
 @app.route("/", methods=["GET", "POST"])
 def index():
-    images_data_from_direct_crawler = [] # Umbenannt für Klarheit
-    processed_template_images = []
     search_term_display = ""
-    # current_hashtag wird direkt im Template gesetzt, wenn es als Parameter übergeben wird
     message_to_user = ""
     current_hashtag_query_for_template = "" # Für das value-Attribut im Input-Feld
+    current_job_id = "" # JS verbindet sich mit dem Ereignis-Stream dieses Jobs
 
     if request.method == "POST":
+        # Fallback ohne JavaScript; mit JS sendet die Seite direkt an /api/jobs
         hashtag_query = request.form.get("hashtag", "").strip()
         current_hashtag_query_for_template = hashtag_query # Für das Input-Feld nach dem POST
 
-        if hashtag_query:
+        if hashtag_query.lstrip('#'):
             search_term_display = f"Ergebnisse für Hashtag: #{hashtag_query.lstrip('#')}"
-            app.logger.info(f"Starte Hashtag-Suche (direkt und via SQS) für: {hashtag_query}")
-
-            # 1. Nachricht an SQS senden
-            if sqs_client_app and SQS_QUEUE_URL:
-                try:
-                    message_body = {"hashtag": hashtag_query.lstrip('#'), "platform": "instagram"} # Hashtag ohne # senden
-                    response = sqs_client_app.send_message(
-                        QueueUrl=SQS_QUEUE_URL,
-                        MessageBody=json.dumps(message_body)
-                    )
-                    message_id = response.get('MessageId')
-                    app.logger.info(f"Nachricht für Hashtag '{hashtag_query}' an SQS gesendet. Message ID: {message_id}")
-                    message_to_user = f"Suchauftrag für '{hashtag_query}' an Hintergrundverarbeitung gesendet. Ergebnisse unten sind von der direkten Suche und werden ggf. erweitert."
-                except ClientError as e:
-                    app.logger.error(f"ClientError beim Senden der Nachricht an SQS für Hashtag '{hashtag_query}': {e}")
-                    if "NonExistentQueue" in str(e):
-                        message_to_user = "Fehler: Die angegebene SQS-Warteschlange existiert nicht oder die Region ist falsch. Bitte Konfiguration prüfen."
-                    else:
-                        message_to_user = "Fehler beim Senden des Suchauftrags an die Hintergrundverarbeitung."
-                except Exception as e_general:
-                    app.logger.error(f"Allgemeiner Fehler beim Senden der SQS Nachricht für '{hashtag_query}': {e_general}")
-                    message_to_user = "Unerwarteter Fehler beim Senden des Suchauftrags."
+            job, outcome, error_message = submit_crawl_job(hashtag_query)
+            if job:
+                current_job_id = job.job_id
+                if outcome == 'started':
+                    message_to_user = f"Suchauftrag für '{hashtag_query}' gestartet. Neue Bilder erscheinen, sobald sie gespeichert sind."
+                else:
+                    message_to_user = f"Für '{hashtag_query}' läuft bereits eine Suche oder wurde gerade abgeschlossen. Ihre Anfrage wurde angeschlossen."
             else:
-                app.logger.warning("SQS Client oder Queue URL nicht konfiguriert.")
-                # ... (Ihre bestehende Logik für message_to_user bei SQS-Fehlern) ...
-
-
-            # 2. Crawler direkt aufrufen für sofortige (blockierende) Anzeige
-            # Dieser Teil liefert eine erste schnelle Ansicht. Die JS-Logik holt dann alle Daten.
-            app.logger.info(f"Starte direkten Crawler-Aufruf für Hashtag: {hashtag_query}")
-            try:
-                if not ACCESS_TOKEN:
-                    app.logger.error("Instagram ACCESS_TOKEN ist nicht konfiguriert!")
-                    raise ValueError("Instagram Access Token fehlt.")
-
-                images_data_from_direct_crawler = search_media_by_hashtag(
-                    ACCESS_TOKEN,
-                    INSTAGRAM_BUSINESS_ACCOUNT_ID,
-                    hashtag_query.lstrip('#') # Hashtag ohne # an Crawler übergeben
-                )
-                app.logger.info(f"Direkter Crawler lieferte {len(images_data_from_direct_crawler)} Elemente für Hashtag '{hashtag_query}'.")
-                # ... (Ihre bestehende Logik für message_to_user bei direkter Suche) ...
-
-            except ValueError as e_val:
-                app.logger.error(f"Fehler beim direkten Crawler-Aufruf für '{hashtag_query}': {e_val}")
-                # ... (Ihre bestehende Logik für message_to_user bei direkter Suche) ...
-            except Exception as e_crawl:
-                app.logger.error(f"Fehler beim direkten Crawler-Aufruf für '{hashtag_query}': {e_crawl}")
-                # ... (Ihre bestehende Logik für message_to_user bei direkter Suche) ...
-        
+                message_to_user = error_message
         else: # Kein Hashtag eingegeben
             search_term_display = "Bitte geben Sie einen Hashtag ein."
             app.logger.info("Leere Hashtag-Suche erhalten.")
 
-        # Generiere Presigned URLs für Bilder aus dem direkten Crawler-Aufruf
-        if s3_client_app and images_data_from_direct_crawler:
-            app.logger.info(f"Generiere Presigned URLs für {len(images_data_from_direct_crawler)} direkt abgerufene Elemente.")
-            for img_data in images_data_from_direct_crawler:
-                img_data_copy = img_data.copy()
-                # ... (Ihre bestehende Logik zum Generieren von Presigned URLs) ...
-                # Statt hier direkt `processed_template_images` zu füllen,
-                # übergeben wir `current_hashtag_query_for_template`, damit JS die Daten holen kann.
-                # Die direkten Ergebnisse können optional als erste schnelle Anzeige dienen.
-                # Für dieses Beispiel lassen wir die JS-Logik die Galerie komplett neu aufbauen.
-                pass # Die Logik zur Anzeige der direkten Ergebnisse wird durch JS ersetzt/ergänzt
-    
     # Wenn ein Hashtag gesucht wurde, wird dieser an das Template übergeben,
     # damit JavaScript die Galerie-API aufrufen kann.
     return render_template("index.html",
                            images=[], # Wird initial leer sein und von JS gefüllt
                            search_term_display=search_term_display,
                            current_hashtag=current_hashtag_query_for_template, # Wichtig für JS
+                           current_job_id=current_job_id,
                            message_to_user=message_to_user)
 
 
+def _run_local_crawl_job(job):
+    # Crawl in diesem Prozess; jedes gespeicherte Bild wird sofort als Ereignis veröffentlicht
+    # Bei Fehlern den Claim freigeben, sonst verfolgen neue Anfragen einen nicht mehr laufenden Crawl
+    try:
+        if not ACCESS_TOKEN:
+            raise ValueError("Instagram Access Token fehlt.")
+        crawl_stats = {}
+        stored_images = search_media_by_hashtag(
+            ACCESS_TOKEN,
+            INSTAGRAM_BUSINESS_ACCOUNT_ID,
+            job.hashtag,
+            limit_per_hashtag=JOB_LIMIT_PER_HASHTAG,
+            time_budget_seconds=JOB_TIME_BUDGET_SECONDS,
+            on_image_stored=lambda image_info: job.publish('image', image_info),
+            stats=crawl_stats
+        )
+        # Fehler meldet search_media_by_hashtag nur über die Statistik; der Job gilt dann als
+        # fehlgeschlagen (Status 'failed' in /api/jobs/<id> und im Ereignis-Stream)
+        failure_reason = crawl_failure_reason(crawl_stats)
+        if failure_reason:
+            raise CrawlFailed(f"Crawl für '{job.hashtag}' unvollständig ({len(stored_images)} neue Bilder): {failure_reason}", crawl_stats)
+    except BaseException:
+        release_crawl(job.hashtag, CRAWL_CLAIM_OWNER)
+        raise
+    app.logger.info(f"Job {job.job_id}: Crawl für '{job.hashtag}' abgeschlossen, {len(stored_images)} neue Bilder.")
+
+
+def _watch_gallery(job, since_timestamp):
+    """
+    Veröffentlicht Bilder, die ein Crawl in einem anderen Prozess (Lambda, anderer Worker)
+    seit `since_timestamp` speichert. Abgefragt wird nur, wenn sich die Galerie-Version ändert.
+    Endet, sobald der Crawl laut CrawlTasks abgeschlossen ist, nach JOB_SQS_IDLE_SECONDS
+    ohne neue Bilder oder spätestens nach JOB_SQS_MAX_WAIT_SECONDS.
+    """
+    seen_media_ids = set()
+    last_version = None
+    deadline = time.time() + JOB_SQS_MAX_WAIT_SECONDS
+    idle_deadline = time.time() + JOB_SQS_IDLE_SECONDS
+    while time.time() < min(deadline, idle_deadline):
+        crawl_state = get_crawl_state(job.hashtag) or {}
+        crawl_finished = crawl_state.get('last_completed_timestamp_utc', '') >= since_timestamp
+        version = get_gallery_version(job.hashtag)
+        if version != last_version:
+            last_version = version
+            items, _ = query_gallery_page(job.hashtag, GALLERY_DEFAULT_PAGE_SIZE)
+            new_items = [item for item in items
+                         if item.get('download_timestamp_utc', '') >= since_timestamp and item['media_id'] not in seen_media_ids]
+            for item in reversed(new_items): # Älteste zuerst, wie beim lokalen Crawl
+                seen_media_ids.add(item['media_id'])
+                job.publish('image', item)
+            if new_items:
+                idle_deadline = time.time() + JOB_SQS_IDLE_SECONDS
+        if crawl_finished:
+            return
+        time.sleep(JOB_SQS_POLL_SECONDS)
+
+
+def _run_sqs_crawl_job(job):
+    # Crawl durch die Lambda-Funktion; neue Bilder werden über die Galerie-Version erkannt
+    started_timestamp = get_utc_timestamp()
+    try:
+        response = get_sqs_client_app().send_message(
+            QueueUrl=SQS_QUEUE_URL,
+            # Hashtag ohne # senden; claim_owner, damit die Lambda-Funktion den Claim bei Fehlern freigibt
+            MessageBody=json.dumps({"hashtag": job.hashtag, "platform": "instagram", "claim_owner": CRAWL_CLAIM_OWNER})
+        )
+    except BaseException:
+        release_crawl(job.hashtag, CRAWL_CLAIM_OWNER)
+        raise
+    app.logger.info(f"Job {job.job_id}: Nachricht für Hashtag '{job.hashtag}' an SQS gesendet. Message ID: {response.get('MessageId')}")
+    _watch_gallery(job, started_timestamp)
+
+
+def _follow_crawl_job(job):
+    # Kein eigener Crawl: Ergebnisse des laufenden bzw. gerade beendeten Crawls einer anderen Instanz verfolgen
+    crawl_state = get_crawl_state(job.hashtag) or {}
+    since_timestamp = crawl_state.get('crawl_claimed_at') or get_utc_timestamp()
+    app.logger.info(f"Job {job.job_id}: Verfolge bestehenden Crawl für '{job.hashtag}' (beansprucht seit {since_timestamp}).")
+    _watch_gallery(job, since_timestamp)
+
+
+def submit_crawl_job(hashtag_query):
+    """
+    Startet einen Suchauftrag im Hintergrund oder schließt sich einem bestehenden an.
+    Gibt (job, ergebnis, None) oder (None, None, fehlermeldung) zurück; ergebnis ist
+    'started', 'joined' (Job dieses Prozesses) oder 'following' (Crawl einer anderen Instanz).
+    Im Modus 'sqs' crawlt ausschließlich die Lambda-Funktion, im Modus 'local' dieser Prozess.
+    """
+    clean_hashtag = hashtag_query.strip().lstrip('#')
+    if CRAWL_JOB_MODE == 'sqs':
+        if not get_sqs_client_app():
+            app.logger.warning("SQS Client oder Queue URL nicht konfiguriert.")
+            return None, None, "Fehler: Die Hintergrundverarbeitung (SQS) ist nicht konfiguriert."
+        run_func = _run_sqs_crawl_job
+    else:
+        run_func = _run_local_crawl_job
+    job, outcome = crawl_coalescer.submit(clean_hashtag, run_func, _follow_crawl_job, CRAWL_JOB_MODE)
+    app.logger.info(f"Job {job.job_id} ({job.mode}) für Hashtag '{clean_hashtag}': {outcome}.")
+    return job, outcome, None
+
+
+def select_display_key(item_data, size, image_format):
+    """Wählt den S3-Key des gewünschten Derivats; ohne passendes Derivat das Original."""
+    if size and size != 'original':
+        derivatives_for_size = (item_data.get('derivatives') or {}).get(str(size)) or {}
+        derivative_key = derivatives_for_size.get(image_format) or derivatives_for_size.get('jpeg')
+        if derivative_key:
+            return derivative_key
+    return item_data.get('s3_key')
+
+
+def encode_gallery_cursor(last_evaluated_key):
+    # Opaker Cursor: LastEvaluatedKey des GSI als URL-sicheres Base64-JSON
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_gallery_cursor(cursor, hashtag):
+    """Dekodiert einen Cursor; wirft ValueError, wenn er ungültig ist oder zu einem anderen Hashtag gehört."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        start_key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except Exception as e:
+        raise ValueError(f"Cursor nicht lesbar: {e}")
+    if not isinstance(start_key, dict) or start_key.get('hashtag_source') != hashtag:
+        raise ValueError("Cursor gehört nicht zu diesem Hashtag.")
+    return start_key
+
+
+def parse_gallery_fields(fields_param):
+    """
+    Übersetzt `fields=media_id,caption,display_url` in (felder, projektion) für die Query.
+    Ohne Parameter (None, None): alle Attribute. Nur Felder aus GALLERY_FIELDS sind erlaubt,
+    sonst ValueError. Für 'display_url' werden die Storage-Attribute mitgelesen.
+    """
+    if not fields_param:
+        return None, None
+    fields = list(dict.fromkeys(field.strip() for field in fields_param.split(',') if field.strip()))
+    unknown_fields = [field for field in fields if field not in GALLERY_FIELDS]
+    if unknown_fields or not fields:
+        raise ValueError(f"Unbekannte Felder: {', '.join(unknown_fields)}" if unknown_fields else "Keine Felder angegeben")
+    attributes = [field for field in fields if field != 'display_url']
+    if 'display_url' in fields:
+        attributes += [field for field in DISPLAY_URL_SOURCE_FIELDS if field not in attributes]
+    # Platzhalter statt Attributnamen (reservierte Wörter); boto3 ergänzt eigene (#n0...) für den Filter
+    names = {f"#p{index}": attribute for index, attribute in enumerate(attributes)}
+    return fields, {'ProjectionExpression': ', '.join(names), 'ExpressionAttributeNames': names}
+
+
+def iter_gallery_pages(hashtag, limit, cursor=None, projection=None, page_size=None):
+    """
+    Liest die Galerie über den GSI (hashtag_source, download_timestamp_utc), neueste Bilder
+    zuerst, und liefert (items, last_evaluated_key) für jede DynamoDB-Antwort, bis `limit`
+    Items gelesen sind oder die Galerie endet. `projection` (siehe parse_gallery_fields)
+    beschränkt die gelesenen Attribute, `page_size` die Items je Query.
+    """
+    conditions = lazy_import('boto3.dynamodb.conditions') # Key/Attr für DynamoDB-Ausdrücke
+    query_kwargs = {
+        'IndexName': GALLERY_INDEX_NAME,
+        'KeyConditionExpression': conditions.Key('hashtag_source').eq(hashtag),
+        'FilterExpression': conditions.Attr('platform').eq('instagram'),
+        'ScanIndexForward': False,
+    }
+    if projection:
+        query_kwargs['ProjectionExpression'] = projection['ProjectionExpression']
+        query_kwargs['ExpressionAttributeNames'] = dict(projection['ExpressionAttributeNames'])
+    if cursor:
+        query_kwargs['ExclusiveStartKey'] = decode_gallery_cursor(cursor, hashtag)
+
+    items_read = 0
+    while items_read < limit:
+        # Limit greift vor dem FilterExpression; daher ggf. mehrfach nachladen
+        response = get_crawled_media_table().query(Limit=min(limit - items_read, page_size or limit), **query_kwargs)
+        items = response.get('Items', [])
+        items_read += len(items)
+        last_evaluated_key = response.get('LastEvaluatedKey')
+        yield items, last_evaluated_key
+        if not last_evaluated_key:
+            break
+        query_kwargs['ExclusiveStartKey'] = last_evaluated_key
+
+
+def query_gallery_page(hashtag, limit, cursor=None, projection=None):
+    """
+    Liest eine Seite der Galerie (siehe iter_gallery_pages). Gibt (items, next_cursor)
+    zurück; next_cursor ist None am Ende. Gelesen wird nur ungefähr `limit` Items,
+    unabhängig von der Tabellengröße.
+    """
+    items = []
+    last_evaluated_key = None
+    for page_items, last_evaluated_key in iter_gallery_pages(hashtag, limit, cursor, projection):
+        items.extend(page_items)
+    return items, (encode_gallery_cursor(last_evaluated_key) if last_evaluated_key else None)
+
+
+def build_display_item(item_data, requested_size='original', requested_format='jpeg'):
+    """
+    Kopie eines DynamoDB-Items mit 'display_url' (Presigned URL bzw. /media/-URL der
+    lokalen Ablage) und 'error_generating_url'.
+    """
+    item_data_copy = item_data.copy()
+    item_data_copy['display_url'] = '#' # Fallback
+    item_data_copy['error_generating_url'] = True
+    storage = get_storage_app()
+    if not storage:
+        return item_data_copy
+    if item_data.get('storage', 's3') != storage.name:
+        app.logger.warning(f"API Galerie: Element {item_data.get('media_id')} liegt in '{item_data.get('storage', 's3')}', konfiguriert ist '{storage.name}'.")
+        return item_data_copy
+
+    bucket_to_use = item_data.get('s3_bucket', S3_BUCKET_NAME) if storage.name == 's3' else None
+    s3_key_to_use = select_display_key(item_data, requested_size, requested_format)
+    if s3_key_to_use and (bucket_to_use or storage.name != 's3'):
+        try:
+            item_data_copy['display_url'] = storage.url_for(s3_key_to_use, bucket_to_use)
+            item_data_copy['error_generating_url'] = False
+        except ClientError as e:
+            app.logger.error(f"API Galerie: ClientError Presigned URL für S3 Key '{s3_key_to_use}': {e}")
+        except Exception as e_general:
+            app.logger.error(f"API Galerie: Allgemeiner Fehler Presigned URL für S3 Key '{s3_key_to_use}': {e_general}")
+    else:
+        app.logger.warning(f"API Galerie: Fehlende 's3_key' oder 's3_bucket' für Element: {item_data_copy.get('media_id')}")
+    return item_data_copy
+
+
+def shape_gallery_item(item_data, fields, requested_size='original', requested_format='jpeg'):
+    """Element für die Galerie-Antwort: ohne `fields` wie build_display_item, sonst nur die angeforderten Felder."""
+    if fields is None:
+        return build_display_item(item_data, requested_size, requested_format)
+    output_fields = list(fields)
+    if 'display_url' in fields:
+        item_data = build_display_item(item_data, requested_size, requested_format)
+        output_fields.append('error_generating_url')
+    return {field: item_data[field] for field in output_fields if field in item_data}
+
+
+def _stream_gallery_ndjson(hashtag, limit, cursor, projection, fields, requested_size, requested_format):
+    """
+    NDJSON-Zeilen der Galerie: ein Element pro Zeile, geschrieben sobald die jeweilige
+    DynamoDB-Seite da ist. Die letzte Zeile enthält 'image_count' und 'next_cursor'
+    (bzw. 'error', wenn das Lesen unterwegs fehlschlug; der Status ist dann schon gesendet).
+    """
+    image_count = 0
+    last_evaluated_key = None
+    try:
+        for items, last_evaluated_key in iter_gallery_pages(hashtag, limit, cursor, projection, GALLERY_STREAM_PAGE_SIZE):
+            lines = [app.json.dumps(shape_gallery_item(item_data, fields, requested_size, requested_format)) for item_data in items]
+            image_count += len(lines)
+            if lines:
+                yield '\n'.join(lines) + '\n'
+        next_cursor = encode_gallery_cursor(last_evaluated_key) if last_evaluated_key else None
+        yield app.json.dumps({"image_count": image_count, "next_cursor": next_cursor}) + '\n'
+    except Exception as e:
+        app.logger.error(f"API Galerie: Fehler im NDJSON-Stream für Hashtag '{hashtag}' nach {image_count} Elementen: {e}", exc_info=True)
+        yield app.json.dumps({"image_count": image_count, "error": "Fehler beim Lesen der Galerie"}) + '\n'
+
+
+def _gallery_response(body, etag, status=200, mimetype='application/json'):
+    response = app.response_class(body, status=status, mimetype=mimetype)
+    response.set_etag(etag)
+    # Browser sollen jedes Mal revalidieren; dank ETag meist nur ein 304 ohne Body
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @app.route("/api/gallery/<string:hashtag_name>")
 def api_get_gallery_for_hashtag(hashtag_name):
     """
-    API-Endpunkt, um alle gespeicherten Bilder für einen Hashtag aus DynamoDB abzurufen.
+    API-Endpunkt, um die gespeicherten Bilder für einen Hashtag seitenweise aus DynamoDB abzurufen,
+    neueste zuerst. Query-Parameter:
+    - `limit`: Bilder pro Seite (Standard GALLERY_DEFAULT_PAGE_SIZE, max. GALLERY_MAX_PAGE_SIZE),
+    - `cursor`: `next_cursor` der vorherigen Antwort für die nächste Seite,
+    - `size` (z.B. 256, 1024 oder 'original') und `format` ('jpeg'/'webp') wählen das
+      ausgelieferte Derivat; fehlt es, wird auf das Original zurückgegriffen,
+    - `fields` (z.B. media_id,caption,display_url): nur diese Attribute lesen (DynamoDB-Projektion)
+      und ausliefern; erlaubt sind die Felder aus GALLERY_FIELDS,
+    - `output=ndjson` (oder `Accept: application/x-ndjson`): Elemente als NDJSON streamen, sobald
+      die jeweilige DynamoDB-Seite gelesen ist; `limit` bis GALLERY_STREAM_MAX_ITEMS (Standard).
+    Antworten tragen einen ETag; bei passendem `If-None-Match` folgt 304.
     """
     app.logger.info(f"API-Anfrage für Galerie des Hashtags: '{hashtag_name}'")
-    processed_gallery_images = []
+    # Optional: ?size=256&format=webp liefert URLs auf ein Derivat statt auf das Original
+    requested_size = request.args.get('size', 'original')
+    requested_format = request.args.get('format', 'jpeg').lower()
+    cursor = request.args.get('cursor') or None
+    stream_ndjson = (request.args.get('output') == 'ndjson'
+                     or request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson')
+    default_limit, max_limit = (GALLERY_STREAM_MAX_ITEMS, GALLERY_STREAM_MAX_ITEMS) if stream_ndjson else (GALLERY_DEFAULT_PAGE_SIZE, GALLERY_MAX_PAGE_SIZE)
+    try:
+        limit = min(max(int(request.args.get('limit', default_limit)), 1), max_limit)
+    except ValueError:
+        return jsonify({"error": "Ungültiger Wert für 'limit'"}), 400
+    try:
+        fields, projection = parse_gallery_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": f"Ungültiger Wert für 'fields': {e}", "allowed_fields": list(GALLERY_FIELDS)}), 400
 
     if not hashtag_name:
         return jsonify({"error": "Hashtag Name ist erforderlich"}), 400
 
-    if not crawled_media_table:
+    if not get_crawled_media_table():
         app.logger.error("DynamoDB 'CrawledMedia' Tabelle nicht initialisiert (Import aus Crawler fehlgeschlagen?). API-Aufruf nicht möglich.")
         return jsonify({"error": "Server-Konfigurationsfehler: DynamoDB-Tabelle nicht verfügbar"}), 500
 
+    if not get_storage_app():
+        app.logger.error("API Galerie: Storage (S3 Client) nicht initialisiert. Bild-URLs können nicht generiert werden.")
+
+    clean_hashtag = hashtag_name.lstrip('#')
+    cache_variant = f"{requested_size}|{requested_format}|{limit}|{cursor or ''}|{','.join(fields or ['*'])}|{'ndjson' if stream_ndjson else 'json'}"
+
     try:
-        # DynamoDB Scan Operation, um alle Items für den Hashtag zu finden
-        # Beachten Sie: Ein Scan kann bei sehr großen Tabellen ineffizient sein.
-        # Für Produktionsumgebungen mit vielen Daten wäre ein Global Secondary Index (GSI)
-        # auf 'hashtag_source' und eine Query-Operation performanter.
-        response = crawled_media_table.scan(
-            FilterExpression=Attr('hashtag_source').eq(hashtag_name.lstrip('#')) & Attr('platform').eq('instagram')
-        )
-        items_from_db = response.get('Items', [])
-        
-        # Paginierung für Scan (falls die Tabelle sehr groß ist)
-        while 'LastEvaluatedKey' in response:
-            app.logger.info(f"Paginiere DynamoDB Scan für Hashtag '{hashtag_name}'...")
-            response = crawled_media_table.scan(
-                FilterExpression=Attr('hashtag_source').eq(hashtag_name.lstrip('#')) & Attr('platform').eq('instagram'),
-                ExclusiveStartKey=response['LastEvaluatedKey']
+        # Bedingte Anfrage: unveränderte Galerie ohne DynamoDB-Zugriff mit 304 beantworten
+        gallery_version = gallery_response_cache.current_version(clean_hashtag)
+        etag = gallery_response_cache.etag(clean_hashtag, cache_variant, gallery_version)
+        if request.if_none_match.contains(etag):
+            gallery_response_cache.record_not_modified()
+            return _gallery_response(None, etag, 304)
+
+        if stream_ndjson:
+            # Nicht im Antwort-Cache: der Body wird nie vollständig im Speicher gehalten
+            if cursor:
+                decode_gallery_cursor(cursor, clean_hashtag) # Ungültiger Cursor -> 400 vor dem ersten Byte
+            return _gallery_response(
+                stream_with_context(_stream_gallery_ndjson(clean_hashtag, limit, cursor, projection, fields, requested_size, requested_format)),
+                etag, mimetype='application/x-ndjson'
             )
-            items_from_db.extend(response.get('Items', []))
-
-        app.logger.info(f"DynamoDB Scan für Hashtag '{hashtag_name}' lieferte {len(items_from_db)} Elemente.")
-
-        if s3_client_app and items_from_db:
-            for item_data in items_from_db:
-                item_data_copy = item_data.copy()
-                bucket_to_use = item_data.get('s3_bucket', S3_BUCKET_NAME)
-                s3_key_to_use = item_data.get('s3_key')
-
-                if s3_key_to_use and bucket_to_use:
-                    try:
-                        presigned_url = s3_client_app.generate_presigned_url(
-                            'get_object',
-                            Params={'Bucket': bucket_to_use, 'Key': s3_key_to_use},
-                            ExpiresIn=3600  # 1 Stunde Gültigkeit
-                        )
-                        item_data_copy['display_url'] = presigned_url
-                        item_data_copy['error_generating_url'] = False
-                    except ClientError as e:
-                        app.logger.error(f"API Galerie: ClientError Presigned URL für S3 Key '{s3_key_to_use}': {e}")
-                        item_data_copy['display_url'] = '#' # Fallback
-                        item_data_copy['error_generating_url'] = True
-                    except Exception as e_general:
-                        app.logger.error(f"API Galerie: Allgemeiner Fehler Presigned URL für S3 Key '{s3_key_to_use}': {e_general}")
-                        item_data_copy['display_url'] = '#' # Fallback
-                        item_data_copy['error_generating_url'] = True
-                else:
-                    app.logger.warning(f"API Galerie: Fehlende 's3_key' oder 's3_bucket' für Element: {item_data_copy.get('media_id')}")
-                    item_data_copy['display_url'] = '#' # Fallback
-                    item_data_copy['error_generating_url'] = True
-                
-                processed_gallery_images.append(item_data_copy)
-        
-        elif not s3_client_app and items_from_db:
-            app.logger.error("API Galerie: S3 Client nicht initialisiert. Presigned URLs können nicht generiert werden.")
-            # Füge Items ohne display_url hinzu, damit das Frontend zumindest die Metadaten hat
-            for item_data in items_from_db:
-                item_data_copy = item_data.copy()
-                item_data_copy['display_url'] = '#'
-                item_data_copy['error_generating_url'] = True
-                processed_gallery_images.append(item_data_copy)
-
-
-        # Sortiere Bilder, z.B. nach Download-Timestamp (optional, falls das Feld existiert und relevant ist)
-        # processed_gallery_images.sort(key=lambda x: x.get('download_timestamp_utc', ''), reverse=True)
-
-        return jsonify({
+
+        cached_body = gallery_response_cache.get(clean_hashtag, cache_variant, etag)
+        if cached_body is not None:
+            return _gallery_response(cached_body, etag)
+
+        items_from_db, next_cursor = query_gallery_page(clean_hashtag, limit, cursor, projection)
+        app.logger.info(f"DynamoDB Query für Hashtag '{hashtag_name}' lieferte {len(items_from_db)} Elemente (weitere Seite: {bool(next_cursor)}).")
+
+        # Items ohne display_url behalten, damit das Frontend zumindest die Metadaten hat
+        processed_gallery_images = [shape_gallery_item(item_data, fields, requested_size, requested_format) for item_data in items_from_db]
+
+        body = app.json.dumps({
             "hashtag": hashtag_name,
             "image_count": len(processed_gallery_images),
-            "images": processed_gallery_images
-        }), 200
-
+            "images": processed_gallery_images,
+            "next_cursor": next_cursor
+        })
+        gallery_response_cache.put(clean_hashtag, cache_variant, etag, body)
+        return _gallery_response(body, etag)
+
+    except ValueError as e:
+        app.logger.warning(f"API Galerie: Ungültiger Cursor für Hashtag '{hashtag_name}': {e}")
+        return jsonify({"error": "Ungültiger Cursor"}), 400
     except ClientError as e:
         app.logger.error(f"API Galerie: DynamoDB ClientError für Hashtag '{hashtag_name}': {e}")
         return jsonify({"error": "Fehler beim Zugriff auf die Datenbank"}), 500
@@ -229,6 +536,155 @@ def api_get_gallery_for_hashtag(hashtag_name):
         return jsonify({"error": "Ein unerwarteter interner Fehler ist aufgetreten"}), 500
 
 
+@app.route("/api/jobs", methods=["POST"])
+def api_create_job():
+    """
+    Startet einen Suchauftrag und antwortet sofort mit 202 und der Job-ID.
+    Erwartet `hashtag` als JSON-Feld oder Formularfeld. Läuft für den Hashtag bereits ein
+    Crawl (oder endete er gerade), wird kein neuer gestartet, sondern dieser Job verwendet.
+    """
+    payload = request.get_json(silent=True) or request.form
+    hashtag_query = (payload.get("hashtag") or "").strip()
+    if not hashtag_query.lstrip('#'):
+        return jsonify({"error": "Hashtag ist erforderlich"}), 400
+
+    job, outcome, error_message = submit_crawl_job(hashtag_query)
+    if not job:
+        return jsonify({"error": error_message}), 503
+    response = jsonify({
+        "job_id": job.job_id,
+        "outcome": outcome, # 'started', 'joined' oder 'following' (zusammengefasst, kein neuer Crawl)
+        "status_url": url_for('api_get_job', job_id=job.job_id),
+        "events_url": url_for('api_stream_job_events', job_id=job.job_id)
+    })
+    response.status_code = 202
+    response.headers['Location'] = url_for('api_get_job', job_id=job.job_id)
+    return response
+
+
+@app.route("/api/jobs")
+def api_get_job_stats():
+    """Anzahl der Jobs dieses Prozesses und eingesparte (zusammengefasste) Crawls."""
+    return jsonify(dict(crawl_jobs.stats(), **crawl_coalescer.stats())), 200
+
+
+@app.route("/api/jobs/<string:job_id>")
+def api_get_job(job_id):
+    """Status eines Suchauftrags (nur für Jobs dieses Prozesses)."""
+    job = crawl_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job nicht gefunden"}), 404
+    return jsonify(job.snapshot()), 200
+
+
+def _format_sse(event_id, event_type, data):
+    return f"id: {event_id}\nevent: {event_type}\ndata: {app.json.dumps(data)}\n\n"
+
+
+@app.route("/api/jobs/<string:job_id>/events")
+def api_stream_job_events(job_id):
+    """
+    Server-Sent Events eines Suchauftrags: `image` für jedes gespeicherte Bild (mit
+    'display_url' des 256px-Derivats), `status` bei Statuswechseln, `done` zum Schluss.
+    Bei Wiederverbindung setzt `Last-Event-ID` den Stream nahtlos fort.
+    """
+    job = crawl_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job nicht gefunden"}), 404
+    try:
+        start_index = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        start_index = 0
+    requested_size = request.args.get('size', '256')
+    requested_format = request.args.get('format', 'webp').lower()
+
+    def generate():
+        index = start_index
+        yield f"retry: {JOB_SSE_RETRY_MS}\n\n"
+        while True:
+            events, finished = job.wait_for_events(index, JOB_SSE_KEEPALIVE_SECONDS)
+            for event_type, data in events:
+                if event_type == 'image':
+                    data = build_display_item(data, requested_size, requested_format)
+                yield _format_sse(index, event_type, data)
+                index += 1
+            if finished and not events:
+                yield _format_sse(index, 'done', job.snapshot())
+                return
+            if not events:
+                yield ": keepalive\n\n" # Hält Proxys und Load Balancer offen
+
+    response = app.response_class(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # nginx soll den Stream nicht puffern
+    return response
+
+
+@app.route("/api/ratelimit")
+def api_get_rate_limit_status():
+    """
+    Aktueller Zustand des Graph-API-Governors dieses Prozesses (Nutzung, Spielraum, Drosselung).
+    """
+    return jsonify(graph_governor.snapshot()), 200
+
+
+@app.route("/api/startup")
+def api_get_startup_timing():
+    """
+    Dauer der bisherigen Importe und Initialisierungen dieses Workers (teuerste zuerst),
+    um Kaltstartkosten einzelner Komponenten zu messen.
+    """
+    return jsonify(startup_timing.report()), 200
+
+
+@app.route("/media/<path:key>")
+def serve_media(key):
+    """
+    Liefert Bilder der lokalen Ablage (storage_backend 'local') aus. Der Inhalt hinter
+    einem Key ändert sich nicht, daher langes Caching mit dem SHA-256 als ETag; die
+    Datei wird per send_file (sendfile bzw. X-Sendfile) ohne Kopie in Python übertragen.
+    """
+    storage = get_storage_app()
+    if not storage or storage.name != 'local':
+        abort(404)
+    try:
+        object_path, ref = storage.resolve(key)
+    except ValueError:
+        abort(404)
+    if not object_path:
+        abort(404)
+    response = send_file(
+        object_path,
+        mimetype=ref.get('content_type', 'application/octet-stream'),
+        conditional=True, # If-None-Match/Range -> 304/206
+        etag=ref['sha256']
+    )
+    response.headers['Cache-Control'] = ref.get('cache_control', IMMUTABLE_CACHE_CONTROL)
+    return response
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """
+    Prometheus-Endpunkt (nur mit metrics_enabled): Stufen-Histogramme, Byte-/Element-Zähler
+    und Fehler nach Typ für Crawls, die in diesem Worker-Prozess liefen (crawl_job_mode 'local').
+    """
+    if not metrics.enabled:
+        abort(404)
+    return app.response_class(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route("/api/cache/stats")
+def api_get_cache_stats():
+    """
+    Treffer-/Fehlzugriffs-Zähler der In-Process-Caches dieses Workers (zum Dimensionieren).
+    """
+    return jsonify({
+        "presigned_urls": presigned_url_cache.stats(),
+        "gallery_responses": gallery_response_cache.stats()
+    }), 200
+
+
 # Der bestehende /api/images Endpunkt kann beibehalten, angepasst oder entfernt werden,
 # je nachdem, ob er noch anderweitig genutzt wird.
 # Für die Webseitenanzeige wird nun /api/gallery/<hashtag> primär verwendet.
@@ -263,6 +719,7 @@ def get_images_api():
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
     # ... (Ihre bestehenden Logging-Konfigurationen beim Start) ...
+    crawled_media_table = get_crawled_media_table()
     if not crawled_media_table:
         app.logger.error("FATAL: DynamoDB 'CrawledMedia' Tabelle konnte nicht aus crawler.py importiert oder initialisiert werden.")
     else:
@@ -0,0 +1,26 @@
+# aws_clients.py
+# Verzögert erzeugte, prozessweit geteilte AWS-Clients. boto3 wird erst beim ersten
+# Zugriff importiert, jeder Client/jede Resource pro Region nur einmal gebaut.
+# So zahlen Lambda-Kaltstarts und Web-Worker nur für das, was sie wirklich nutzen.
+from lazy_init import memoized, lazy_import
+
+
+def get_client(service_name, region_name):
+    # boto3-Clients sind threadsicher und können geteilt werden
+    return memoized(f"aws:{service_name}:{region_name}", lambda: lazy_import('boto3').client(service_name, region_name=region_name))
+
+
+def get_s3_client(region_name):
+    return get_client('s3', region_name)
+
+
+def get_sqs_client(region_name):
+    return get_client('sqs', region_name)
+
+
+def get_dynamodb_resource(region_name):
+    return memoized(f"aws:dynamodb-resource:{region_name}", lambda: lazy_import('boto3').resource('dynamodb', region_name=region_name))
+
+
+def get_table(table_name, region_name):
+    return memoized(f"aws:dynamodb-table:{region_name}:{table_name}", lambda: get_dynamodb_resource(region_name).Table(table_name))
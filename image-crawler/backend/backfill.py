@@ -0,0 +1,320 @@
+# backfill.py
+# Massen-Backfill für lange Listen von Hashtags und Business-Konten direkt auf einer
+# Maschine (z.B. EC2), ohne den Umweg über SQS/Lambda. Die Ziele werden mit
+# einstellbarer Parallelität über search_media_by_hashtag bzw. process_media gecrawlt.
+# Der Fortschritt steht nach jedem Ziel atomar in einer JSON-Statusdatei; ein
+# abgebrochener Lauf setzt mit demselben Befehl dort fort, wo er aufgehört hat.
+#
+# Beispiele:
+#   python backfill.py --hashtags hashtags.txt --concurrency 8 --limit 500
+#   python backfill.py --accounts konten.txt --state konten_state.json
+#   python backfill.py --hashtags hashtags.txt --status      # nur Stand anzeigen
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from defines import getCreds
+
+creds = getCreds()
+BACKFILL_STATE_PATH = creds.get('backfill_state_path', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backfill_state.json'))
+BACKFILL_CONCURRENCY = int(creds.get('backfill_concurrency', 4)) # Gleichzeitig gecrawlte Ziele
+BACKFILL_LIMIT = int(creds.get('backfill_limit', 500)) # Max. Medien je Ziel
+BACKFILL_MAX_ATTEMPTS = int(creds.get('backfill_max_attempts', 3)) # Danach gilt ein Ziel als endgültig fehlgeschlagen
+BACKFILL_PROGRESS_SECONDS = float(creds.get('backfill_progress_seconds', 10))
+
+# Zustände eines Ziels in der Statusdatei; 'deferred' = Hashtag-Kontingent erschöpft, später erneut
+DONE, FAILED, DEFERRED = 'done', 'failed', 'deferred'
+
+
+def read_targets(path, kind):
+    """Liest eine Datei mit einem Hashtag bzw. einer Konto-ID pro Zeile (leere Zeilen werden übersprungen)."""
+    targets = []
+    with open(path, encoding='utf-8') as target_file:
+        for line in target_file:
+            value = line.strip()
+            if kind == 'hashtag':
+                value = value.lstrip('#').lower()
+            if value:
+                targets.append(f"{kind}:{value}")
+    return list(dict.fromkeys(targets)) # Duplikate entfernen, Reihenfolge behalten
+
+
+class BackfillState:
+    """Status je Ziel ('hashtag:<name>' / 'user:<id>') als JSON in `path`, nach jeder Änderung atomar gespeichert."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.targets = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as state_file:
+                return json.load(state_file).get('targets', {})
+        except FileNotFoundError:
+            return {}
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({'saved_at': time.time(), 'targets': self.targets}, indent=2, sort_keys=True)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.backfill-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, self.path) # Atomar: ein Abbruch hinterlässt nie eine halbe Datei
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def is_pending(self, target, max_attempts):
+        entry = self.targets.get(target)
+        if not entry:
+            return True
+        if entry['status'] == FAILED:
+            return entry.get('attempts', 0) < max_attempts
+        return entry['status'] == DEFERRED
+
+    def record(self, target, status, new_images=0, seconds=0.0, error=None):
+        with self._lock:
+            entry = self.targets.setdefault(target, {'attempts': 0, 'new_images': 0})
+            entry['status'] = status
+            entry['finished_at'] = time.time()
+            entry['seconds'] = round(seconds, 1)
+            if status != DEFERRED:
+                entry['attempts'] += 1
+            entry['new_images'] += new_images
+            if error:
+                entry['error'] = error
+            else:
+                entry.pop('error', None)
+        self.save()
+
+    def counts(self, targets):
+        counts = {DONE: 0, FAILED: 0, DEFERRED: 0, 'pending': 0, 'new_images': 0}
+        with self._lock:
+            for target in targets:
+                entry = self.targets.get(target)
+                counts[entry['status'] if entry else 'pending'] += 1
+                counts['new_images'] += entry['new_images'] if entry else 0
+        return counts
+
+
+class ProgressReporter:
+    """Schreibt alle `interval` Sekunden eine Zeile mit Fortschritt, Durchsatz und ETA."""
+
+    def __init__(self, total, interval, out=sys.stderr):
+        self.total = total
+        self.interval = interval
+        self.out = out
+        self.started = time.monotonic()
+        self.completed = 0
+        self.new_images = 0
+        self.failed = 0
+        self.deferred = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def update(self, status, new_images):
+        with self._lock:
+            self.completed += 1
+            self.new_images += new_images
+            self.failed += status == FAILED
+            self.deferred += status == DEFERRED
+
+    def line(self):
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started, 1e-6)
+            targets_per_minute = self.completed / elapsed * 60
+            remaining = self.total - self.completed
+            eta = format_duration(remaining / (self.completed / elapsed)) if self.completed else '?'
+            return (f"{self.completed}/{self.total} Ziele ({self.completed / max(self.total, 1):.0%}), "
+                    f"{self.new_images} neue Bilder, {targets_per_minute:.1f} Ziele/min, {self.new_images / elapsed:.1f} Bilder/s, "
+                    f"{self.failed} fehlgeschlagen, {self.deferred} zurückgestellt, ETA {eta}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            print(self.line(), file=self.out, flush=True)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='backfill-progress', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        print(self.line(), file=self.out, flush=True)
+
+
+def format_duration(seconds):
+    if not math.isfinite(seconds):
+        return '?'
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class Backfill:
+    """
+    Crawlt alle noch offenen Ziele mit `concurrency` parallelen Crawls. `crawl_hashtag(name)`
+    und `crawl_account(id)` geben die Anzahl neuer Bilder zurück und werfen bei einem
+    unvollständigen Crawl (crawler.CrawlFailed, neue Bilder in `stats['stored_items']`).
+    Hashtags ohne gecachte ID werden bei erschöpftem Kontingent (`quota_remaining()`)
+    zurückgestellt statt gecrawlt und beim nächsten Lauf erneut versucht.
+    """
+
+    def __init__(self, state, crawl_hashtag, crawl_account, quota_remaining, is_resolved,
+                 concurrency=4, max_attempts=3, progress_seconds=10.0, out=sys.stderr):
+        self.state = state
+        self.crawl_hashtag = crawl_hashtag
+        self.crawl_account = crawl_account
+        self.quota_remaining = quota_remaining
+        self.is_resolved = is_resolved
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max_attempts
+        self.progress_seconds = progress_seconds
+        self.out = out
+
+    def _run_target(self, target):
+        kind, value = target.split(':', 1)
+        started = time.monotonic()
+        try:
+            if kind == 'hashtag':
+                if not self.is_resolved(value) and self.quota_remaining() <= 0:
+                    return target, DEFERRED, 0, 0.0, "Hashtag-Kontingent erschöpft"
+                new_images = self.crawl_hashtag(value)
+            else:
+                new_images = self.crawl_account(value)
+            return target, DONE, new_images, time.monotonic() - started, None
+        except Exception as e:
+            new_images = (getattr(e, 'stats', None) or {}).get('stored_items', 0)
+            if kind == 'hashtag' and not self.is_resolved(value):
+                # ID-Suche nicht möglich (Kontingent parallel aufgebraucht oder Fehler): später erneut
+                return target, DEFERRED, new_images, time.monotonic() - started, "Hashtag-ID nicht ermittelt"
+            logging.error(f"Backfill: Ziel '{target}' fehlgeschlagen: {e}", exc_info=not hasattr(e, 'stats'))
+            return target, FAILED, new_images, time.monotonic() - started, str(e)
+
+    def run(self, targets):
+        """Crawlt die offenen Ziele aus `targets`. Gibt die Zählung (siehe BackfillState.counts) zurück."""
+        pending = [target for target in targets if self.state.is_pending(target, self.max_attempts)]
+        print(f"Backfill: {len(pending)} von {len(targets)} Zielen offen, {self.concurrency} parallel, Status in {self.state.path}",
+              file=self.out, flush=True)
+        if not pending:
+            return self.state.counts(targets)
+
+        reporter = ProgressReporter(len(pending), self.progress_seconds, self.out)
+        reporter.start()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='backfill')
+        try:
+            futures = [executor.submit(self._run_target, target) for target in pending]
+            for future in as_completed(futures):
+                target, status, new_images, seconds, error = future.result()
+                self.state.record(target, status, new_images, seconds, error)
+                reporter.update(status, new_images)
+        except KeyboardInterrupt:
+            # Wartende Ziele verwerfen; laufende Crawls werden noch beendet, aber nicht mehr erfasst
+            print("\nAbbruch: laufende Crawls werden beendet. Fortsetzen mit demselben Befehl.", file=self.out, flush=True)
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            executor.shutdown(wait=False)
+            reporter.stop()
+        return self.state.counts(targets)
+
+
+def build_backfill(state, concurrency, limit, workers_per_target, time_budget_seconds, incremental, max_attempts, progress_seconds):
+    # Verdrahtung mit Crawler und Hashtag-Cache des laufenden Prozesses
+    from crawler import search_media_by_hashtag, process_media, get_hashtag_id_cache, CrawlFailed, crawl_failure_reason
+    access_token = creds.get('access_token')
+    business_id = creds.get('instagram_business_id')
+
+    def checked(target, images, crawl_stats):
+        # Unvollständige Crawls als FAILED erfassen, damit sie erneut versucht werden
+        failure_reason = crawl_failure_reason(crawl_stats)
+        if failure_reason:
+            raise CrawlFailed(f"Crawl von '{target}' unvollständig: {failure_reason}", crawl_stats)
+        return len(images)
+
+    def crawl_hashtag(hashtag):
+        crawl_stats = {}
+        images = search_media_by_hashtag(
+            access_token, business_id, hashtag,
+            limit_per_hashtag=limit, time_budget_seconds=time_budget_seconds,
+            max_workers=workers_per_target, incremental=incremental, stats=crawl_stats
+        )
+        return checked(hashtag, images, crawl_stats)
+
+    def crawl_account(account_id):
+        crawl_stats = {}
+        images = process_media(
+            access_token, account_id,
+            limit=limit, time_budget_seconds=time_budget_seconds,
+            max_workers=workers_per_target, incremental=incremental, stats=crawl_stats
+        )
+        return checked(account_id, images, crawl_stats)
+
+    return Backfill(
+        state,
+        crawl_hashtag=crawl_hashtag,
+        crawl_account=crawl_account,
+        quota_remaining=lambda: get_hashtag_id_cache().quota_remaining(),
+        is_resolved=lambda hashtag: get_hashtag_id_cache().is_resolved(hashtag),
+        concurrency=concurrency,
+        max_attempts=max_attempts,
+        progress_seconds=progress_seconds
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawlt lange Listen von Hashtags und Business-Konten mit Fortsetzung nach Abbruch.")
+    parser.add_argument('--hashtags', metavar='DATEI', help="Ein Hashtag pro Zeile")
+    parser.add_argument('--accounts', metavar='DATEI', help="Eine Instagram-Business-Konto-ID pro Zeile")
+    parser.add_argument('--state', default=BACKFILL_STATE_PATH, help="JSON-Statusdatei (Fortschritt je Ziel)")
+    parser.add_argument('--concurrency', type=int, default=BACKFILL_CONCURRENCY, help="Gleichzeitig gecrawlte Ziele")
+    parser.add_argument('--workers-per-target', type=int, default=None,
+                        help="Download-Worker je Ziel (Standard: crawler_max_workers / concurrency, mindestens 2)")
+    parser.add_argument('--limit', type=int, default=BACKFILL_LIMIT, help="Max. Medien je Ziel")
+    parser.add_argument('--time-budget-seconds', type=float, default=None, help="Max. Laufzeit je Ziel")
+    parser.add_argument('--incremental', action='store_true', help="An der High-Water-Mark früherer Crawls aufhören (Standard: volle Tiefe)")
+    parser.add_argument('--max-attempts', type=int, default=BACKFILL_MAX_ATTEMPTS, help="Versuche je Ziel über alle Läufe")
+    parser.add_argument('--progress-seconds', type=float, default=BACKFILL_PROGRESS_SECONDS, help="Abstand der Fortschrittszeilen")
+    parser.add_argument('--status', action='store_true', help="Nur den Stand aus der Statusdatei anzeigen")
+    parser.add_argument('--log-level', default='warning')
+    args = parser.parse_args(argv)
+    if not (args.hashtags or args.accounts):
+        parser.error("--hashtags und/oder --accounts angeben")
+
+    targets = []
+    if args.hashtags:
+        targets += read_targets(args.hashtags, 'hashtag')
+    if args.accounts:
+        targets += read_targets(args.accounts, 'user')
+    state = BackfillState(args.state)
+    if args.status:
+        print(json.dumps(state.counts(targets)))
+        return 0
+
+    from crawler import CRAWLER_MAX_WORKERS # Import setzt das Log-Level (logging.basicConfig)
+    logging.getLogger().setLevel(args.log_level.upper())
+    workers_per_target = args.workers_per_target or max(2, math.ceil(CRAWLER_MAX_WORKERS / max(1, args.concurrency)))
+    backfill = build_backfill(state, args.concurrency, args.limit, workers_per_target, args.time_budget_seconds,
+                              args.incremental, args.max_attempts, args.progress_seconds)
+    try:
+        counts = backfill.run(targets)
+    except KeyboardInterrupt:
+        return 130
+    print(f"Backfill beendet: {counts[DONE]} erledigt, {counts[FAILED]} fehlgeschlagen, {counts[DEFERRED]} zurückgestellt, "
+          f"{counts['pending']} offen, {counts['new_images']} neue Bilder insgesamt.")
+    return 0 if counts[FAILED] == 0 and counts[DEFERRED] == 0 else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
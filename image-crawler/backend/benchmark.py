@@ -0,0 +1,613 @@
+# benchmark.py
+# Offline-Benchmark der Crawl-Pipeline ohne Instagram und AWS. Ein Stub-Server (eigener
+# Prozess) simuliert die genutzten Graph-API-Endpunkte (ig_hashtag_search,
+# /{hashtag_id}/recent_media, /{user_id}/media) und das Bild-CDN mit einstellbarer Latenz,
+# Bildgröße und Fehlerrate. S3 und DynamoDB werden durch LocalStorage (storage.py) und
+# eine In-Memory-Tabelle ersetzt. Gemessen werden Bilder/s, p50/p95/p99 je Stufe und der
+# Spitzen-RSS; Ergebnisse lassen sich als Baseline speichern und später vergleichen.
+#
+# Beispiel:
+#   python benchmark.py --scenarios hashtag,user,lambda --latency-ms 80 --save-baseline baseline.json
+#   python benchmark.py --baseline baseline.json --tolerance 0.15
+#   python benchmark.py --scenarios hashtag --transcode-processes 0,1,2,4 --cdn-latency-ms 0 --image-ratio 1
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import random
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+BENCH_MEDIA_TABLE = 'bench-crawled-media'
+BENCH_TASKS_TABLE = 'bench-crawl-tasks'
+BENCH_USER_ID = '17841400000000000'
+BENCH_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S+0000'
+PERCENTILES = (50, 95, 99)
+
+
+# --- Stub-Server (Graph API + CDN) ---
+
+def _render_stub_jpeg(width, height, quality, seed):
+    # Rauschen komprimiert schlecht: ergibt realistische Dateigrößen für Fotos
+    from PIL import Image
+    rng = random.Random(seed)
+    noise = rng.randbytes(width * height * 3)
+    buffer = BytesIO()
+    Image.frombytes('RGB', (width, height), noise).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-Alive wie bei der echten API
+    config = None
+    jpeg = b''
+    base_time = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _sleep(self, latency_ms):
+        jitter_ms = self.config['jitter_ms']
+        delay_ms = latency_ms + (random.uniform(0, jitter_ms) if jitter_ms else 0)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data).encode('utf-8'), 'application/json')
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        segments = [segment for segment in parts.path.split('/') if segment]
+        is_cdn = bool(segments) and segments[0] == 'cdn'
+        self._sleep(self.config['cdn_latency_ms'] if is_cdn else self.config['latency_ms'])
+        if random.random() < self.config['error_rate']:
+            return self._send_json(500, {'error': {'message': 'Stub: simulierter Fehler', 'code': 2}})
+
+        if is_cdn and len(segments) == 2:
+            # Eindeutiger Nachspann nach dem JPEG-Ende: jedes Bild hat einen eigenen SHA-256
+            # (Videos bekommen dieselben Bytes, nur als video/mp4; sie werden ungeprüft durchgestreamt)
+            content_type = 'video/mp4' if segments[1].endswith('.mp4') else 'image/jpeg'
+            return self._send(200, self.jpeg + segments[1].encode('ascii'), content_type)
+        if segments == ['ig_hashtag_search']:
+            hashtag_id = str(17800000000000000 + zlib.crc32(params.get('q', '').lower().encode('utf-8')))
+            return self._send_json(200, {'data': [{'id': hashtag_id}]})
+        if len(segments) == 2 and segments[1] in ('recent_media', 'top_media', 'media'):
+            return self._send_json(200, self._media_page(segments[0], params))
+        return self._send_json(404, {'error': {'message': f'Stub: unbekannter Pfad {parts.path}', 'code': 100}})
+
+    def _media_page(self, list_id, params):
+        total = self.config['media_per_list']
+        offset = int(params.get('after', 0))
+        limit = max(1, min(int(params.get('limit', 25)), 50))
+        host = f"http://{self.headers.get('Host')}"
+        items = []
+        for index in range(offset, min(offset + limit, total)):
+            media_id = f"{list_id[-8:]}{index:08d}"
+            is_image = (index % 10) < self.config['image_ratio'] * 10 # gleichmäßig verteilt
+            items.append({
+                'id': media_id,
+                'caption': f"Benchmark {index}",
+                'media_type': 'IMAGE' if is_image else 'VIDEO',
+                'media_url': f"{host}/cdn/{media_id}.{'jpg' if is_image else 'mp4'}",
+                'permalink': f"{host}/p/{media_id}",
+                'timestamp': time.strftime(BENCH_TIMESTAMP_FORMAT, time.gmtime(self.base_time - index * 60)) # neueste zuerst
+            })
+        page = {'data': items}
+        next_offset = offset + limit
+        if next_offset < total:
+            next_params = dict(params, after=str(next_offset))
+            page['paging'] = {
+                'cursors': {'after': str(next_offset)},
+                'next': f"{host}/{list_id}/{urlsplit(self.path).path.rsplit('/', 1)[1]}?{urlencode(next_params)}"
+            }
+        return page
+
+
+def _serve_stub(config, ready_queue):
+    StubHandler.config = config
+    StubHandler.jpeg = _render_stub_jpeg(config['image_width'], config['image_height'], config['image_quality'], config['seed'])
+    StubHandler.base_time = int(time.time())
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    ready_queue.put((server.server_address[1], len(StubHandler.jpeg)))
+    server.serve_forever()
+
+
+@contextmanager
+def stub_server(config):
+    """Startet den Stub in einem eigenen Prozess (kein GIL-Wettbewerb, RSS nur vom Crawler)."""
+    ready_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve_stub, args=(config, ready_queue), daemon=True)
+    process.start()
+    try:
+        port, jpeg_bytes = ready_queue.get(timeout=60)
+        yield f"http://127.0.0.1:{port}", jpeg_bytes
+    finally:
+        process.terminate()
+        process.join(5)
+
+
+# --- Lokale Stand-ins für DynamoDB und S3 ---
+
+class InMemoryTable:
+    """
+    Minimaler Ersatz für eine boto3-Table: get_item, put_item, update_item (SET/ADD), scan.
+    ConditionExpressions werden nicht ausgewertet; jeder Lauf startet mit leeren Tabellen.
+    """
+
+    def __init__(self, name, key_names, latency_seconds=0.0):
+        self.name = name
+        self.key_names = key_names
+        self.latency_seconds = latency_seconds
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def _key(self, key):
+        return tuple(key[name] for name in self.key_names)
+
+    def _wait(self):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def get_item(self, Key, **kwargs):
+        self._wait()
+        with self._lock:
+            item = self._items.get(self._key(Key))
+            return {'Item': dict(item)} if item else {}
+
+    def put_item(self, Item, **kwargs):
+        self._wait()
+        with self._lock:
+            self._items[self._key(Item)] = dict(Item)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None, ExpressionAttributeNames=None, ReturnValues=None, **kwargs):
+        self._wait()
+        values = ExpressionAttributeValues or {}
+        names = ExpressionAttributeNames or {}
+        updated = {}
+        with self._lock:
+            item = self._items.setdefault(self._key(Key), dict(Key))
+            for action, body in re.findall(r'\b(SET|ADD)\b(.*?)(?=\bSET\b|\bADD\b|$)', UpdateExpression):
+                for assignment in filter(None, (part.strip() for part in body.split(','))):
+                    if action == 'SET':
+                        name, value = (token.strip() for token in assignment.split('=', 1))
+                        item[names.get(name, name)] = values[value]
+                    else:
+                        name, value = assignment.split()
+                        name = names.get(name, name)
+                        item[name] = Decimal(item.get(name, 0)) + Decimal(values[value])
+                    updated[names.get(name, name)] = item[names.get(name, name)]
+        return {'Attributes': updated} if ReturnValues else {}
+
+    def scan(self, **kwargs):
+        self._wait()
+        with self._lock:
+            return {'Items': [dict(item) for item in self._items.values()]}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def __bool__(self):
+        # Eine leere Tabelle ist trotzdem vorhanden (crawler prüft `if not get_crawled_media_table()`)
+        return True
+
+
+class InMemoryDynamo:
+    """Ersatz für die boto3-DynamoDB-Resource (Table, batch_get_item, batch_write_item)."""
+
+    def __init__(self, tables, timer, latency_seconds=0.0):
+        self.tables = {table.name: table for table in tables}
+        self.timer = timer
+        self.latency_seconds = latency_seconds
+
+    def Table(self, name):
+        return self.tables[name]
+
+    def batch_get_item(self, RequestItems):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        responses = {}
+        for table_name, request in RequestItems.items():
+            table = self.tables[table_name]
+            with table._lock:
+                found = [table._items[table._key(key)] for key in request['Keys'] if table._key(key) in table._items]
+            responses[table_name] = [{name: item[name] for name in table.key_names} for item in found]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def batch_write_item(self, RequestItems):
+        with self.timer.time('metadata_write'):
+            if self.latency_seconds:
+                time.sleep(self.latency_seconds)
+            for table_name, requests_for_table in RequestItems.items():
+                table = self.tables[table_name]
+                with table._lock:
+                    for write_request in requests_for_table:
+                        item = write_request['PutRequest']['Item']
+                        table._items[table._key(item)] = dict(item)
+        return {'UnprocessedItems': {}}
+
+
+class TimedStorage:
+    """Reicht alle Aufrufe an das eigentliche Storage weiter und misst put/put_stream/put_chunks."""
+
+    def __init__(self, storage, timer):
+        self._storage = storage
+        self._timer = timer
+        self.name = storage.name
+        self.bucket = storage.bucket
+
+    def put(self, key, data, content_type, cache_control=None):
+        with self._timer.time('storage_put'):
+            return self._storage.put(key, data, content_type, cache_control)
+
+    def put_stream(self, key, fileobj, content_type, cache_control=None):
+        with self._timer.time('storage_put'):
+            return self._storage.put_stream(key, fileobj, content_type, cache_control)
+
+    def put_chunks(self, key, chunks, content_type, part_size=None, cache_control=None):
+        with self._timer.time('storage_put'):
+            return self._storage.put_chunks(key, chunks, content_type, part_size, cache_control)
+
+    def __getattr__(self, attribute):
+        return getattr(self._storage, attribute)
+
+
+# --- Messung ---
+
+def percentile(sorted_values, pct):
+    # Nearest-Rank-Verfahren
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1)]
+
+
+def peak_rss_mb():
+    # ru_maxrss: Linux in KiB, macOS in Bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+class StageTimer:
+    """Sammelt Dauern (Sekunden) pro Stufe, threadsicher."""
+
+    def __init__(self):
+        self._durations = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def time(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._durations.setdefault(stage, []).append(elapsed)
+
+    def wrap(self, stage, func):
+        def timed_call(*args, **kwargs):
+            with self.time(stage):
+                return func(*args, **kwargs)
+        return timed_call
+
+    def summary(self, reset=False):
+        with self._lock:
+            durations = {stage: sorted(values) for stage, values in self._durations.items()}
+            if reset:
+                self._durations = {}
+        result = {}
+        for stage, values in sorted(durations.items()):
+            stage_summary = {'count': len(values), 'mean_ms': round(sum(values) / len(values) * 1000, 2)}
+            for pct in PERCENTILES:
+                stage_summary[f"p{pct}_ms"] = round(percentile(values, pct) * 1000, 2)
+            result[stage] = stage_summary
+        return result
+
+
+def install_local_backends(crawler, base_url, timer, storage_root, dynamo_latency_seconds, near_duplicates):
+    """
+    Leitet den Crawler auf Stub-Server und lokale Stand-ins um und instrumentiert die
+    Stufen. Gibt die CrawledMedia-Tabelle zurück (Anzahl gespeicherter Bilder).
+    """
+    from storage import LocalStorage
+    from image_index import ImageHashIndex
+    from hashtag_cache import HashtagIdCache
+
+    media_table = InMemoryTable(BENCH_MEDIA_TABLE, ('media_id',), dynamo_latency_seconds)
+    tasks_table = InMemoryTable(BENCH_TASKS_TABLE, ('search_term', 'platform'), dynamo_latency_seconds)
+    dynamo = InMemoryDynamo([media_table, tasks_table], timer, dynamo_latency_seconds)
+    storage = TimedStorage(LocalStorage(storage_root), timer)
+    # Ohne Beinahe-Duplikat-Erkennung: alle Stub-Bilder sehen gleich aus (gleicher dHash)
+    image_hash_index = ImageHashIndex(store=None, max_distance=crawler.IMAGE_PHASH_MAX_DISTANCE if near_duplicates else -1)
+    hashtag_id_cache = HashtagIdCache(quota_limit=10 ** 9)
+
+    crawler.API_BASE_URL = base_url + '/'
+    crawler.DYNAMODB_CRAWLEDMEDIA_TABLE_NAME = BENCH_MEDIA_TABLE
+    crawler.get_storage = lambda: storage
+    crawler.get_dynamodb_resource = lambda: dynamo
+    crawler.get_crawled_media_table = lambda: media_table
+    crawler.get_crawl_tasks_table = lambda: tasks_table
+    crawler._optional_table = lambda table_name: None
+    crawler._attach_governor_store = lambda: None
+    crawler.get_image_hash_index = lambda: image_hash_index
+    crawler.get_hashtag_id_cache = lambda: hashtag_id_cache
+    return media_table
+
+
+def instrument_crawler(crawler, timer):
+    # Einmalig pro Prozess: die Originalfunktionen werden mit Zeitmessung umhüllt
+    original_http_get = crawler.http_get
+
+    def timed_http_get(url, *args, **kwargs):
+        with timer.time('cdn_request' if '/cdn/' in url else 'graph_request'):
+            return original_http_get(url, *args, **kwargs)
+
+    crawler.http_get = timed_http_get
+    crawler.batch_get_existing_keys = timer.wrap('dedupe_lookup', crawler.batch_get_existing_keys)
+    crawler.process_image = timer.wrap('image_decode', crawler.process_image)
+    crawler.ingest_image_to_s3 = timer.wrap('image_ingest', crawler.ingest_image_to_s3)
+
+
+class BenchmarkContext:
+    # Lambda-Context mit fester Restlaufzeit
+    def __init__(self, remaining_seconds):
+        self._deadline = time.monotonic() + remaining_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int(max(0.0, self._deadline - time.monotonic()) * 1000)
+
+
+def run_scenario(name, args, crawler, base_url, run_index, timer, workers=None):
+    """
+    Führt ein Szenario einmal mit frischen Stand-ins aus. Gibt (bilder, sekunden) zurück;
+    wirft RuntimeError, wenn kein Bild gespeichert wurde (Messung wäre wertlos).
+    """
+    workers = workers or args.workers
+    storage_root = tempfile.mkdtemp(prefix=f"bench-{name}-")
+    try:
+        media_table = install_local_backends(crawler, base_url, timer, storage_root,
+                                             args.dynamo_latency_ms / 1000.0, args.near_duplicates)
+        crawl_stats = {}
+        started = time.perf_counter()
+        if name == 'hashtag':
+            crawler.search_media_by_hashtag(
+                'bench-token', BENCH_USER_ID, f"bench{run_index}",
+                limit_per_hashtag=args.limit, max_workers=workers, stats=crawl_stats
+            )
+        elif name == 'user':
+            crawler.process_media('bench-token', f"{BENCH_USER_ID[:-2]}{run_index:02d}", limit=args.limit, max_workers=workers, stats=crawl_stats)
+        elif name == 'lambda':
+            import lambda_crawler
+            lambda_crawler.LAMBDA_HASHTAG_LIMIT = args.limit
+            event = {'Records': [
+                {'messageId': f"bench-{run_index}-{index}", 'body': json.dumps({'hashtag': f"lambda{run_index}x{index}", 'platform': 'instagram'})}
+                for index in range(args.lambda_hashtags)
+            ]}
+            response = lambda_crawler.lambda_handler(event, BenchmarkContext(args.lambda_timeout_seconds))
+            if response.get('batchItemFailures'):
+                logging.warning(f"Benchmark lambda: {len(response['batchItemFailures'])} Nachrichten fehlgeschlagen.")
+        else:
+            raise ValueError(f"Unbekanntes Szenario: {name}")
+        seconds = time.perf_counter() - started
+        if not len(media_table):
+            reason = crawler.crawl_failure_reason(crawl_stats) or 'siehe Log'
+            raise RuntimeError(f"Benchmark {name}: Lauf {run_index} hat keine Bilder gespeichert ({reason}).")
+        return len(media_table), seconds
+    finally:
+        if not args.keep_files:
+            shutil.rmtree(storage_root, ignore_errors=True)
+
+
+def use_transcode_pool(crawler, processes, timer):
+    """Schaltet den Crawler auf einen Transkodier-Pool mit `processes` Prozessen (0 = im Thread)."""
+    from transcode import TranscodePool
+    pool = TranscodePool(processes) if processes > 0 else None
+    if pool:
+        pool.process = timer.wrap('image_decode', pool.process)
+    crawler.get_transcode_pool = lambda: pool
+    return pool
+
+
+def scaling_summary(results):
+    """Bilder/s je Prozessanzahl und Szenario, mit Speedup gegenüber der ersten Messung und Bilder/s je Prozess."""
+    scaling = {}
+    for key, scenario in results['scenarios'].items():
+        if scenario.get('transcode_processes') is None:
+            continue
+        name = key.split('@', 1)[0]
+        scaling.setdefault(name, []).append({'processes': scenario['transcode_processes'], 'images_per_sec': scenario['images_per_sec']})
+    for rows in scaling.values():
+        reference = rows[0]['images_per_sec']
+        for row in rows:
+            row['speedup'] = round(row['images_per_sec'] / reference, 2) if reference else 0.0
+            row['images_per_sec_per_process'] = round(row['images_per_sec'] / max(1, row['processes']), 2)
+    return scaling
+
+
+def run_benchmark(args):
+    stub_config = {
+        'latency_ms': args.latency_ms,
+        'cdn_latency_ms': args.cdn_latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'error_rate': args.error_rate,
+        'media_per_list': args.media_per_list,
+        'image_ratio': args.image_ratio,
+        'image_width': args.image_width,
+        'image_height': args.image_height,
+        'image_quality': args.image_quality,
+        'seed': args.seed,
+    }
+    import startup_timing
+    from transcode import available_cores
+    with startup_timing.timed('import:crawler'):
+        import crawler
+    if 'lambda' in args.scenarios:
+        import lambda_crawler # noqa: F401 (Import vor der Messung, setzt sonst das Log-Level zurück)
+    logging.getLogger().setLevel(args.log_level.upper())
+    if args.workers is None:
+        args.workers = crawler.CRAWLER_MAX_WORKERS
+    # Ohne --transcode-processes: Pool wie konfiguriert (crawler_transcode_processes)
+    process_counts = args.transcode_processes or [None]
+
+    timer = StageTimer()
+    instrument_crawler(crawler, timer)
+    results = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'config': dict(stub_config, limit=args.limit, workers=args.workers, runs=args.runs,
+                       dynamo_latency_ms=args.dynamo_latency_ms, lambda_hashtags=args.lambda_hashtags,
+                       transcode_processes=crawler.CRAWLER_TRANSCODE_PROCESSES, cores=available_cores()),
+        'startup': startup_timing.report()['components'][:5],
+        'scenarios': {},
+    }
+    with stub_server(stub_config) as (base_url, jpeg_bytes):
+        results['config']['image_bytes'] = jpeg_bytes
+        for processes in process_counts:
+            pool = use_transcode_pool(crawler, processes, timer) if processes is not None else None
+            # Genug I/O-Worker, damit jeder Transkodier-Prozess Arbeit bekommt
+            workers = max(args.workers, (processes or 0) * 2)
+            try:
+                for name in args.scenarios:
+                    timer.summary(reset=True) # Messwerte vorheriger Szenarien verwerfen
+                    images = 0
+                    seconds = 0.0
+                    for run_index in range(args.runs):
+                        run_images, run_seconds = run_scenario(name, args, crawler, base_url, run_index, timer, workers)
+                        images += run_images
+                        seconds += run_seconds
+                    key = name if processes is None else f"{name}@p{processes}"
+                    results['scenarios'][key] = {
+                        'images': images,
+                        'seconds': round(seconds, 3),
+                        'images_per_sec': round(images / seconds, 2) if seconds else 0.0,
+                        'peak_rss_mb': peak_rss_mb(), # Spitzenwert des Prozesses bis einschließlich dieses Szenarios (ohne Worker-Prozesse)
+                        'transcode_processes': processes,
+                        'workers': workers,
+                        'stages': timer.summary(reset=True),
+                    }
+            finally:
+                if pool:
+                    pool.close()
+    results['scaling'] = scaling_summary(results)
+    return results
+
+
+# --- Baselines ---
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Vergleicht mit einer gespeicherten Baseline. Regression: Bilder/s sinkt oder p95 einer
+    Stufe bzw. Spitzen-RSS steigt um mehr als `tolerance` (relativ). Gibt eine Liste von Meldungen zurück.
+    """
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        if previous['images_per_sec'] and current['images_per_sec'] < previous['images_per_sec'] * (1 - tolerance):
+            regressions.append(f"{name}: Bilder/s {previous['images_per_sec']} -> {current['images_per_sec']}")
+        if previous.get('peak_rss_mb') and current['peak_rss_mb'] > previous['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{name}: Spitzen-RSS {previous['peak_rss_mb']} MB -> {current['peak_rss_mb']} MB")
+        for stage, stage_summary in current['stages'].items():
+            previous_stage = previous.get('stages', {}).get(stage)
+            if previous_stage and previous_stage['p95_ms'] and stage_summary['p95_ms'] > previous_stage['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{name}/{stage}: p95 {previous_stage['p95_ms']} ms -> {stage_summary['p95_ms']} ms")
+    return regressions
+
+
+def print_report(results):
+    config = results['config']
+    print(f"Stub: Graph {config['latency_ms']} ms, CDN {config['cdn_latency_ms']} ms (+{config['jitter_ms']} ms Jitter), "
+          f"Fehlerrate {config['error_rate']:.1%}, Bild {config['image_width']}x{config['image_height']} ({config['image_bytes']} Bytes), "
+          f"Worker {config['workers']}, Läufe {config['runs']}")
+    for name, scenario in results['scenarios'].items():
+        print(f"\n[{name}] {scenario['images']} Bilder in {scenario['seconds']} s = {scenario['images_per_sec']} Bilder/s, Spitzen-RSS {scenario['peak_rss_mb']} MB")
+        print(f"  {'Stufe':<16}{'Anzahl':>8}{'Mittel':>10}" + ''.join(f"{'p' + str(pct):>10}" for pct in PERCENTILES) + "  (ms)")
+        for stage, stage_summary in scenario['stages'].items():
+            print(f"  {stage:<16}{stage_summary['count']:>8}{stage_summary['mean_ms']:>10}"
+                  + ''.join(f"{stage_summary[f'p{pct}_ms']:>10}" for pct in PERCENTILES))
+    for name, rows in results.get('scaling', {}).items():
+        print(f"\nSkalierung [{name}] ({config['cores']} Kerne verfügbar)")
+        print(f"  {'Prozesse':>8}{'Bilder/s':>12}{'Speedup':>10}{'je Prozess':>12}")
+        for row in rows:
+            print(f"  {row['processes']:>8}{row['images_per_sec']:>12}{row['speedup']:>10}{row['images_per_sec_per_process']:>12}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline-Benchmark des Crawlers mit Stub-Graph-API und -CDN.")
+    parser.add_argument('--scenarios', default='hashtag,user,lambda', type=lambda value: [s.strip() for s in value.split(',') if s.strip()],
+                        help="Kommagetrennt: hashtag (search_media_by_hashtag), user (process_media), lambda (lambda_handler)")
+    parser.add_argument('--runs', type=int, default=1, help="Wiederholungen je Szenario (jeweils mit leeren Tabellen)")
+    parser.add_argument('--limit', type=int, default=100, help="Max. Medien je Hashtag/Nutzer")
+    parser.add_argument('--workers', type=int, default=None, help="Download-Worker (Standard: crawler_max_workers)")
+    parser.add_argument('--transcode-processes', type=lambda value: [int(n) for n in value.split(',') if n.strip()], default=None,
+                        metavar='N[,N...]', help="Szenarien je Größe des Transkodier-Pools wiederholen (0 = im Thread) und Bilder/s je Kern vergleichen")
+    parser.add_argument('--lambda-hashtags', type=int, default=4, help="SQS-Nachrichten (Hashtags) im Lambda-Szenario")
+    parser.add_argument('--lambda-timeout-seconds', type=float, default=900)
+    parser.add_argument('--media-per-list', type=int, default=500, help="Medien, die der Stub je Liste anbietet")
+    parser.add_argument('--image-ratio', type=float, default=0.8, help="Anteil IMAGE (Rest VIDEO)")
+    parser.add_argument('--image-width', type=int, default=1080)
+    parser.add_argument('--image-height', type=int, default=1350)
+    parser.add_argument('--image-quality', type=int, default=85)
+    parser.add_argument('--latency-ms', type=float, default=50, help="Latenz je Graph-API-Antwort")
+    parser.add_argument('--cdn-latency-ms', type=float, default=20, help="Latenz je CDN-Antwort")
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Anteil der Antworten mit HTTP 500 (werden wiederholt)")
+    parser.add_argument('--dynamo-latency-ms', type=float, default=5, help="Simulierte Latenz je DynamoDB-Aufruf")
+    parser.add_argument('--near-duplicates', action='store_true', help="Beinahe-Duplikat-Erkennung aktiv lassen (Stub-Bilder gelten dann als Duplikate)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save-baseline', metavar='DATEI', help="Ergebnis als Baseline (JSON) speichern")
+    parser.add_argument('--baseline', metavar='DATEI', help="Mit gespeicherter Baseline vergleichen; Exit-Code 1 bei Regression")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="Erlaubte relative Verschlechterung gegenüber der Baseline")
+    parser.add_argument('--json', action='store_true', help="Ergebnis als JSON ausgeben")
+    parser.add_argument('--keep-files', action='store_true', help="Lokal gespeicherte Bilder nicht löschen")
+    parser.add_argument('--log-level', default='warning')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmark(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f"\nBaseline gespeichert: {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_with_baseline(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print(f"\nRegressionen gegenüber {args.baseline} (Toleranz {args.tolerance:.0%}):")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print(f"\nKeine Regression gegenüber {args.baseline} (Toleranz {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+# coalescer.py
+# Fasst Suchaufträge für denselben Hashtag zusammen, bevor gecrawlt bzw. an SQS
+# gesendet wird. Beliebte Hashtags lösen so nur einen Crawl aus statt vieler
+# paralleler Lambda-Aufrufe, die um dieselben DynamoDB-Keys und das Graph-Kontingent konkurrieren.
+import threading
+
+
+class CrawlCoalescer:
+    """
+    1. Im Prozess: Läuft für den Hashtag bereits ein Job oder endete er vor weniger als
+       `recent_seconds`, wird dieser Job zurückgegeben (die SSE-Ereignisse werden von vorn abgespielt).
+    2. Prozessübergreifend: `claim(hashtag)` entscheidet, ob dieser Prozess crawlen darf
+       (z.B. bedingtes Update in CrawlTasks). Falls nicht, läuft ein Begleit-Job mit
+       `follow_func`, der nur die Ergebnisse des fremden Crawls verfolgt.
+    Jeder eingesparte Crawl wird gezählt und an `on_suppressed(hashtag)` gemeldet.
+    """
+
+    def __init__(self, registry, claim=None, on_suppressed=None, recent_seconds=120):
+        self.registry = registry
+        self.claim = claim
+        self.on_suppressed = on_suppressed
+        self.recent_seconds = recent_seconds
+        self._lock = threading.Lock()
+        # Hashtags, für die gerade `claim` läuft (ohne Lock, da Netzwerk-I/O). Weitere Aufträge für
+        # denselben Hashtag warten darauf, statt doppelt zu starten; andere Hashtags laufen ungehindert
+        self._claiming = set()
+        self._claimed = threading.Condition(self._lock)
+        self.crawls_started = 0
+        self.saved_in_process = 0
+        self.saved_shared = 0
+
+    @staticmethod
+    def coalesce_key(hashtag):
+        return hashtag.strip().lstrip('#').lower()
+
+    def submit(self, hashtag, run_func, follow_func, mode):
+        """Gibt (job, ergebnis) zurück; ergebnis ist 'started', 'joined' oder 'following'."""
+        key = self.coalesce_key(hashtag)
+        with self._lock:
+            while key in self._claiming:
+                self._claimed.wait()
+            job = self.registry.find_recent(key, self.recent_seconds)
+            if job:
+                self.saved_in_process += 1
+            else:
+                self._claiming.add(key)
+        if job:
+            if self.on_suppressed:
+                self.on_suppressed(hashtag)
+            return job, 'joined'
+
+        try:
+            claimed = self.claim is None or self.claim(hashtag)
+            # Job eintragen, bevor wartende Aufträge für diesen Hashtag erneut suchen
+            with self._lock:
+                if claimed:
+                    self.crawls_started += 1
+                    job = self.registry.submit(hashtag, run_func, mode, key=key)
+                else:
+                    job = self.registry.submit(hashtag, follow_func, 'follow', key=key)
+                    self.saved_shared += 1
+        finally:
+            with self._lock:
+                self._claiming.discard(key)
+                self._claimed.notify_all()
+        if claimed:
+            return job, 'started'
+        if self.on_suppressed:
+            self.on_suppressed(hashtag)
+        return job, 'following'
+
+    def stats(self):
+        with self._lock:
+            return {
+                'crawls_started': self.crawls_started,
+                'crawls_saved': self.saved_in_process + self.saved_shared,
+                'saved_in_process': self.saved_in_process,
+                'saved_shared': self.saved_shared,
+            }
@@ -1,280 +1,1134 @@
 import requests
 import json
 import os
+import hashlib
+from contextlib import closing
 from io import BytesIO
-from PIL import Image
+from tempfile import SpooledTemporaryFile
 import logging
 from defines import getCreds
-import boto3
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError, ClientError
 import datetime # Für Timestamps
+import time
+from http_client import http_get
+from rate_limit import graph_governor, DynamoRateLimitStore
+from pipeline import bounded_map, isolated
+from imaging import (ImageTooLarge, sniff_image_format, read_image_size, check_pixel_limit,
+                     read_head, open_bounded_stream, copy_with_sha256, process_image)
+from image_index import ImageHashIndex, DynamoImageHashStore
+from dynamo_batch import batch_get_existing_keys, BatchMetadataWriter
+from hashtag_cache import HashtagIdCache, DynamoHashtagStore, SqliteHashtagStore, DAY_SECONDS
+from transcode import TranscodePool, resolve_process_count
+from storage import create_storage, DEFAULT_LOCAL_ROOT, IMMUTABLE_CACHE_CONTROL
+from metrics import metrics
+import aws_clients
+import lazy_init
 
 # Konfigurationen laden
 creds = getCreds()
 API_BASE_URL = creds.get('endpoint_base')
 S3_BUCKET_NAME = creds.get('s3_bucket_name')
 S3_IMAGE_PREFIX = creds.get('s3_image_prefix', 'images/instagram/') # Fallback, falls nicht in creds
+S3_VIDEO_PREFIX = creds.get('s3_video_prefix', 'videos/instagram/')
 DYNAMODB_CRAWLEDMEDIA_TABLE_NAME = creds.get('dynamodb_crawledmedia_table')
-DYNAMODB_CRAWLTASKS_TABLE_NAME = creds.get('dynamodb_crawltasks_table') # Optional für spätere Nutzung
+DYNAMODB_CRAWLTASKS_TABLE_NAME = creds.get('dynamodb_crawltasks_table') # Crawl-Status pro Suchbegriff (Key: search_term, platform)
 DYNAMODB_REGION = creds.get('dynamodb_region', creds.get('s3_bucket_region')) # Fallback auf S3 Region
+DYNAMODB_RATELIMIT_TABLE_NAME = creds.get('dynamodb_ratelimit_table') # Optional: Rate-Limit-Zustand zwischen Instanzen teilen
+DYNAMODB_IMAGEHASH_TABLE_NAME = creds.get('dynamodb_imagehash_table') # Optional: gemeinsamer Duplikat-Index
+DYNAMODB_IMAGEHASH_TIME_INDEX = creds.get('dynamodb_imagehash_time_index') # Optional: GSI (indexed_day, indexed_at) für inkrementelles Nachladen
+DYNAMODB_HASHTAGCACHE_TABLE_NAME = creds.get('dynamodb_hashtag_cache_table') # Optional: gemeinsamer Hashtag-ID-Cache
+HASHTAG_CACHE_SQLITE_PATH = creds.get('hashtag_cache_sqlite_path') # Optional: lokaler Hashtag-ID-Cache (offline)
+# Feld-Expansion: Kinder von CAROUSEL_ALBUM kommen in derselben Antwort mit (kein Request pro Kind)
+MEDIA_FIELDS = "id,caption,media_type,media_url,permalink,timestamp,children{id,media_type,media_url}"
+INGESTED_MEDIA_TYPES = ('IMAGE', 'VIDEO')
+GRAPH_MAX_PAGE_SIZE = int(creds.get('graph_max_page_size', 50)) # recent_media liefert max. 50 Elemente pro Seite
+# Bild-Ingest: Obergrenzen halten den Speicherbedarf pro Bild begrenzt
+IMAGE_MAX_BYTES = int(creds.get('image_max_bytes', 20 * 1024 * 1024))
+IMAGE_MAX_PIXELS = int(creds.get('image_max_pixels', 40_000_000))
+IMAGE_JPEG_QUALITY = int(creds.get('image_jpeg_quality', 90)) # Nur für transkodierte Bilder
+IMAGE_STREAM_CHUNK_SIZE = 64 * 1024
+IMAGE_SPOOL_MAX_MEMORY = int(creds.get('image_spool_max_memory', 8 * 1024 * 1024)) # Größere Downloads werden nach /tmp ausgelagert
+# Derivate (längste Kante in Pixeln) für Galerie-Kacheln und Vorschauen
+IMAGE_DERIVATIVE_SIZES = [int(size) for size in creds.get('image_derivative_sizes', [256, 1024])]
+IMAGE_DERIVATIVE_FORMATS = [f.upper() for f in creds.get('image_derivative_formats', ['JPEG', 'WEBP'])]
+IMAGE_DERIVATIVE_QUALITY = int(creds.get('image_derivative_quality', 82))
+IMAGE_PHASH_MAX_DISTANCE = int(creds.get('image_phash_max_distance', 4)) # Max. Hamming-Distanz für Beinahe-Duplikate (-1 = aus)
+S3_MULTIPART_THRESHOLD = int(creds.get('s3_multipart_threshold', 8 * 1024 * 1024))
+S3_MULTIPART_CHUNKSIZE = int(creds.get('s3_multipart_chunksize', 8 * 1024 * 1024))
+# Videos werden vom CDN direkt per Multipart-Upload gestreamt; im Speicher liegt nur ein Teil
+VIDEO_MAX_BYTES = int(creds.get('video_max_bytes', 1024 * 1024 * 1024))
+VIDEO_PART_SIZE = int(creds.get('video_part_size', S3_MULTIPART_CHUNKSIZE)) # Mind. 5 MB (S3-Minimum)
+VIDEO_STREAM_CHUNK_SIZE = 1024 * 1024
+# Ablage der Bilder: 's3' (Standard) oder 'local' (inhaltsadressiert im Dateisystem, ohne S3)
+STORAGE_BACKEND = creds.get('storage_backend', 's3').lower()
+LOCAL_STORAGE_ROOT = creds.get('local_storage_root', DEFAULT_LOCAL_ROOT)
+LOCAL_STORAGE_URL_PREFIX = creds.get('local_storage_url_prefix', '/media/')
+# Nebenläufigkeit der Crawl-Pipeline
+CRAWLER_MAX_WORKERS = int(creds.get('crawler_max_workers', 8)) # Parallele Downloads/Uploads
+CRAWLER_QUEUE_FACTOR = int(creds.get('crawler_queue_factor', 2)) # Max. wartende Elemente je Worker (Backpressure)
+# Prozesse für PIL-Dekodierung/-Encode (transcode.py): 'auto' = ein Prozess je Kern (in Lambda 0), 0 = im Download-Thread
+CRAWLER_TRANSCODE_PROCESSES = resolve_process_count(creds.get('crawler_transcode_processes', 'auto'))
+# Inkrementelles Crawlen: Überlappung hinter der High-Water-Mark, in der noch weiter paginiert wird
+CRAWL_HIGH_WATER_OVERLAP_SECONDS = int(creds.get('crawl_high_water_overlap_seconds', 300))
+# Abbruchgründe von iter_graph_pages, nach denen die Liste lückenlos gelesen wurde
+HIGH_WATER_ADVANCE_REASONS = ('end', 'seen', 'max_items', 'max_pages')
+# Koordination zwischen Instanzen: laufende Crawls beanspruchen den Suchbegriff höchstens so lange (Lambda-Timeout) ...
+CRAWL_CLAIM_TTL_SECONDS = int(creds.get('crawl_claim_ttl_seconds', 900))
+# ... und abgeschlossene Crawls gelten so lange als aktuell
+CRAWL_RECENT_SECONDS = int(creds.get('crawl_recent_seconds', 120))
+CRAWLER_METADATA_FLUSH_SECONDS = float(creds.get('crawler_metadata_flush_seconds', 1.0)) # Metadaten spätestens nach so vielen Sekunden schreiben
 
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
 
-# AWS Clients auf Modulebene initialisieren
-s3_client = None
-dynamodb_resource = None
-crawled_media_table = None
-# crawl_tasks_table = None # Für spätere Nutzung
-
-try:
-    if S3_BUCKET_NAME and DYNAMODB_REGION: # DYNAMODB_REGION wird auch für S3 Client verwendet für Konsistenz
-        s3_client = boto3.client('s3', region_name=DYNAMODB_REGION)
-        logging.info(f"S3-Client erfolgreich initialisiert für Region {DYNAMODB_REGION}.")
-    else:
+# AWS Clients und Caches werden erst beim ersten Zugriff erzeugt (lazy_init.memoized),
+# damit Importe dieses Moduls (Lambda-Kaltstart, Web-Worker) nichts davon bezahlen.
+def _create_s3_client():
+    if not (S3_BUCKET_NAME and DYNAMODB_REGION): # DYNAMODB_REGION wird auch für S3 Client verwendet für Konsistenz
         logging.error("S3_BUCKET_NAME oder DYNAMODB_REGION (verwendet für S3 Client) nicht in creds gefunden. S3-Operationen könnten fehlschlagen.")
+        return None
+    try:
+        client = aws_clients.get_s3_client(DYNAMODB_REGION)
+        logging.info(f"S3-Client erfolgreich initialisiert für Region {DYNAMODB_REGION}.")
+        return client
+    except (NoCredentialsError, PartialCredentialsError):
+        logging.error("AWS-Anmeldeinformationen nicht gefunden/unvollständig. AWS-Operationen werden fehlschlagen.")
+    except Exception as e:
+        logging.error(f"Fehler bei der Initialisierung des S3-Clients: {e}. S3-Operationen werden fehlschlagen.")
+    return None
 
-    if DYNAMODB_CRAWLEDMEDIA_TABLE_NAME and DYNAMODB_REGION:
-        dynamodb_resource = boto3.resource('dynamodb', region_name=DYNAMODB_REGION)
-        crawled_media_table = dynamodb_resource.Table(DYNAMODB_CRAWLEDMEDIA_TABLE_NAME)
-        logging.info(f"DynamoDB Resource und Tabelle '{DYNAMODB_CRAWLEDMEDIA_TABLE_NAME}' initialisiert für Region {DYNAMODB_REGION}.")
-        # if DYNAMODB_CRAWLTASKS_TABLE_NAME:
-        # crawl_tasks_table = dynamodb_resource.Table(DYNAMODB_CRAWLTASKS_TABLE_NAME)
-        # logging.info(f"DynamoDB Tabelle '{DYNAMODB_CRAWLTASKS_TABLE_NAME}' initialisiert.")
-    else:
-        logging.error("DYNAMODB_CRAWLEDMEDIA_TABLE_NAME oder DYNAMODB_REGION nicht in creds gefunden. DynamoDB-Operationen werden fehlschlagen.")
 
-except (NoCredentialsError, PartialCredentialsError):
-    logging.error("AWS-Anmeldeinformationen nicht gefunden/unvollständig. AWS-Operationen werden fehlschlagen.")
-except Exception as e:
-    logging.error(f"Fehler bei der Initialisierung von AWS Clients: {e}. AWS-Operationen werden fehlschlagen.")
+def get_s3_client():
+    return lazy_init.memoized('crawler:s3_client', _create_s3_client)
 
 
-def get_utc_timestamp():
-    return datetime.datetime.utcnow().isoformat() + "Z"
+def get_s3_transfer_config():
+    # Import von boto3.s3.transfer (s3transfer) erst beim ersten Upload
+    return lazy_init.memoized('crawler:s3_transfer_config', lambda: lazy_init.lazy_import('boto3.s3.transfer').TransferConfig(
+        multipart_threshold=S3_MULTIPART_THRESHOLD,
+        multipart_chunksize=S3_MULTIPART_CHUNKSIZE
+    ))
 
-def get_user_media(access_token, user_id):
-    # (Funktion bleibt im Wesentlichen gleich wie zuvor)
-    url = f"{API_BASE_URL}{user_id}/media?fields=id,caption,media_type,media_url,permalink&access_token={access_token}"
+
+def get_storage():
+    # S3Storage oder LocalStorage (siehe storage.py); None, wenn S3 nicht konfiguriert ist
+    return lazy_init.memoized('crawler:storage', lambda: create_storage(
+        STORAGE_BACKEND,
+        s3_client_factory=get_s3_client,
+        bucket=S3_BUCKET_NAME,
+        transfer_config_factory=get_s3_transfer_config,
+        local_root=LOCAL_STORAGE_ROOT,
+        local_url_prefix=LOCAL_STORAGE_URL_PREFIX
+    ))
+
+
+def get_transcode_pool():
+    # None, wenn im Download-Thread transkodiert wird (CRAWLER_TRANSCODE_PROCESSES = 0)
+    return lazy_init.memoized('crawler:transcode_pool', lambda: TranscodePool(CRAWLER_TRANSCODE_PROCESSES) if CRAWLER_TRANSCODE_PROCESSES > 0 else None)
+
+
+def _create_table(table_name):
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logging.error(f"HTTP-Fehler bei get_user_media für {user_id}: {e}")
-        return None
-    # ... weitere Fehlerbehandlung ...
+        table = aws_clients.get_table(table_name, DYNAMODB_REGION)
+        logging.info(f"DynamoDB Tabelle '{table_name}' initialisiert für Region {DYNAMODB_REGION}.")
+        return table
+    except (NoCredentialsError, PartialCredentialsError):
+        logging.error("AWS-Anmeldeinformationen nicht gefunden/unvollständig. AWS-Operationen werden fehlschlagen.")
     except Exception as e:
-        logging.error(f"Unerwarteter Fehler bei get_user_media für {user_id}: {e}")
+        logging.error(f"Fehler bei der Initialisierung der DynamoDB Tabelle '{table_name}': {e}. DynamoDB-Operationen werden fehlschlagen.")
+    return None
+
+
+def get_dynamodb_resource():
+    if not (DYNAMODB_CRAWLEDMEDIA_TABLE_NAME and DYNAMODB_REGION):
         return None
+    return aws_clients.get_dynamodb_resource(DYNAMODB_REGION)
 
 
-def download_image_to_s3(media_url, filename_base):
-    if not s3_client:
-        logging.error("S3-Client nicht initialisiert in download_image_to_s3. Upload nicht möglich.")
+def _create_crawled_media_table():
+    if not (DYNAMODB_CRAWLEDMEDIA_TABLE_NAME and DYNAMODB_REGION):
+        logging.error("DYNAMODB_CRAWLEDMEDIA_TABLE_NAME oder DYNAMODB_REGION nicht in creds gefunden. DynamoDB-Operationen werden fehlschlagen.")
+        return None
+    return _create_table(DYNAMODB_CRAWLEDMEDIA_TABLE_NAME)
+
+
+def get_crawled_media_table():
+    return lazy_init.memoized('crawler:crawled_media_table', _create_crawled_media_table)
+
+
+def get_crawl_tasks_table():
+    # Crawl-Status pro Suchbegriff; nur zusammen mit der CrawledMedia-Tabelle nutzbar
+    if not (DYNAMODB_CRAWLTASKS_TABLE_NAME and get_crawled_media_table()):
+        return None
+    return lazy_init.memoized('crawler:crawl_tasks_table', lambda: _create_table(DYNAMODB_CRAWLTASKS_TABLE_NAME))
+
+
+def _optional_table(table_name):
+    # Optionale Hilfstabellen (Rate-Limit, Hash-Index, Hashtag-Cache) nur mit konfigurierter Haupttabelle
+    if not (table_name and get_crawled_media_table()):
+        return None
+    return lazy_init.memoized(f"crawler:table:{table_name}", lambda: _create_table(table_name))
+
+
+def _attach_governor_store():
+    # Rate-Limit-Zustand der Graph API mit anderen Lambda-Instanzen/Workern teilen
+    def attach():
+        table = _optional_table(DYNAMODB_RATELIMIT_TABLE_NAME)
+        if table:
+            graph_governor.shared_store = DynamoRateLimitStore(table)
+        return True
+    lazy_init.memoized('crawler:governor_store', attach)
+
+
+def get_graph_governor():
+    # Für Planung ohne eigene Graph-Aufrufe (scheduler.py): gemeinsamer Speicher schon vor der ersten Anfrage
+    _attach_governor_store()
+    return graph_governor
+
+
+def _create_image_hash_index():
+    # Duplikat-Index über Inhalts- und Wahrnehmungs-Hashes
+    table = _optional_table(DYNAMODB_IMAGEHASH_TABLE_NAME)
+    store = DynamoImageHashStore(table, time_index_name=DYNAMODB_IMAGEHASH_TIME_INDEX) if table else None
+    return ImageHashIndex(store=store, max_distance=IMAGE_PHASH_MAX_DISTANCE)
+
+
+def get_image_hash_index():
+    return lazy_init.memoized('crawler:image_hash_index', _create_image_hash_index)
+
+
+def _create_hashtag_id_cache():
+    # Hashtag-ID-Cache: DynamoDB bevorzugt (von allen Instanzen geteilt), sonst SQLite, sonst nur im Prozess
+    hashtag_cache_store = None
+    try:
+        table = _optional_table(DYNAMODB_HASHTAGCACHE_TABLE_NAME)
+        if table:
+            hashtag_cache_store = DynamoHashtagStore(table)
+        elif HASHTAG_CACHE_SQLITE_PATH:
+            hashtag_cache_store = SqliteHashtagStore(HASHTAG_CACHE_SQLITE_PATH)
+    except Exception as e:
+        logging.error(f"Fehler bei der Initialisierung des Hashtag-Cache-Speichers: {e}. Verwende nur den Cache im Prozess.")
+    return HashtagIdCache(
+        store=hashtag_cache_store,
+        ttl_seconds=int(creds.get('hashtag_cache_ttl_seconds', 365 * DAY_SECONDS)),
+        negative_ttl_seconds=int(creds.get('hashtag_cache_negative_ttl_seconds', DAY_SECONDS)),
+        quota_limit=int(creds.get('hashtag_quota_limit', 30))
+    )
+
+
+def get_hashtag_id_cache():
+    return lazy_init.memoized('crawler:hashtag_id_cache', _create_hashtag_id_cache)
+
+
+def get_utc_timestamp():
+    return datetime.datetime.utcnow().isoformat() + "Z"
+
+def iter_graph_pages(url, max_items=None, max_pages=None, time_budget_seconds=None, description="Graph-API-Liste", stop_when=None, state=None):
+    """
+    Generator über die Seiten einer Graph-API-Liste.
+
+    Folgt `paging.next` erst, wenn die nächste Seite tatsächlich angefordert wird,
+    sodass der Aufrufer schon mit den ersten Elementen arbeiten kann, während
+    weitere Seiten noch ausstehen. Liefert pro Seite eine Liste von Elementen und
+    stoppt, sobald `max_items` Elemente geliefert, `max_pages` Seiten abgerufen
+    oder `time_budget_seconds` verstrichen sind. Fehler beenden die Iteration (geloggt).
+    `stop_when(item)` markiert bereits bekannte Elemente: die Seite wird davor
+    abgeschnitten und nicht weiter paginiert (Listen sind neueste zuerst sortiert).
+    Der Abbruchgrund ('end', 'seen', 'max_items', 'max_pages', 'time_budget',
+    'error') wird in `state['stop_reason']` hinterlegt.
+    """
+    _attach_governor_store()
+    state = state if state is not None else {}
+    started = time.monotonic()
+    items_yielded = 0
+    pages_fetched = 0
+
+    state['stop_reason'] = 'end'
+    while url:
+        if max_pages is not None and pages_fetched >= max_pages:
+            logging.info(f"{description}: Seitenlimit ({max_pages}) erreicht.")
+            state['stop_reason'] = 'max_pages'
+            return
+        if time_budget_seconds is not None and time.monotonic() - started >= time_budget_seconds:
+            logging.info(f"{description}: Zeitbudget ({time_budget_seconds}s) erschöpft nach {pages_fetched} Seiten.")
+            state['stop_reason'] = 'time_budget'
+            return
+
+        try:
+            response = http_get(url)
+            response.raise_for_status()
+            data = response.json()
+        except requests.exceptions.RequestException as e:
+            metrics.count_error('graph', e)
+            logging.error(f"HTTP-Fehler beim Abrufen von {description} (Seite {pages_fetched + 1}): {e}")
+            state['stop_reason'] = 'error'
+            return
+        except Exception as e:
+            metrics.count_error('graph', e)
+            logging.error(f"Unerwarteter Fehler beim Abrufen von {description} (Seite {pages_fetched + 1}): {e}")
+            state['stop_reason'] = 'error'
+            return
+
+        pages_fetched += 1
+        page_items = data.get('data') or []
+        metrics.increment('graph_pages_total')
+        metrics.increment('graph_items_total', len(page_items))
+        reached_seen = False
+        if stop_when:
+            for index, media_item in enumerate(page_items):
+                if stop_when(media_item):
+                    page_items = page_items[:index]
+                    reached_seen = True
+                    break
+        if max_items is not None:
+            page_items = page_items[:max_items - items_yielded]
+        logging.info(f"API lieferte {len(page_items)} Medienelemente für {description} (Seite {pages_fetched}).")
+        if page_items:
+            items_yielded += len(page_items)
+            yield page_items
+
+        if max_items is not None and items_yielded >= max_items:
+            state['stop_reason'] = 'max_items'
+            return
+        if reached_seen:
+            logging.info(f"{description}: Bereits gecrawlte Elemente erreicht nach {pages_fetched} Seiten. Keine weitere Paginierung.")
+            state['stop_reason'] = 'seen'
+            return
+        url = (data.get('paging') or {}).get('next')
+
+
+def iter_user_media_pages(access_token, user_id, limit=25, max_pages=None, time_budget_seconds=None, stop_when=None, state=None):
+    page_size = min(limit, GRAPH_MAX_PAGE_SIZE) if limit else GRAPH_MAX_PAGE_SIZE
+    url = f"{API_BASE_URL}{user_id}/media?fields={MEDIA_FIELDS}&limit={page_size}&access_token={access_token}"
+    return iter_graph_pages(url, limit, max_pages, time_budget_seconds, description=f"eigene Medien von {user_id}", stop_when=stop_when, state=state)
+
+
+def get_user_media(access_token, user_id, limit=25):
+    # Sammelt bis zu `limit` Elemente über alle Seiten; für große Mengen iter_user_media_pages verwenden
+    items = [item for page in iter_user_media_pages(access_token, user_id, limit) for item in page]
+    return {'data': items}
+
+
+DERIVATIVE_CONTENT_TYPES = {'JPEG': ('jpg', 'image/jpeg'), 'WEBP': ('webp', 'image/webp')}
+
+
+def derivative_s3_key(size, image_format, filename_base):
+    extension = DERIVATIVE_CONTENT_TYPES[image_format][0]
+    return f"{S3_IMAGE_PREFIX.strip('/')}/derivatives/{size}/{filename_base}.{extension}"
+
+
+def _upload_derivatives(derivatives, filename_base):
+    """
+    Lädt die von process_image erzeugten Derivate hoch. Gibt die Schlüssel als
+    {'256': {'jpeg': key, 'webp': key}, ...} zurück (Map-Format für DynamoDB).
+    Fehler bei einzelnen Derivaten werden geloggt; das Original bleibt gültig.
+    """
+    storage = get_storage()
+    uploaded = {}
+    for size, encoded_by_format in derivatives.items():
+        for image_format, data in encoded_by_format.items():
+            s3_key_path = derivative_s3_key(size, image_format, filename_base)
+            try:
+                with metrics.timed('image_stage_seconds', stage='upload_derivative'):
+                    storage.put(s3_key_path, data, DERIVATIVE_CONTENT_TYPES[image_format][1], cache_control=IMMUTABLE_CACHE_CONTROL)
+                metrics.increment('image_stored_bytes_total', len(data), kind='derivative')
+                uploaded.setdefault(str(size), {})[image_format.lower()] = s3_key_path
+            except (ClientError, OSError) as e:
+                metrics.count_error('upload_derivative', e)
+                logging.error(f"Fehler beim Speichern des Derivats {s3_key_path} ({storage.name}): {e}")
+    return uploaded
+
+
+# CDN-Statuscodes, bei denen das Medium endgültig fehlt (ein erneuter Versuch bringt nichts)
+CDN_GONE_STATUS_CODES = (404, 410)
+
+
+class MediaRejected(Exception):
+    """Medium kann nie gespeichert werden (beim CDN gelöscht, nicht dekodierbar); kein Grund für einen erneuten Versuch."""
+
+
+def _rejected_result(media_url, reason, metric_name):
+    # Endgültig verworfene Medien zählen nicht als Fehlschlag des Crawls (siehe _crawl_media_items)
+    metrics.increment(metric_name, result='rejected')
+    logging.warning(f"Medium von {media_url} verworfen: {reason}")
+    return {'rejected': str(reason)}
+
+
+def _raise_if_gone(error):
+    # HTTP 404/410 vom CDN: Medium wurde gelöscht
+    status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status_code in CDN_GONE_STATUS_CODES:
+        raise MediaRejected(f"CDN antwortet mit HTTP {status_code}.") from error
+
+
+def _duplicate_result(media_url, duplicate, content_sha256, phash):
+    metrics.increment('images_total', result='duplicate')
+    logging.info(f"Bild von {media_url} ist Duplikat von {duplicate.get('media_id')} ({duplicate['s3_key']}). Überspringe Upload.")
+    result = {
+        's3_key': duplicate['s3_key'],
+        'content_sha256': content_sha256,
+        'phash': phash,
+        'duplicate_of': duplicate.get('media_id')
+    }
+    if duplicate.get('derivatives'):
+        result['derivatives'] = duplicate['derivatives']
+    return result
+
+
+def ingest_image_to_s3(media_url, filename_base, media_id=None):
+    """
+    Lädt ein Bild gestreamt vom CDN in die konfigurierte Ablage (get_storage(): S3 oder lokal).
+
+    Anhand der ersten Bytes wird das Format erkannt: JPEGs werden unverändert
+    hochgeladen, nur andere Formate werden dekodiert und als JPEG neu kodiert.
+    Beim Empfang werden SHA-256 und dHash berechnet; ist das Bild (oder ein sehr
+    ähnliches) bereits gespeichert, entfällt der Upload und der vorhandene
+    s3_key wird wiederverwendet. Im selben Dekodier-Durchgang entstehen die
+    Derivate (IMAGE_DERIVATIVE_SIZES x IMAGE_DERIVATIVE_FORMATS). Der Download wird dafür in einer
+    SpooledTemporaryFile zwischengespeichert, die ab IMAGE_SPOOL_MAX_MEMORY Bytes
+    nach /tmp auslagert. Bilder über IMAGE_MAX_BYTES bzw. IMAGE_MAX_PIXELS werden verworfen.
+
+    Gibt ein Dict mit 's3_key', 'content_sha256', 'phash', 'derivatives' und ggf.
+    'duplicate_of' (media_id des Originals) zurück, {'rejected': grund} für Bilder, die nie
+    gespeichert werden können (zu groß, beim CDN gelöscht, nicht dekodierbar), oder None bei
+    vorübergehenden Fehlern.
+    """
+    storage = get_storage()
+    image_hash_index = get_image_hash_index()
+    if not storage:
+        logging.error("Storage (S3-Client) nicht initialisiert in ingest_image_to_s3. Upload nicht möglich.")
         return None
-    # (Funktion bleibt im Wesentlichen gleich wie zuvor, lädt nach S3 hoch und gibt s3_key zurück)
     try:
-        response = requests.get(media_url, stream=True, timeout=10)
-        response.raise_for_status()
-        image_content = BytesIO(response.content)
-        image = Image.open(image_content)
-        if image.mode in ("RGBA", "P"): image = image.convert("RGB")
-        
-        buffer = BytesIO()
-        image.save(buffer, format="JPEG")
-        buffer.seek(0)
-        
-        s3_key_path = f"{S3_IMAGE_PREFIX.strip('/')}/{filename_base}.jpg"
-        
-        s3_client.upload_fileobj(buffer, S3_BUCKET_NAME, s3_key_path, ExtraArgs={'ContentType': 'image/jpeg'})
-        logging.info(f"Bild erfolgreich nach S3 hochgeladen: s3://{S3_BUCKET_NAME}/{s3_key_path}")
-        return s3_key_path
+        response = http_get(media_url, stream=True)
+        with closing(response), SpooledTemporaryFile(max_size=IMAGE_SPOOL_MAX_MEMORY) as spool:
+            try:
+                response.raise_for_status()
+            except requests.exceptions.HTTPError as e:
+                _raise_if_gone(e)
+                raise
+            content_length = response.headers.get('Content-Length')
+            if content_length and content_length.isdigit() and int(content_length) > IMAGE_MAX_BYTES:
+                raise ImageTooLarge(f"Content-Length {content_length} überschreitet {IMAGE_MAX_BYTES} Bytes.")
+
+            chunks = response.iter_content(chunk_size=IMAGE_STREAM_CHUNK_SIZE)
+            head = read_head(chunks)
+            image_format = sniff_image_format(head)
+            image_size = read_image_size(head)
+            if image_size:
+                check_pixel_limit(image_size, IMAGE_MAX_PIXELS)
+            with metrics.timed('image_stage_seconds', stage='download'):
+                content_sha256, downloaded_bytes = copy_with_sha256(open_bounded_stream(head, chunks, IMAGE_MAX_BYTES), spool)
+            metrics.increment('image_downloaded_bytes_total', downloaded_bytes)
+
+            # Exakte Duplikate ohne jede Dekodierung erkennen
+            duplicate = image_hash_index.find_exact(content_sha256)
+            if duplicate:
+                return _duplicate_result(media_url, duplicate, content_sha256, duplicate.get('phash'))
+
+            # Eine einzige Dekodierung für dHash, Derivate und ggf. Transkodierung,
+            # mit Transkodier-Pool in einem eigenen Prozess (Bytes über Shared Memory)
+            passthrough = image_format == 'JPEG' and image_size is not None
+            process_options = dict(
+                derivative_sizes=IMAGE_DERIVATIVE_SIZES,
+                derivative_formats=IMAGE_DERIVATIVE_FORMATS,
+                transcode=not passthrough,
+                max_pixels=IMAGE_MAX_PIXELS,
+                jpeg_quality=IMAGE_JPEG_QUALITY,
+                derivative_quality=IMAGE_DERIVATIVE_QUALITY
+            )
+            transcode_pool = get_transcode_pool()
+            spool.seek(0)
+            try:
+                with metrics.timed('image_stage_seconds', stage='decode'):
+                    if transcode_pool:
+                        processed = transcode_pool.process(spool, downloaded_bytes, **process_options)
+                    else:
+                        processed = process_image(spool, **process_options)
+            except ImageTooLarge:
+                raise
+            except MemoryError:
+                raise
+            except Exception as e:
+                if not passthrough:
+                    raise MediaRejected(f"Bild ({image_format or 'unbekanntes Format'}) nicht dekodierbar: {e}") from e
+                # Original wird trotzdem unverändert gespeichert, nur ohne Hash und Derivate
+                logging.warning(f"Bild von {media_url} konnte nicht analysiert werden: {e}")
+                processed = {'phash': None, 'derivatives': {}, 'transcoded': None}
+            phash = processed['phash']
+
+            duplicate = image_hash_index.find_similar(phash)
+            if duplicate:
+                return _duplicate_result(media_url, duplicate, content_sha256, phash)
+
+            s3_key_path = f"{S3_IMAGE_PREFIX.strip('/')}/{filename_base}.jpg"
+            if passthrough:
+                # Bereits JPEG: unverändert hochladen
+                spool.seek(0)
+                body = spool
+                stored_bytes = downloaded_bytes
+            else:
+                logging.info(f"Bild ({image_format or 'unbekanntes Format'}) von {media_url} nach JPEG transkodiert.")
+                body = BytesIO(processed['transcoded'])
+                stored_bytes = len(processed['transcoded'])
+
+            with metrics.timed('image_stage_seconds', stage='upload'):
+                storage.put_stream(s3_key_path, body, 'image/jpeg')
+            metrics.increment('image_stored_bytes_total', stored_bytes, kind='original')
+        logging.info(f"Bild erfolgreich gespeichert ({storage.name}): {s3_key_path}")
+        derivatives = _upload_derivatives(processed['derivatives'], filename_base)
+
+        hash_entry = {'content_sha256': content_sha256, 's3_key': s3_key_path}
+        if storage.bucket:
+            hash_entry['s3_bucket'] = storage.bucket
+        if phash:
+            hash_entry['phash'] = phash
+        if media_id:
+            hash_entry['media_id'] = media_id
+        if derivatives:
+            hash_entry['derivatives'] = derivatives
+        image_hash_index.add(hash_entry)
+        metrics.increment('images_total', result='stored')
+        return {'s3_key': s3_key_path, 'content_sha256': content_sha256, 'phash': phash, 'derivatives': derivatives}
     except requests.exceptions.RequestException as e:
+        metrics.count_error('ingest', e)
         logging.error(f"Fehler beim Herunterladen (requests) von {media_url}: {e}")
+    except (ImageTooLarge, MediaRejected) as e:
+        return _rejected_result(media_url, e, 'images_total')
     except IOError as e:
-        logging.error(f"Fehler beim Verarbeiten (PIL) von Bild von {media_url}: {e}")
+        metrics.count_error('ingest', e)
+        logging.error(f"Fehler beim Verarbeiten (PIL) oder lokalen Speichern von Bild von {media_url}: {e}")
     except ClientError as e:
+        metrics.count_error('ingest', e)
         logging.error(f"AWS S3 Client Fehler beim Hochladen für {media_url}: {e}")
     except Exception as e:
-        logging.error(f"Unerwarteter Fehler in download_image_to_s3 für {media_url}: {e}")
+        metrics.count_error('ingest', e)
+        logging.error(f"Unerwarteter Fehler in ingest_image_to_s3 für {media_url}: {e}")
+    metrics.increment('images_total', result='failed')
     return None
 
 
-def process_media(access_token, user_id_of_account_owner):
-    logging.info(f"Starte Verarbeitung eigener Medien für User-ID: {user_id_of_account_owner}")
-    if not crawled_media_table:
-        logging.error("DynamoDB 'CrawledMedia' Tabelle nicht initialisiert. Verarbeitung eigener Medien nicht möglich.")
-        return []
+def ingest_video_to_s3(media_url, filename_base):
+    """
+    Streamt ein Video vom CDN in Teilen von VIDEO_PART_SIZE Bytes per Multipart-Upload in die
+    Ablage (storage.put_chunks); es liegt nie vollständig im Speicher oder in /tmp. SHA-256 und
+    Größe werden unterwegs berechnet; Videos über VIDEO_MAX_BYTES werden abgebrochen.
+
+    Gibt ein Dict mit 's3_key', 'content_sha256' und 'size_bytes' zurück, {'rejected': grund}
+    für zu große oder beim CDN gelöschte Videos, oder None bei vorübergehenden Fehlern.
+    """
+    storage = get_storage()
+    if not storage:
+        logging.error("Storage (S3-Client) nicht initialisiert in ingest_video_to_s3. Upload nicht möglich.")
+        return None
+    s3_key_path = f"{S3_VIDEO_PREFIX.strip('/')}/{filename_base}.mp4"
+    digest = hashlib.sha256()
+    received = {'bytes': 0}
+
+    def hashed_chunks(chunks):
+        for chunk in chunks:
+            received['bytes'] += len(chunk)
+            if received['bytes'] > VIDEO_MAX_BYTES:
+                raise ImageTooLarge(f"Video überschreitet {VIDEO_MAX_BYTES} Bytes.")
+            digest.update(chunk)
+            yield chunk
+
+    try:
+        response = http_get(media_url, stream=True)
+        with closing(response):
+            try:
+                response.raise_for_status()
+            except requests.exceptions.HTTPError as e:
+                _raise_if_gone(e)
+                raise
+            content_length = response.headers.get('Content-Length')
+            if content_length and content_length.isdigit() and int(content_length) > VIDEO_MAX_BYTES:
+                raise ImageTooLarge(f"Content-Length {content_length} überschreitet {VIDEO_MAX_BYTES} Bytes.")
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+            if not content_type.startswith('video/'):
+                content_type = 'video/mp4'
+            with metrics.timed('image_stage_seconds', stage='upload_video'):
+                storage.put_chunks(s3_key_path, hashed_chunks(response.iter_content(chunk_size=VIDEO_STREAM_CHUNK_SIZE)),
+                                   content_type, part_size=VIDEO_PART_SIZE)
+        metrics.increment('image_stored_bytes_total', received['bytes'], kind='video')
+        metrics.increment('videos_total', result='stored')
+        logging.info(f"Video erfolgreich gespeichert ({storage.name}, {received['bytes']} Bytes): {s3_key_path}")
+        return {'s3_key': s3_key_path, 'content_sha256': digest.hexdigest(), 'size_bytes': received['bytes']}
+    except requests.exceptions.RequestException as e:
+        metrics.count_error('ingest_video', e)
+        logging.error(f"Fehler beim Herunterladen (requests) des Videos von {media_url}: {e}")
+    except (ImageTooLarge, MediaRejected) as e:
+        return _rejected_result(media_url, e, 'videos_total')
+    except ClientError as e:
+        metrics.count_error('ingest_video', e)
+        logging.error(f"AWS S3 Client Fehler beim Multipart-Upload für {media_url}: {e}")
+    except Exception as e:
+        metrics.count_error('ingest_video', e)
+        logging.error(f"Unerwarteter Fehler in ingest_video_to_s3 für {media_url}: {e}")
+    metrics.increment('videos_total', result='failed')
+    return None
+
+
+def download_image_to_s3(media_url, filename_base):
+    # Kompatibilitäts-Wrapper: gibt nur den s3_key zurück
+    result = ingest_image_to_s3(media_url, filename_base)
+    return result.get('s3_key') if result else None
+
+
+# Callbacks (hashtag_source, version), sobald neue Bilder gespeichert wurden (z.B. Cache-Invalidierung in app.py)
+gallery_version_listeners = []
+
+
+def crawl_task_key(search_term):
+    return {'search_term': search_term, 'platform': 'instagram'}
+
+
+def bump_gallery_version(hashtag_source):
+    """
+    Erhöht den Galerie-Zähler des Hashtags in der CrawlTasks-Tabelle und benachrichtigt
+    lokale Listener. Galerie-Caches erkennen daran, dass sich der Inhalt geändert hat.
+    """
+    version = None
+    crawl_tasks_table = get_crawl_tasks_table()
+    if crawl_tasks_table:
+        try:
+            with metrics.timed('dynamodb_seconds', operation='update_item'):
+                response = crawl_tasks_table.update_item(
+                    Key=crawl_task_key(hashtag_source),
+                    UpdateExpression="ADD gallery_version :one SET gallery_updated_utc = :ts",
+                    ExpressionAttributeValues={':one': 1, ':ts': get_utc_timestamp()},
+                    ReturnValues='UPDATED_NEW'
+                )
+            version = str(response['Attributes']['gallery_version'])
+        except ClientError as e_task:
+            metrics.count_error('dynamodb', e_task)
+            logging.error(f"Fehler beim Erhöhen der Galerie-Version für '{hashtag_source}': {e_task}")
+    for listener in gallery_version_listeners:
+        try:
+            listener(hashtag_source, version)
+        except Exception as e:
+            logging.error(f"Fehler in gallery_version_listener für '{hashtag_source}': {e}")
+    return version
+
+
+def get_gallery_version(hashtag_source):
+    """Aktuelle Galerie-Version aus der CrawlTasks-Tabelle ('0', wenn unbekannt)."""
+    crawl_tasks_table = get_crawl_tasks_table()
+    if not crawl_tasks_table:
+        return '0'
+    response = crawl_tasks_table.get_item(
+        Key=crawl_task_key(hashtag_source),
+        ProjectionExpression='gallery_version'
+    )
+    return str(response.get('Item', {}).get('gallery_version', 0))
+
+
+def parse_media_timestamp(value):
+    # Graph API liefert Zeitstempel wie '2024-05-01T12:00:00+0000'
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S%z")
+    except (TypeError, ValueError):
+        return None
+
+
+def format_media_timestamp(value):
+    # Einheitlich in UTC, damit Zeitstempel auch als String (DynamoDB-Bedingungen) vergleichbar sind
+    return value.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+0000")
+
+
+def user_crawl_task_term(user_id):
+    # CrawlTasks-Eintrag für eigene Medien eines Kontos (neben den Hashtag-Einträgen)
+    return f"user:{user_id}"
+
+
+def get_crawl_state(search_term):
+    """Crawl-Status (High-Water-Mark, letzter Lauf) aus der CrawlTasks-Tabelle oder None."""
+    crawl_tasks_table = get_crawl_tasks_table()
+    if not crawl_tasks_table:
+        return None
+    try:
+        with metrics.timed('dynamodb_seconds', operation='get_item'):
+            return crawl_tasks_table.get_item(Key=crawl_task_key(search_term)).get('Item')
+    except ClientError as e_task:
+        metrics.count_error('dynamodb', e_task)
+        logging.error(f"Fehler beim Lesen von CrawlTask für '{search_term}': {e_task}")
+        return None
+
+
+def high_water_stop_predicate(crawl_state):
+    """
+    Funktion für iter_graph_pages(stop_when=...), die für Elemente älter als die
+    High-Water-Mark (abzüglich CRAWL_HIGH_WATER_OVERLAP_SECONDS) True liefert.
+    Die Überlappung fängt leicht unsortierte Listen ab; Elemente darin werden
+    weiterhin per BatchGetItem als bekannt erkannt. None ohne High-Water-Mark.
+    """
+    newest = parse_media_timestamp((crawl_state or {}).get('newest_media_timestamp'))
+    if newest is None:
+        return None
+    threshold = newest - datetime.timedelta(seconds=CRAWL_HIGH_WATER_OVERLAP_SECONDS)
+
+    def already_seen(media_item):
+        media_timestamp = parse_media_timestamp(media_item.get('timestamp'))
+        return media_timestamp is not None and media_timestamp < threshold
+    return already_seen
+
+
+def record_crawl_state(search_term, crawl_stats, new_image_count, update_high_water=True):
+    """
+    Speichert den Abschluss eines Crawls in der CrawlTasks-Tabelle. Die High-Water-Mark
+    (neuester gesehener Zeitstempel/ID) wird nur vorgerückt, wenn die Liste lückenlos
+    bis zum Ende, bis zu bekannten Elementen oder bis zum gewollten Limit gelesen
+    wurde und kein Element fehlgeschlagen ist; sonst würde der Rest nie nachgeholt.
+    Die Bedingung verhindert, dass parallele Crawls die Marke zurücksetzen.
+    `update_high_water=False` für Listen, die nicht nach Zeit sortiert sind (top_media).
+    """
+    crawl_tasks_table = get_crawl_tasks_table()
+    if not crawl_tasks_table:
+        return
+    # crawl_claimed_until: weitere Anfragen (claim_crawl) noch CRAWL_RECENT_SECONDS lang zusammenfassen
+    update_expression = ("SET #s = :status, last_completed_timestamp_utc = :ts, last_stop_reason = :reason, "
+                         "last_run_api_items = :api_items, last_run_new_images = :new_images, crawl_claimed_until = :claimed_until")
+    values = {
+        ':status': 'completed',
+        ':ts': get_utc_timestamp(),
+        ':claimed_until': int(time.time()) + CRAWL_RECENT_SECONDS,
+        ':reason': crawl_stats.get('stop_reason', 'end'),
+        ':api_items': crawl_stats.get('api_items', 0),
+        ':new_images': new_image_count,
+    }
+    advance = (update_high_water
+               and crawl_stats.get('stop_reason') in HIGH_WATER_ADVANCE_REASONS
+               and not crawl_stats.get('failed_items')
+               and crawl_stats.get('newest_timestamp'))
+    try:
+        if advance:
+            try:
+                crawl_tasks_table.update_item(
+                    Key=crawl_task_key(search_term),
+                    UpdateExpression=update_expression + ", newest_media_timestamp = :newest_ts, newest_media_id = :newest_id",
+                    ConditionExpression="attribute_not_exists(newest_media_timestamp) OR newest_media_timestamp < :newest_ts",
+                    ExpressionAttributeNames={'#s': 'status'},
+                    ExpressionAttributeValues=dict(values, **{
+                        ':newest_ts': crawl_stats['newest_timestamp'],
+                        ':newest_id': crawl_stats.get('newest_media_id', '')
+                    })
+                )
+                logging.info(f"CrawlTask für '{search_term}' als 'completed' markiert, High-Water-Mark: {crawl_stats['newest_timestamp']}.")
+                return
+            except ClientError as e_task:
+                if e_task.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+                logging.info(f"CrawlTask für '{search_term}' hat bereits eine neuere High-Water-Mark.")
+        crawl_tasks_table.update_item(
+            Key=crawl_task_key(search_term),
+            UpdateExpression=update_expression,
+            ExpressionAttributeNames={'#s': 'status'},
+            ExpressionAttributeValues=values
+        )
+        logging.info(f"CrawlTask für '{search_term}' als 'completed' markiert (High-Water-Mark unverändert, Abbruchgrund: {values[':reason']}).")
+    except ClientError as e_task:
+        metrics.count_error('dynamodb', e_task)
+        logging.error(f"Fehler beim Aktualisieren von CrawlTask für '{search_term}': {e_task}")
+
+
+class CrawlFailed(Exception):
+    """Crawl muss wiederholt werden (siehe crawl_failure_reason); `stats` enthält die Crawl-Statistik."""
+
+    def __init__(self, message, stats=None):
+        super().__init__(message)
+        self.stats = stats or {}
+
+
+def crawl_failure_reason(crawl_stats):
+    """
+    Gibt zurück, warum ein Crawl (laut `stats` von search_media_by_hashtag/process_media)
+    wiederholt werden sollte, sonst None: Crawl gar nicht gestartet (z.B. Hashtag-ID nicht
+    auflösbar), Paginierung wegen eines API-Fehlers abgebrochen oder vorübergehend
+    fehlgeschlagene Elemente. Endgültig verworfene Medien (rejected_items) zählen nicht.
+    """
+    if crawl_stats.get('failure'):
+        return crawl_stats['failure']
+    if crawl_stats.get('stop_reason') == 'error':
+        return "Paginierung wegen eines API-Fehlers abgebrochen"
+    if crawl_stats.get('failed_items'):
+        return f"{crawl_stats['failed_items']} Elemente vorübergehend fehlgeschlagen"
+    return None
+
+
+def claim_crawl(search_term, owner):
+    """
+    Beansprucht den nächsten Crawl eines Suchbegriffs instanzübergreifend per bedingtem
+    Update auf CrawlTasks. True: der Aufrufer soll crawlen. False: ein anderer Crawl läuft
+    noch oder wurde vor weniger als CRAWL_RECENT_SECONDS abgeschlossen (record_crawl_state).
+    Ohne CrawlTasks-Tabelle oder bei Fehlern True, damit nie ein Crawl verloren geht.
+    """
+    crawl_tasks_table = get_crawl_tasks_table()
+    if not crawl_tasks_table:
+        return True
+    now = int(time.time())
+    try:
+        crawl_tasks_table.update_item(
+            Key=crawl_task_key(search_term),
+            UpdateExpression="SET crawl_claimed_until = :until, crawl_claimed_at = :ts, crawl_claim_owner = :owner",
+            ConditionExpression="attribute_not_exists(crawl_claimed_until) OR crawl_claimed_until < :now",
+            ExpressionAttributeValues={':until': now + CRAWL_CLAIM_TTL_SECONDS, ':ts': get_utc_timestamp(), ':owner': owner, ':now': now}
+        )
+        metrics.increment('crawl_claims_total', result='claimed')
+        return True
+    except ClientError as e_task:
+        if e_task.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            metrics.increment('crawl_claims_total', result='coalesced')
+            logging.info(f"Crawl für '{search_term}' läuft bereits oder ist aktuell. Anfrage wird zusammengefasst.")
+            return False
+        metrics.count_error('dynamodb', e_task)
+        logging.error(f"Fehler beim Beanspruchen von CrawlTask für '{search_term}': {e_task}")
+        return True
+
+
+def release_crawl(search_term, owner):
+    """
+    Gibt einen per claim_crawl beanspruchten Crawl wieder frei, wenn er nicht abgeschlossen
+    wurde (Fehler, Abbruch). Nur der Besitzer (`owner`) darf freigeben, damit ein inzwischen
+    von einer anderen Instanz beanspruchter Crawl unberührt bleibt. Ohne Freigabe würden
+    weitere Anfragen bis zu CRAWL_CLAIM_TTL_SECONDS lang einen nicht existierenden Crawl verfolgen.
+    """
+    crawl_tasks_table = get_crawl_tasks_table()
+    if not crawl_tasks_table or not owner:
+        return
+    try:
+        crawl_tasks_table.update_item(
+            Key=crawl_task_key(search_term),
+            UpdateExpression="REMOVE crawl_claimed_until, crawl_claim_owner",
+            ConditionExpression="crawl_claim_owner = :owner",
+            ExpressionAttributeValues={':owner': owner}
+        )
+        metrics.increment('crawl_claims_total', result='released')
+        logging.info(f"Crawl für '{search_term}' freigegeben ({owner}).")
+    except ClientError as e_task:
+        if e_task.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return # Gehört inzwischen einer anderen Instanz
+        metrics.count_error('dynamodb', e_task)
+        logging.error(f"Fehler beim Freigeben von CrawlTask für '{search_term}': {e_task}")
+
+
+def record_suppressed_crawl(search_term):
+    # Zähler eingesparter Crawls pro Suchbegriff (über alle Instanzen)
+    crawl_tasks_table = get_crawl_tasks_table()
+    if not crawl_tasks_table:
+        return
+    try:
+        crawl_tasks_table.update_item(
+            Key=crawl_task_key(search_term),
+            UpdateExpression="ADD crawls_saved :one",
+            ExpressionAttributeValues={':one': 1}
+        )
+    except ClientError as e_task:
+        logging.error(f"Fehler beim Zählen eines eingesparten Crawls für '{search_term}': {e_task}")
+
+
+def expand_media_item(media_item):
+    """
+    Zerlegt ein API-Element in speicherbare Einzelmedien: IMAGE und VIDEO unverändert,
+    CAROUSEL_ALBUM in seine Kinder (per Feld-Expansion bereits in 'children' enthalten).
+    Kinder erben Beschriftung, Permalink und Zeitstempel des Albums und tragen dessen ID
+    als 'parent_id'. Elemente ohne media_url (z.B. urheberrechtlich gesperrt) entfallen.
+    """
+    if media_item.get('media_type') == 'CAROUSEL_ALBUM':
+        candidates = [
+            dict(child, caption=media_item.get('caption', ''), permalink=media_item.get('permalink', ''),
+                 timestamp=media_item.get('timestamp'), parent_id=media_item.get('id'))
+            for child in (media_item.get('children') or {}).get('data', [])
+        ]
+    else:
+        candidates = [media_item]
+    return [candidate for candidate in candidates
+            if candidate.get('media_type') in INGESTED_MEDIA_TYPES and candidate.get('media_url') and candidate.get('id')]
 
-    media_api_data = get_user_media(access_token, user_id_of_account_owner)
-    processed_own_images = []
 
-    if media_api_data and media_api_data.get('data'):
-        total_own_items = len(media_api_data['data'])
-        logging.info(f"API lieferte {total_own_items} eigene Medienelemente für User-ID {user_id_of_account_owner}.")
-        own_image_count = 0
-        for i, media_item in enumerate(media_api_data['data']):
+def _filter_new_media_items(media_pages, stats):
+    """
+    Filtert die Bilder und Videos jeder API-Seite (Alben in ihre Kinder zerlegt, siehe
+    expand_media_item) gegen DynamoDB. Pro Seite wird nur ein BatchGetItem ausgeführt
+    statt eines get_item pro Element.
+    Die Seiten werden lazy konsumiert; die Anzahl gesehener Elemente und das neueste
+    Element (für die High-Water-Mark) landen in `stats`.
+    """
+    item_counter = 0
+    for page in media_pages:
+        media_items = []
+        for media_item in page:
+            item_counter += 1
+            stats['api_items'] = item_counter
+            media_timestamp = parse_media_timestamp(media_item.get('timestamp'))
+            if media_timestamp is not None:
+                normalized_timestamp = format_media_timestamp(media_timestamp)
+                if normalized_timestamp > stats.get('newest_timestamp', ''):
+                    stats['newest_timestamp'] = normalized_timestamp
+                    stats['newest_media_id'] = media_item.get('id')
             media_id = media_item.get('id')
             media_type = media_item.get('media_type')
-            logging.info(f"  [Eigenes Item {i+1}/{total_own_items}] ID: {media_id}, Typ: {media_type}")
-
-            if media_type == 'IMAGE':
-                # Prüfen, ob Bild schon in DynamoDB ist
-                try:
-                    response = crawled_media_table.get_item(Key={'media_id': media_id})
-                    if 'Item' in response:
-                        logging.info(f"    Bild {media_id} (eigen) bereits in DynamoDB. Überspringe.")
-                        # Optional: Bestehende Daten aus DynamoDB zur Liste hinzufügen, wenn Anzeige aktualisiert werden soll
-                        # processed_own_images.append(response['Item']) # Stellt sicher, dass alle Keys vorhanden sind
-                        continue 
-                except ClientError as e_db:
-                    logging.error(f"    Fehler beim Prüfen von media_id {media_id} (eigen) in DynamoDB: {e_db}. Verarbeite trotzdem.")
-
-                media_url = media_item.get('media_url')
-                if not media_url: continue
-
-                own_image_count += 1
-                filename_base_for_s3 = f"user_{user_id_of_account_owner}_{media_id}"
-                s3_object_key = download_image_to_s3(media_url, filename_base_for_s3)
-
-                if s3_object_key:
-                    image_info = {
-                        'media_id': media_id,
-                        's3_key': s3_object_key,
-                        's3_bucket': S3_BUCKET_NAME,
-                        'hashtag_source': '__USER_MEDIA__', # Kennzeichnung
-                        'permalink': media_item.get('permalink', ''),
-                        'caption': media_item.get('caption', ''),
-                        'media_url_original': media_url,
-                        'download_timestamp_utc': get_utc_timestamp(),
-                        'platform': 'instagram',
-                        'is_hashtag_result': False
-                    }
-                    try:
-                        crawled_media_table.put_item(Item=image_info)
-                        logging.info(f"    Metadaten für eigenes Bild {media_id} in DynamoDB gespeichert.")
-                        processed_own_images.append(image_info)
-                    except ClientError as e_db_put:
-                        logging.error(f"    Fehler beim Speichern von Metadaten für eigenes Bild {media_id} in DynamoDB: {e_db_put}")
-                else:
-                    logging.warning(f"    Hochladen des eigenen IMAGE-Medienelements (ID: {media_id}) nach S3 fehlgeschlagen.")
-            # ... (andere Medientypen)
-        logging.info(f"Verarbeitung eigener Medien abgeschlossen. {len(processed_own_images)} neue Bilder verarbeitet.")
-    # ... (Fehlerbehandlung für media_api_data)
+            expanded_items = expand_media_item(media_item)
+            logging.info(f"  [Item {item_counter}] ID: {media_id}, Typ: {media_type}, speicherbare Medien: {len(expanded_items)}")
+            media_items.extend(expanded_items)
+        if not media_items:
+            continue
+
+        # Prüfen, welche Medien schon in DynamoDB sind
+        try:
+            existing_ids = batch_get_existing_keys(
+                get_dynamodb_resource(), DYNAMODB_CRAWLEDMEDIA_TABLE_NAME, 'media_id',
+                [media_item.get('id') for media_item in media_items]
+            )
+        except ClientError as e_db:
+            metrics.count_error('dynamodb', e_db)
+            logging.error(f"    Fehler beim Prüfen von {len(media_items)} media_ids in DynamoDB: {e_db}. Verarbeite trotzdem (potenzielle Duplikate).")
+            existing_ids = set()
+
+        for media_item in media_items:
+            if media_item.get('id') in existing_ids:
+                logging.info(f"    Medium {media_item.get('id')} bereits in DynamoDB. Überspringe Download/Upload.")
+                continue
+            stats['new_items'] = stats.get('new_items', 0) + 1
+            yield media_item
+
+
+def _ingest_media_item(media_item, filename_prefix, hashtag_source, is_hashtag_result):
+    """
+    Verarbeitet ein einzelnes neues Medium: Bilder werden heruntergeladen, konvertiert und
+    hochgeladen, Videos per Multipart-Upload durchgestreamt. Gibt das `image_info` Dict
+    (noch nicht in DynamoDB gespeichert), {'rejected': grund} für endgültig verworfene
+    Medien oder None zurück.
+    """
+    media_id = media_item.get('id')
+    media_url = media_item.get('media_url')
+    media_type = media_item.get('media_type', 'IMAGE')
+    if not media_url: return None
+
+    filename_base_for_s3 = f"{filename_prefix}_{media_id}"
+    if media_type == 'VIDEO':
+        with metrics.timed('video_ingest_seconds'):
+            ingest_result = ingest_video_to_s3(media_url, filename_base_for_s3)
+    else:
+        with metrics.timed('image_ingest_seconds'): # Download bis Upload inkl. Derivate
+            ingest_result = ingest_image_to_s3(media_url, filename_base_for_s3, media_id)
+    if not ingest_result:
+        logging.warning(f"    Hochladen des {media_type} (ID: {media_id}) nach S3 fehlgeschlagen.")
+        return None
+    if ingest_result.get('rejected'):
+        return ingest_result
+
+    image_info = {
+        'media_id': media_id,
+        'media_type': media_type,
+        's3_key': ingest_result['s3_key'], # Key in der Ablage (S3 oder lokal, siehe 'storage')
+        'storage': STORAGE_BACKEND,
+        'hashtag_source': hashtag_source,
+        'permalink': media_item.get('permalink', ''),
+        'caption': media_item.get('caption', ''),
+        'media_url_original': media_url,
+        'download_timestamp_utc': get_utc_timestamp(),
+        'platform': 'instagram',
+        'is_hashtag_result': is_hashtag_result,
+        'content_sha256': ingest_result['content_sha256']
+    }
+    if STORAGE_BACKEND != 'local':
+        image_info['s3_bucket'] = S3_BUCKET_NAME
+    if ingest_result.get('phash'):
+        image_info['phash'] = ingest_result['phash']
+    if ingest_result.get('derivatives'):
+        image_info['derivatives'] = ingest_result['derivatives']
+    if ingest_result.get('duplicate_of'):
+        image_info['duplicate_of'] = ingest_result['duplicate_of']
+    if ingest_result.get('size_bytes'):
+        image_info['size_bytes'] = ingest_result['size_bytes']
+    if media_item.get('parent_id'):
+        image_info['parent_id'] = media_item['parent_id'] # Album, zu dem das Medium gehört
+    return image_info
+
+
+def _notify_image_stored(on_image_stored, stored_images):
+    # Rückmeldung an Aufrufer (z.B. Job-Stream im Web-Frontend); Fehler dort brechen den Crawl nicht ab
+    if not on_image_stored:
+        return
+    for stored_info in stored_images:
+        try:
+            on_image_stored(stored_info)
+        except Exception as e:
+            logging.error(f"    Fehler im Callback für gespeichertes Bild {stored_info.get('media_id')}: {e}")
+
+
+def _flush_metadata(writer, flush_all=False, image_info=None):
+    # Schreibt gepufferte Metadaten; bei Fehlern gehen nur die Items dieses Batches verloren
+    try:
+        stored = writer.add(image_info) if image_info else []
+        if flush_all:
+            stored += writer.flush()
+    except ClientError as e_db_put:
+        metrics.count_error('dynamodb', e_db_put)
+        logging.error(f"    Fehler beim Speichern eines Metadaten-Batches in DynamoDB: {e_db_put}")
+        return []
+    for stored_info in stored:
+        logging.info(f"    Metadaten für Bild {stored_info['media_id']} in DynamoDB gespeichert.")
+    return stored
+
+
+def _crawl_media_items(media_pages, filename_prefix, hashtag_source, is_hashtag_result, max_workers=None, stats=None, on_image_stored=None):
+    """
+    Nebenläufige Pipeline für Seiten von API-Medienelementen. `media_pages` darf ein
+    Generator sein (z.B. iter_graph_pages); Downloads starten bereits, während
+    weitere Seiten noch abgerufen werden.
+
+    Stufe 1: Duplikatprüfung per BatchGetItem (eine Anfrage pro API-Seite).
+    Stufe 2 (Download-Worker): Download, Konvertierung (im Transkodier-Pool), S3-Upload. Die Anzahl
+    gleichzeitig laufender Aufgaben ist begrenzt, sodass neue Elemente erst
+    nachgezogen werden, wenn Platz frei wird (Backpressure).
+    Stufe 3: Gepuffertes Speichern der Metadaten per BatchWriteItem; nach jedem
+    gespeicherten Batch wird die Galerie-Version des Hashtags erhöht und
+    `on_image_stored(image_info)` für jedes gespeicherte Bild aufgerufen.
+    Fehler betreffen nur das jeweilige Element bzw. den jeweiligen Batch.
+    Gibt die neu gespeicherten `image_info` Dicts in API-Reihenfolge zurück.
+    """
+    # Mit Transkodier-Pool mindestens zwei I/O-Worker je Prozess, damit alle Kerne Arbeit bekommen
+    max_workers = max_workers or max(CRAWLER_MAX_WORKERS, CRAWLER_TRANSCODE_PROCESSES * 2)
+    stats = stats if stats is not None else {}
+    writer = BatchMetadataWriter(get_dynamodb_resource(), DYNAMODB_CRAWLEDMEDIA_TABLE_NAME, 'media_id', max_delay_seconds=CRAWLER_METADATA_FLUSH_SECONDS)
+    stored_images = []
+    rejected_items = 0
+
+    ingested = bounded_map(
+        isolated(lambda item: _ingest_media_item(item, filename_prefix, hashtag_source, is_hashtag_result), "Medienelement"),
+        _filter_new_media_items(media_pages, stats),
+        max_workers=max_workers,
+        max_in_flight=max_workers * CRAWLER_QUEUE_FACTOR
+    )
+    for image_info in ingested:
+        if image_info and image_info.get('rejected'):
+            rejected_items += 1
+            continue
+        if image_info:
+            stored = _flush_metadata(writer, image_info=image_info)
+            if stored:
+                stored_images.extend(stored)
+                bump_gallery_version(hashtag_source)
+                _notify_image_stored(on_image_stored, stored)
+    stored = _flush_metadata(writer, flush_all=True)
+    if stored:
+        stored_images.extend(stored)
+        bump_gallery_version(hashtag_source)
+        _notify_image_stored(on_image_stored, stored)
+    # Vorübergehend fehlgeschlagene Elemente verhindern, dass die High-Water-Mark vorrückt;
+    # endgültig verworfene (zu groß, gelöscht, nicht dekodierbar) würden sonst jeden Lauf blockieren
+    stats['stored_items'] = len(stored_images)
+    stats['rejected_items'] = rejected_items
+    stats['failed_items'] = stats.get('new_items', 0) - len(stored_images) - rejected_items
+    return stored_images
+
+
+def process_media(access_token, user_id_of_account_owner, limit=25, max_pages=None, time_budget_seconds=None, max_workers=None, on_image_stored=None, incremental=True, stats=None):
+    """
+    Crawlt die eigenen Medien eines Kontos. Mit `incremental` endet die Paginierung an
+    der High-Water-Mark des letzten Laufs (CrawlTasks-Eintrag 'user:<id>').
+    Ein übergebenes `stats`-Dict wird mit der Crawl-Statistik gefüllt (crawl_failure_reason).
+    """
+    crawl_stats = stats if stats is not None else {}
+    logging.info(f"Starte Verarbeitung eigener Medien für User-ID: {user_id_of_account_owner}")
+    if not get_crawled_media_table():
+        logging.error("DynamoDB 'CrawledMedia' Tabelle nicht initialisiert. Verarbeitung eigener Medien nicht möglich.")
+        crawl_stats['failure'] = "DynamoDB-Tabelle 'CrawledMedia' nicht initialisiert"
+        return []
+
+    crawl_task_term = user_crawl_task_term(user_id_of_account_owner)
+    stop_when = high_water_stop_predicate(get_crawl_state(crawl_task_term)) if incremental else None
+    media_pages = iter_user_media_pages(access_token, user_id_of_account_owner, limit, max_pages, time_budget_seconds, stop_when=stop_when, state=crawl_stats)
+    processed_own_images = _crawl_media_items(
+        media_pages,
+        filename_prefix=f"user_{user_id_of_account_owner}",
+        hashtag_source='__USER_MEDIA__', # Kennzeichnung
+        is_hashtag_result=False,
+        max_workers=max_workers,
+        stats=crawl_stats,
+        on_image_stored=on_image_stored
+    )
+    logging.info(f"Verarbeitung eigener Medien abgeschlossen. {len(processed_own_images)} neue Bilder von {crawl_stats.get('api_items', 0)} API-Elementen verarbeitet.")
+    record_crawl_state(crawl_task_term, crawl_stats, len(processed_own_images))
     return processed_own_images
 
 
+def _search_hashtag_id(access_token, user_id_making_request, clean_hashtag_name):
+    # Echte Suche über ig_hashtag_search; verbraucht Kontingent. Wirft bei HTTP-Fehlern.
+    _attach_governor_store()
+    url = f"{API_BASE_URL}ig_hashtag_search?user_id={user_id_making_request}&q={clean_hashtag_name}&access_token={access_token}"
+    response = http_get(url)
+    response.raise_for_status()
+    data = response.json()
+    if data.get('data') and data['data']:
+        return data['data'][0]['id']
+    return None
+
+
 def get_hashtag_id(access_token, user_id_making_request, hashtag_name):
-    # (Funktion bleibt im Wesentlichen gleich wie zuvor)
+    # Hashtag-IDs ändern sich nie; Ergebnisse (auch negative) werden zweistufig gecacht
     clean_hashtag_name = hashtag_name.strip().lstrip('#')
     if not clean_hashtag_name: return None
-    url = f"{API_BASE_URL}ig_hashtag_search?user_id={user_id_making_request}&q={clean_hashtag_name}&access_token={access_token}"
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        if data.get('data') and data['data']:
-            return data['data'][0]['id']
-    except Exception as e:
-        logging.error(f"Fehler bei get_hashtag_id für '{clean_hashtag_name}': {e}")
-    return None
+    return get_hashtag_id_cache().resolve(
+        clean_hashtag_name,
+        lambda name: _search_hashtag_id(access_token, user_id_making_request, name)
+    )
+
+def iter_hashtag_media_pages(access_token, user_id_making_request, hashtag_id, search_type="recent_media", limit=7, max_pages=None, time_budget_seconds=None, stop_when=None, state=None):
+    page_size = min(limit, GRAPH_MAX_PAGE_SIZE) if limit else GRAPH_MAX_PAGE_SIZE
+    url = f"{API_BASE_URL}{hashtag_id}/{search_type}?user_id={user_id_making_request}&fields={MEDIA_FIELDS}&limit={page_size}&access_token={access_token}"
+    return iter_graph_pages(url, limit, max_pages, time_budget_seconds, description=f"Hashtag-ID {hashtag_id} ({search_type})", stop_when=stop_when, state=state)
+
 
 def get_media_for_hashtag(access_token, user_id_making_request, hashtag_id, search_type="recent_media", limit=7):
-    # (Funktion bleibt im Wesentlichen gleich wie zuvor)
-    fields = "id,caption,media_type,media_url,permalink,timestamp"
-    url = f"{API_BASE_URL}{hashtag_id}/{search_type}?user_id={user_id_making_request}&fields={fields}&limit={limit}&access_token={access_token}"
-    try:
-        response = requests.get(url, timeout=20)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        logging.error(f"Fehler bei get_media_for_hashtag für ID '{hashtag_id}': {e}")
-    return None
+    # Sammelt bis zu `limit` Elemente über alle Seiten; für große Mengen iter_hashtag_media_pages verwenden
+    items = [item for page in iter_hashtag_media_pages(access_token, user_id_making_request, hashtag_id, search_type, limit) for item in page]
+    return {'data': items}
 
 
-def search_media_by_hashtag(access_token, user_id_for_api_calls, hashtag_query, search_type="recent_media", limit_per_hashtag=7):
+def search_media_by_hashtag(access_token, user_id_for_api_calls, hashtag_query, search_type="recent_media", limit_per_hashtag=7, max_pages=None, time_budget_seconds=None, max_workers=None, on_image_stored=None, incremental=True, stats=None):
+    """
+    Crawlt die neuesten Medien eines Hashtags. Mit `incremental` endet die Paginierung an
+    der High-Water-Mark des letzten Laufs, sodass Wiederholungen nur neue Inhalte kosten.
+    Ein übergebenes `stats`-Dict wird mit der Crawl-Statistik gefüllt; ob der Crawl
+    wiederholt werden sollte, entscheidet crawl_failure_reason(stats).
+    """
+    crawl_stats = stats if stats is not None else {}
     logging.info(f"Starte Hashtag-Suche für: '{hashtag_query}', Typ: {search_type}, Limit: {limit_per_hashtag}")
-    if not crawled_media_table:
+    if not get_crawled_media_table():
         logging.error("DynamoDB 'CrawledMedia' Tabelle nicht initialisiert. Hashtag-Suche nicht möglich.")
+        crawl_stats['failure'] = "DynamoDB-Tabelle 'CrawledMedia' nicht initialisiert"
         return []
 
     clean_hashtag_query = hashtag_query.strip().lstrip('#')
-    if not clean_hashtag_query: return []
+    if not clean_hashtag_query:
+        crawl_stats['failure'] = "leerer Hashtag"
+        return []
 
     hashtag_id = get_hashtag_id(access_token, user_id_for_api_calls, clean_hashtag_query)
-    if not hashtag_id: return []
-
-    media_api_data = get_media_for_hashtag(access_token, user_id_for_api_calls, hashtag_id, search_type, limit_per_hashtag)
-    processed_images = [] # Bilder, die in DIESEM Durchlauf neu verarbeitet wurden
+    if not hashtag_id:
+        # Ungültiger Hashtag, erschöpftes Kontingent oder API-Fehler bei ig_hashtag_search
+        crawl_stats['failure'] = f"Hashtag-ID für '{clean_hashtag_query}' nicht auflösbar"
+        return []
 
-    if media_api_data and media_api_data.get('data'):
-        total_items_from_api = len(media_api_data['data'])
-        logging.info(f"API lieferte {total_items_from_api} Medienelemente für Hashtag '{clean_hashtag_query}' (ID: {hashtag_id}).")
-        
-        newly_processed_image_count = 0
-        for i, media_item in enumerate(media_api_data['data']):
-            media_id = media_item.get('id')
-            media_type = media_item.get('media_type')
-            logging.info(f"  [Item {i+1}/{total_items_from_api}] ID: {media_id}, Typ: {media_type}")
-
-            if media_type == 'IMAGE':
-                # Prüfen, ob Bild schon in DynamoDB ist
-                try:
-                    response = crawled_media_table.get_item(Key={'media_id': media_id})
-                    if 'Item' in response:
-                        logging.info(f"    Bild {media_id} bereits in DynamoDB. Überspringe Download/Upload.")
-                        # Optional: Bestehendes Item zur Rückgabeliste hinzufügen, wenn app.py alle bekannten anzeigen soll
-                        # processed_images.append(response['Item'])
-                        continue 
-                except ClientError as e_db:
-                    logging.error(f"    Fehler beim Prüfen von media_id {media_id} in DynamoDB: {e_db}. Verarbeite trotzdem (potenzielles Duplikat).")
-
-                media_url = media_item.get('media_url')
-                if not media_url: continue
-
-                filename_base_for_s3 = f"hashtag_{clean_hashtag_query}_{media_id}"
-                s3_object_key = download_image_to_s3(media_url, filename_base_for_s3)
-
-                if s3_object_key:
-                    newly_processed_image_count +=1
-                    image_info = {
-                        'media_id': media_id,
-                        's3_key': s3_object_key,
-                        's3_bucket': S3_BUCKET_NAME,
-                        'hashtag_source': clean_hashtag_query,
-                        'permalink': media_item.get('permalink', ''),
-                        'caption': media_item.get('caption', ''),
-                        'media_url_original': media_url,
-                        'download_timestamp_utc': get_utc_timestamp(),
-                        'platform': 'instagram',
-                        'is_hashtag_result': True
-                    }
-                    try:
-                        crawled_media_table.put_item(Item=image_info)
-                        logging.info(f"    Metadaten für Bild {media_id} in DynamoDB gespeichert.")
-                        processed_images.append(image_info) # Nur neu verarbeitete zur Liste hinzufügen
-                    except ClientError as e_db_put:
-                        logging.error(f"    Fehler beim Speichern von Metadaten für {media_id} in DynamoDB: {e_db_put}")
-                else:
-                    logging.warning(f"    Hochladen des IMAGE (ID: {media_id}) nach S3 fehlgeschlagen.")
-            # ... (andere Medientypen)
-        logging.info(f"Hashtag-Suche abgeschlossen. {newly_processed_image_count} NEUE Bilder von {total_items_from_api} API-Elementen für '{clean_hashtag_query}' verarbeitet und in DynamoDB gespeichert.")
-    # ... (Fehlerbehandlung für media_api_data)
+    # Nur recent_media ist chronologisch sortiert; top_media wird immer vollständig gelesen
+    chronological = search_type == "recent_media"
+    stop_when = high_water_stop_predicate(get_crawl_state(clean_hashtag_query)) if incremental and chronological else None
+    media_pages = iter_hashtag_media_pages(access_token, user_id_for_api_calls, hashtag_id, search_type, limit_per_hashtag, max_pages, time_budget_seconds, stop_when=stop_when, state=crawl_stats)
+    # Bilder, die in DIESEM Durchlauf neu verarbeitet wurden
+    processed_images = _crawl_media_items(
+        media_pages,
+        filename_prefix=f"hashtag_{clean_hashtag_query}",
+        hashtag_source=clean_hashtag_query,
+        is_hashtag_result=True,
+        max_workers=max_workers,
+        stats=crawl_stats,
+        on_image_stored=on_image_stored
+    )
+    logging.info(f"Hashtag-Suche abgeschlossen. {len(processed_images)} NEUE Bilder von {crawl_stats.get('api_items', 0)} API-Elementen für '{clean_hashtag_query}' (ID: {hashtag_id}) verarbeitet und in DynamoDB gespeichert.")
     
-    # Optional: Update CrawlTasks table
-    # if crawl_tasks_table and DYNAMODB_CRAWLTASKS_TABLE_NAME:
-    # try:
-    # crawl_tasks_table.update_item(
-    # Key={'search_term': clean_hashtag_query, 'platform': 'instagram'}, # Falls platform Teil des Keys ist
-    # UpdateExpression="set #s = :status, last_completed_timestamp_utc = :ts",
-    # ExpressionAttributeNames={'#s': 'status'},
-    # ExpressionAttributeValues={':status': 'completed', ':ts': get_utc_timestamp()}
-    # )
-    # logging.info(f"CrawlTask für '{clean_hashtag_query}' als 'completed' markiert.")
-    # except ClientError as e_task:
-    # logging.error(f"Fehler beim Aktualisieren von CrawlTask für '{clean_hashtag_query}': {e_task}")
-            
+    record_crawl_state(clean_hashtag_query, crawl_stats, len(processed_images), update_high_water=chronological)
+
     return processed_images # Gibt nur die in DIESEM Durchlauf neu verarbeiteten Bilder zurück
 
 if __name__ == '__main__':
@@ -1,7 +1,15 @@
-import requests
 import json
 
+_creds = None
+
 def getCreds():
+    # Konfiguration nur einmal pro Prozess aufbauen; jeder Aufrufer erhält eine eigene Kopie
+    global _creds
+    if _creds is None:
+        _creds = buildCreds()
+    return dict(_creds)
+
+def buildCreds():
     creds = dict()
     creds['access_token'] = 'EAAULuwLl9tIBO83W0KqFIlxTTChEUiBcod2JQjZBcm1gHZCOzZAoULU4xZAVU8Go7Degn0GGyDznuUyLkqeWiBxwjgWZA2sqj6rFaSlZC4Xig7sl8ZBsJf13oMzdZBKvLsTOpdEyGYLMnCJmLTSub94mp5G8zwgsDTtD1yZCrdr2pPGj1XjRk7ilmSn78dKZBL2IGNQ27vspyCl1pPF7VOT9BAHw4K5DV8oU7UWKIZD'
     creds['client_id'] = '1420272718968530'
@@ -23,7 +31,8 @@ def getCreds():
     return creds
 
 def makeApiCall(url, endpointParams, debug = 'no'):
-    data = requests.get(url, endpointParams)
+    from http_client import http_get # Verzögerter Import: http_client liest selbst getCreds()
+    data = http_get(url, endpointParams)
 
     response = dict()
     response['url'] = url
@@ -0,0 +1,116 @@
+# dynamo_batch.py
+# Gebündelte DynamoDB-Zugriffe (BatchGetItem / BatchWriteItem) für den Crawler.
+import logging
+import random
+import time
+
+from metrics import metrics
+
+BATCH_GET_MAX_KEYS = 100 # Limit von BatchGetItem pro Aufruf
+BATCH_WRITE_MAX_ITEMS = 25 # Limit von BatchWriteItem pro Aufruf
+
+
+def _backoff_sleep(attempt, base_delay=0.05, max_delay=2.0):
+    # Exponentieller Backoff mit Jitter, wie von AWS für Unprocessed* empfohlen
+    time.sleep(random.uniform(0, min(max_delay, base_delay * (2 ** attempt))))
+
+
+def batch_get_existing_keys(dynamodb_resource, table_name, key_name, key_values, max_attempts=5):
+    """
+    Prüft mit BatchGetItem, welche der übergebenen Schlüssel bereits in der Tabelle existieren.
+    Die Schlüssel werden in Blöcke zu 100 aufgeteilt, `UnprocessedKeys` werden mit
+    Backoff erneut angefragt. Gibt ein Set der vorhandenen Schlüsselwerte zurück.
+    Schlüssel, die auch nach `max_attempts` Versuchen unbearbeitet bleiben, gelten als nicht vorhanden.
+    """
+    unique_values = list(dict.fromkeys(v for v in key_values if v))
+    existing = set()
+
+    for start in range(0, len(unique_values), BATCH_GET_MAX_KEYS):
+        chunk = unique_values[start:start + BATCH_GET_MAX_KEYS]
+        request_items = {
+            table_name: {
+                'Keys': [{key_name: value} for value in chunk],
+                'ProjectionExpression': '#k',
+                'ExpressionAttributeNames': {'#k': key_name}
+            }
+        }
+        attempt = 0
+        while request_items:
+            with metrics.timed('dynamodb_seconds', operation='batch_get'):
+                response = dynamodb_resource.batch_get_item(RequestItems=request_items)
+            metrics.increment('dynamodb_items_total', len(request_items.get(table_name, {}).get('Keys', [])), operation='batch_get')
+            for item in response.get('Responses', {}).get(table_name, []):
+                existing.add(item[key_name])
+
+            request_items = response.get('UnprocessedKeys') or {}
+            if request_items:
+                attempt += 1
+                if attempt >= max_attempts:
+                    unprocessed_count = len(request_items.get(table_name, {}).get('Keys', []))
+                    logging.warning(f"BatchGetItem: {unprocessed_count} Schlüssel nach {attempt} Versuchen unbearbeitet. Behandle sie als neu.")
+                    break
+                _backoff_sleep(attempt)
+    return existing
+
+
+class BatchMetadataWriter:
+    """
+    Gepufferter Writer für BatchWriteItem.
+
+    `add()` sammelt Items und schreibt sie in Blöcken zu 25. Mit `max_delay_seconds`
+    wird zusätzlich geschrieben, sobald seit dem letzten Schreiben so viel Zeit vergangen
+    ist (das erste Item also sofort), damit Ergebnisse nicht auf volle Blöcke warten.
+    Nicht verarbeitete Items
+    (`UnprocessedItems`) werden mit Backoff erneut gesendet. Beide Methoden geben die
+    Items zurück, deren Schreibvorgang bestätigt wurde, damit der Aufrufer nur
+    tatsächlich gespeicherte Elemente meldet.
+    """
+
+    def __init__(self, dynamodb_resource, table_name, key_name='media_id', batch_size=BATCH_WRITE_MAX_ITEMS, max_attempts=5, max_delay_seconds=None):
+        self.dynamodb_resource = dynamodb_resource
+        self.table_name = table_name
+        self.key_name = key_name
+        self.batch_size = max(1, min(batch_size, BATCH_WRITE_MAX_ITEMS))
+        self.max_attempts = max_attempts
+        self._buffer = {} # key -> item; doppelte Schlüssel im selben Batch lehnt DynamoDB ab
+        self.max_delay_seconds = max_delay_seconds
+        self._last_flush_at = 0.0
+
+    def add(self, item):
+        self._buffer[item[self.key_name]] = item
+        if len(self._buffer) >= self.batch_size:
+            return self.flush()
+        if self.max_delay_seconds is not None and time.time() - self._last_flush_at >= self.max_delay_seconds:
+            return self.flush()
+        return []
+
+    def flush(self):
+        if not self._buffer:
+            return []
+        pending = self._buffer
+        self._buffer = {}
+        self._last_flush_at = time.time()
+
+        request_items = {
+            self.table_name: [{'PutRequest': {'Item': item}} for item in pending.values()]
+        }
+        attempt = 0
+        while request_items:
+            with metrics.timed('dynamodb_seconds', operation='batch_write'):
+                response = self.dynamodb_resource.batch_write_item(RequestItems=request_items)
+            metrics.increment('dynamodb_items_total', len(request_items.get(self.table_name, [])), operation='batch_write')
+            request_items = response.get('UnprocessedItems') or {}
+            if request_items:
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    break
+                _backoff_sleep(attempt)
+
+        failed_keys = {
+            request['PutRequest']['Item'][self.key_name]
+            for request in request_items.get(self.table_name, [])
+        }
+        if failed_keys:
+            metrics.increment('dynamodb_unprocessed_items_total', len(failed_keys), operation='batch_write')
+            logging.error(f"BatchWriteItem: {len(failed_keys)} Items nach {attempt} Versuchen nicht gespeichert: {sorted(failed_keys)}")
+        return [item for key, item in pending.items() if key not in failed_keys]
@@ -0,0 +1,104 @@
+# gallery_cache.py
+# Antwort-Cache für /api/gallery mit ETags. Grundlage ist eine Versionsnummer pro
+# Hashtag, die der Crawler bei jedem neu gespeicherten Batch erhöht
+# (crawler.bump_gallery_version). Solange sich die Version nicht ändert, werden
+# Antworten aus dem Speicher bedient bzw. mit 304 beantwortet.
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+
+class GalleryResponseCache:
+    """
+    - `version_source(hashtag)` liefert die gemeinsame Version (z.B. aus DynamoDB); sie wird
+      pro Hashtag höchstens alle `version_check_interval_seconds` abgefragt. Dazwischen
+      können bedingte Anfragen ohne jeden Datenbankzugriff beantwortet werden.
+    - `notify_version()` wird bei Crawls im selben Prozess aufgerufen und invalidiert sofort.
+    - Der ETag enthält zusätzlich ein Zeitfenster von `ttl_seconds`, damit Clients keine
+      Antworten mit abgelaufenen Presigned URLs weiterverwenden.
+    - Versionen werden für höchstens `max_entries` Hashtags gehalten (LRU). Lokale Änderungen
+      erhalten eine prozessweit fortlaufende Nummer; ein verdrängter Hashtag startet mit dem
+      aktuellen Zählerstand, sodass nie eine ältere Version (und damit ein alter ETag) zurückkehrt.
+    """
+
+    def __init__(self, version_source, max_entries=256, ttl_seconds=300, version_check_interval_seconds=5):
+        self.version_source = version_source
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version_check_interval_seconds = version_check_interval_seconds
+        self._versions = OrderedDict() # hashtag -> (gemeinsame Version oder None, geprüft um, lokale Änderung)
+        self._bump_counter = 0 # Fortlaufende Nummer lokaler Änderungen über alle Hashtags
+        self._responses = OrderedDict() # (hashtag, variante) -> (etag, body)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def current_version(self, hashtag):
+        now = time.time()
+        with self._lock:
+            entry = self._versions.get(hashtag)
+            if entry is not None and entry[0] is not None and now - entry[1] < self.version_check_interval_seconds:
+                self._versions.move_to_end(hashtag)
+                return f"{entry[0]}.{entry[2]}"
+        try:
+            shared_version = self.version_source(hashtag)
+        except Exception as e:
+            logging.error(f"Galerie-Cache: Version für '{hashtag}' nicht lesbar: {e}")
+            shared_version = f"unbekannt-{int(now)}" # Kein Cache-Treffer möglich
+        with self._lock:
+            entry = self._versions.get(hashtag)
+            local_bump = entry[2] if entry is not None else self._bump_counter
+            self._store_version(hashtag, shared_version, now, local_bump)
+            return f"{shared_version}.{local_bump}"
+
+    def notify_version(self, hashtag, shared_version=None):
+        # Ohne gemeinsame Version wird sie beim nächsten Zugriff neu gelesen
+        with self._lock:
+            self._bump_counter += 1
+            self._store_version(hashtag, shared_version, time.time(), self._bump_counter)
+
+    def _store_version(self, hashtag, shared_version, checked_at, local_bump):
+        self._versions[hashtag] = (shared_version, checked_at, local_bump)
+        self._versions.move_to_end(hashtag)
+        while len(self._versions) > self.max_entries:
+            self._versions.popitem(last=False)
+
+    def etag(self, hashtag, variant, version):
+        time_window = int(time.time() // self.ttl_seconds)
+        digest = hashlib.sha1(f"{hashtag}|{variant}|{version}|{time_window}".encode('utf-8')).hexdigest()
+        return digest[:20]
+
+    def get(self, hashtag, variant, etag):
+        with self._lock:
+            entry = self._responses.get((hashtag, variant))
+            if entry is not None and entry[0] == etag:
+                self._responses.move_to_end((hashtag, variant))
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        return None
+
+    def put(self, hashtag, variant, etag, body):
+        with self._lock:
+            self._responses[(hashtag, variant)] = (etag, body)
+            self._responses.move_to_end((hashtag, variant))
+            while len(self._responses) > self.max_entries:
+                self._responses.popitem(last=False)
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._responses),
+                'max_entries': self.max_entries,
+                'tracked_hashtags': len(self._versions),
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+            }
@@ -0,0 +1,256 @@
+# hashtag_cache.py
+# Zweistufiger Cache für Hashtag-ID-Auflösungen (ig_hashtag_search).
+# Stufe 1: LRU im Prozess. Stufe 2: gemeinsamer persistenter Speicher
+# (DynamoDB-Tabelle oder lokale SQLite-Datei). Zusätzlich wird das
+# Instagram-Kontingent von 30 verschiedenen Hashtags pro 7 Tage mitgezählt.
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+DAY_SECONDS = 24 * 60 * 60
+
+
+class MemoryHashtagStore:
+    """Speicher nur im Prozess; Fallback, wenn kein persistenter Speicher konfiguriert ist."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, hashtag):
+        with self._lock:
+            entry = self._entries.get(hashtag)
+            if entry and 'expires_at' in entry:
+                return entry.get('hashtag_id'), entry['expires_at']
+        return None
+
+    def put(self, hashtag, hashtag_id, expires_at):
+        with self._lock:
+            entry = self._entries.setdefault(hashtag, {})
+            entry['hashtag_id'] = hashtag_id
+            entry['expires_at'] = expires_at
+
+    def record_lookup(self, hashtag, timestamp):
+        with self._lock:
+            self._entries.setdefault(hashtag, {})['last_lookup_at'] = timestamp
+
+    def lookups_since(self, since):
+        with self._lock:
+            return {h for h, e in self._entries.items() if e.get('last_lookup_at', 0) >= since}
+
+
+class SqliteHashtagStore:
+    """Persistenter Speicher in einer lokalen SQLite-Datei (z.B. für Offline-Betrieb oder EC2)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS hashtag_ids ("
+                "hashtag TEXT PRIMARY KEY, hashtag_id TEXT, expires_at REAL, last_lookup_at REAL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, hashtag):
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT hashtag_id, expires_at FROM hashtag_ids WHERE hashtag = ? AND expires_at IS NOT NULL",
+                (hashtag,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put(self, hashtag, hashtag_id, expires_at):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO hashtag_ids (hashtag, hashtag_id, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(hashtag) DO UPDATE SET hashtag_id = excluded.hashtag_id, expires_at = excluded.expires_at",
+                (hashtag, hashtag_id, expires_at)
+            )
+
+    def record_lookup(self, hashtag, timestamp):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO hashtag_ids (hashtag, last_lookup_at) VALUES (?, ?) "
+                "ON CONFLICT(hashtag) DO UPDATE SET last_lookup_at = excluded.last_lookup_at",
+                (hashtag, timestamp)
+            )
+
+    def lookups_since(self, since):
+        with self._lock, self._connect() as conn:
+            rows = conn.execute("SELECT hashtag FROM hashtag_ids WHERE last_lookup_at >= ?", (since,)).fetchall()
+        return {row[0] for row in rows}
+
+
+class DynamoHashtagStore:
+    """
+    Gemeinsamer Speicher in einer DynamoDB-Tabelle mit Partition Key 'hashtag' (String).
+    Wird von allen Lambda-Instanzen und Flask-Workern geteilt.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def get(self, hashtag):
+        response = self.table.get_item(Key={'hashtag': hashtag})
+        item = response.get('Item')
+        if not item or 'expires_at' not in item:
+            return None
+        return item.get('hashtag_id'), float(item['expires_at'])
+
+    def put(self, hashtag, hashtag_id, expires_at):
+        update_expression = "SET expires_at = :exp"
+        values = {':exp': Decimal(str(int(expires_at)))}
+        if hashtag_id:
+            update_expression += ", hashtag_id = :id"
+            values[':id'] = hashtag_id
+        else:
+            update_expression += " REMOVE hashtag_id" # Negativ-Eintrag
+        self.table.update_item(
+            Key={'hashtag': hashtag},
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=values
+        )
+
+    def record_lookup(self, hashtag, timestamp):
+        self.table.update_item(
+            Key={'hashtag': hashtag},
+            UpdateExpression="SET last_lookup_at = :ts",
+            ExpressionAttributeValues={':ts': Decimal(str(int(timestamp)))}
+        )
+
+    def lookups_since(self, since):
+        # Die Tabelle enthält nur so viele Einträge wie je abgefragte Hashtags
+        # (max. 30 pro Woche), ein Scan bleibt daher klein.
+        from boto3.dynamodb.conditions import Attr
+        scan_kwargs = {
+            'FilterExpression': Attr('last_lookup_at').gte(Decimal(str(int(since)))),
+            'ProjectionExpression': 'hashtag'
+        }
+        hashtags = set()
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            hashtags.update(item['hashtag'] for item in response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return hashtags
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+class HashtagIdCache:
+    """
+    Löst Hashtag-Namen über `lookup_func` auf und speichert das Ergebnis in beiden Stufen.
+
+    - Positive Einträge (ID gefunden) leben `ttl_seconds`, Hashtag-IDs ändern sich nicht.
+    - Negative Einträge (Hashtag existiert nicht) leben `negative_ttl_seconds`.
+    - Fehler von `lookup_func` (Ausnahmen) werden nicht gecacht.
+    - Bevor eine echte Suche ausgeführt wird, wird geprüft, ob sie das Kontingent
+      (`quota_limit` verschiedene Hashtags pro `quota_window_seconds`) überschreiten würde.
+    """
+
+    def __init__(self, store=None, max_entries=1024, ttl_seconds=365 * DAY_SECONDS,
+                 negative_ttl_seconds=DAY_SECONDS, quota_limit=30, quota_window_seconds=7 * DAY_SECONDS):
+        self.store = store or MemoryHashtagStore()
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.quota_limit = quota_limit
+        self.quota_window_seconds = quota_window_seconds
+        self._lru = OrderedDict() # hashtag -> (hashtag_id, expires_at)
+        self._lock = threading.Lock()
+        self._lookup_lock = threading.Lock() # Serialisiert Kontingentprüfung und echte Suchen
+
+    @staticmethod
+    def normalize(hashtag_name):
+        return hashtag_name.strip().lstrip('#').lower()
+
+    def _lru_get(self, hashtag, now):
+        with self._lock:
+            entry = self._lru.get(hashtag)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._lru[hashtag]
+                return None
+            self._lru.move_to_end(hashtag)
+            return entry
+
+    def _lru_put(self, hashtag, hashtag_id, expires_at):
+        with self._lock:
+            self._lru[hashtag] = (hashtag_id, expires_at)
+            self._lru.move_to_end(hashtag)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def _cached(self, hashtag, now):
+        entry = self._lru_get(hashtag, now)
+        if entry is not None:
+            return entry
+        try:
+            entry = self.store.get(hashtag)
+        except Exception as e:
+            logging.error(f"Hashtag-Cache: Fehler beim Lesen des persistenten Speichers für '{hashtag}': {e}")
+            return None
+        if entry is not None and entry[1] > now:
+            self._lru_put(hashtag, entry[0], entry[1])
+            return entry
+        return None
+
+    def quota_used(self, now=None):
+        now = now or time.time()
+        return len(self.store.lookups_since(now - self.quota_window_seconds))
+
+    def quota_remaining(self, now=None):
+        return max(0, self.quota_limit - self.quota_used(now))
+
+    def is_resolved(self, hashtag_name):
+        # True, wenn die ID (oder 'existiert nicht') gecacht ist: ein Crawl kostet dann kein Kontingent
+        return self._cached(self.normalize(hashtag_name), time.time()) is not None
+
+    def resolve(self, hashtag_name, lookup_func):
+        """
+        Gibt die Hashtag-ID zurück (oder None, wenn der Hashtag nicht existiert, das
+        Kontingent erschöpft ist oder die Suche fehlschlug).
+        """
+        hashtag = self.normalize(hashtag_name)
+        if not hashtag:
+            return None
+        now = time.time()
+        entry = self._cached(hashtag, now)
+        if entry is not None:
+            return entry[0]
+
+        with self._lookup_lock:
+            # Ein anderer Thread könnte die ID inzwischen aufgelöst haben
+            entry = self._cached(hashtag, now)
+            if entry is not None:
+                return entry[0]
+
+            try:
+                recent_lookups = self.store.lookups_since(now - self.quota_window_seconds)
+                if hashtag not in recent_lookups and len(recent_lookups) >= self.quota_limit:
+                    logging.error(f"Hashtag-Kontingent erschöpft ({len(recent_lookups)}/{self.quota_limit} in {self.quota_window_seconds // DAY_SECONDS} Tagen). Suche nach '{hashtag}' wird nicht ausgeführt.")
+                    return None
+                # Vor der Suche vermerken, damit parallele Instanzen den Verbrauch sofort sehen
+                self.store.record_lookup(hashtag, now)
+            except Exception as e:
+                logging.error(f"Hashtag-Cache: Kontingent für '{hashtag}' konnte nicht geprüft werden: {e}. Suche wird nicht ausgeführt.")
+                return None
+
+            try:
+                hashtag_id = lookup_func(hashtag)
+            except Exception as e:
+                logging.error(f"Fehler bei der Hashtag-Suche für '{hashtag}': {e}")
+                return None
+
+            expires_at = now + (self.ttl_seconds if hashtag_id else self.negative_ttl_seconds)
+            self._lru_put(hashtag, hashtag_id, expires_at)
+            try:
+                self.store.put(hashtag, hashtag_id, expires_at)
+            except Exception as e:
+                logging.error(f"Hashtag-Cache: Fehler beim Schreiben des persistenten Speichers für '{hashtag}': {e}")
+            return hashtag_id
@@ -0,0 +1,114 @@
+# http_client.py
+# Gemeinsamer HTTP-Client für alle ausgehenden Aufrufe (Graph API und Bild-CDN).
+# Eine Session pro Prozess: Verbindungen bleiben per Keep-Alive offen und werden
+# auch über warme Lambda-Aufrufe hinweg wiederverwendet.
+import logging
+import random
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from defines import getCreds
+from rate_limit import graph_governor
+from metrics import metrics
+
+creds = getCreds()
+HTTP_POOL_CONNECTIONS = int(creds.get('http_pool_connections', 10)) # Anzahl Hosts mit eigenem Pool
+HTTP_POOL_MAXSIZE = int(creds.get('http_pool_maxsize', 32)) # Offene Verbindungen pro Host
+HTTP_RETRY_TOTAL = int(creds.get('http_retry_total', 3))
+HTTP_RETRY_BACKOFF_FACTOR = float(creds.get('http_retry_backoff_factor', 0.5))
+HTTP_RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# (Connect-Timeout, Read-Timeout) pro Host; Schlüssel passen auch auf Subdomains
+HTTP_DEFAULT_TIMEOUT = (3.05, 20)
+GRAPH_API_HOST = (urlsplit(creds.get('graph_domain', 'https://graph.facebook.com/')).hostname or '').lower()
+HTTP_HOST_TIMEOUTS = creds.get('http_host_timeouts', {
+    'graph.facebook.com': (3.05, 20),
+    'cdninstagram.com': (3.05, 10),
+    'fbcdn.net': (3.05, 10),
+})
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class JitterRetry(Retry):
+    """Retry mit exponentiellem Backoff und vollem Jitter, damit parallele Worker nicht im Gleichschritt wiederholen."""
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+
+
+def _build_session():
+    retry = JitterRetry(
+        total=HTTP_RETRY_TOTAL,
+        connect=HTTP_RETRY_TOTAL,
+        read=HTTP_RETRY_TOTAL,
+        status=HTTP_RETRY_TOTAL,
+        backoff_factor=HTTP_RETRY_BACKOFF_FACTOR,
+        status_forcelist=HTTP_RETRY_STATUS_CODES,
+        allowed_methods=frozenset(['GET', 'HEAD']), # Nur idempotente Anfragen wiederholen
+        respect_retry_after_header=True,
+        raise_on_status=False # Letzte Antwort zurückgeben; Aufrufer nutzen raise_for_status()
+    )
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Gibt die prozessweite Session zurück und erzeugt sie beim ersten Aufruf."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+                logging.info(f"HTTP-Session initialisiert (Pool: {HTTP_POOL_CONNECTIONS} Hosts x {HTTP_POOL_MAXSIZE} Verbindungen, Retries: {HTTP_RETRY_TOTAL}).")
+    return _session
+
+
+def timeout_for(url):
+    host = (urlsplit(url).hostname or '').lower()
+    for host_suffix, timeout in HTTP_HOST_TIMEOUTS.items():
+        if host == host_suffix or host.endswith('.' + host_suffix):
+            return tuple(timeout) if isinstance(timeout, (list, tuple)) else timeout
+    return HTTP_DEFAULT_TIMEOUT
+
+
+def _graph_error_code(response):
+    if response.status_code < 400:
+        return None
+    try:
+        return (response.json().get('error') or {}).get('code')
+    except ValueError:
+        return None
+
+
+def http_get(url, params=None, stream=False, timeout=None, **kwargs):
+    """
+    GET über die gemeinsame Session. Ohne explizites `timeout` wird das für den Host
+    konfigurierte (Connect, Read)-Timeout verwendet. Transiente Fehler (Verbindungsfehler,
+    429, 5xx) werden mit Backoff automatisch wiederholt. Anfragen an die Graph API
+    laufen über den Rate-Limit-Governor, der die Usage-Header jeder Antwort auswertet.
+    """
+    is_graph_api = (urlsplit(url).hostname or '').lower() == GRAPH_API_HOST
+    target = 'graph' if is_graph_api else 'cdn'
+    if is_graph_api:
+        graph_governor.acquire()
+    try:
+        # Bei stream=True nur bis zu den Headern; den Body misst der Aufrufer
+        with metrics.timed('http_request_seconds', target=target):
+            response = get_session().get(url, params=params, stream=stream, timeout=timeout or timeout_for(url), **kwargs)
+    except requests.exceptions.RequestException as e:
+        metrics.count_error(f"http_{target}", e)
+        raise
+    if response.status_code >= 400:
+        metrics.increment('http_error_responses_total', target=target, status=response.status_code)
+    if is_graph_api:
+        graph_governor.observe(response.headers, None if stream else _graph_error_code(response))
+    return response
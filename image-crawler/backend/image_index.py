@@ -0,0 +1,213 @@
+# image_index.py
+# Index über Inhalts-Hashes (SHA-256) und Wahrnehmungs-Hashes (dHash) bereits
+# gespeicherter Bilder. Exakte Duplikate werden über den SHA-256 gefunden,
+# Beinahe-Duplikate (Reposts, neu komprimierte Kopien) über die Hamming-Distanz
+# der dHashes mit Hilfe eines BK-Baums.
+import logging
+import threading
+import time
+
+DAY_SECONDS = 24 * 3600
+
+
+def _indexed_day(timestamp):
+    return time.strftime('%Y-%m-%d', time.gmtime(timestamp))
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """BK-Baum für Hamming-Distanzen: Suche im Radius r besucht nur Teilbäume mit |d - r| <= Kantenlänge."""
+
+    def __init__(self):
+        self._root = None # [hash, value, {distanz: kindknoten}]
+        self.size = 0
+
+    def add(self, hash_value, value):
+        node = [hash_value, value, {}]
+        self.size += 1
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming_distance(hash_value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, hash_value, max_distance):
+        """Gibt alle (distanz, value) mit Distanz <= max_distance zurück, aufsteigend sortiert."""
+        if self._root is None:
+            return []
+        results = []
+        candidates = [self._root]
+        while candidates:
+            node = candidates.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= max_distance:
+                results.append((distance, node[1]))
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    candidates.append(child)
+        results.sort(key=lambda result: result[0])
+        return results
+
+
+class DynamoImageHashStore:
+    """
+    Persistente Hash-Einträge in einer DynamoDB-Tabelle mit Partition Key 'content_sha256'.
+    Jeder Eintrag erhält 'indexed_at' (Unix-Sekunden) und 'indexed_day' (YYYY-MM-DD, UTC).
+    Mit einem GSI `time_index_name` (Partition Key 'indexed_day', Sort Key 'indexed_at',
+    Projektion ALL) liest entries_since nur die neuen Einträge per Query; ohne GSI filtert
+    ein Scan sie serverseitig heraus.
+    """
+
+    def __init__(self, table, time_index_name=None):
+        self.table = table
+        self.time_index_name = time_index_name
+
+    def get(self, content_sha256):
+        return self.table.get_item(Key={'content_sha256': content_sha256}).get('Item')
+
+    def put(self, entry):
+        item = dict(entry)
+        item['indexed_at'] = int(item.get('indexed_at') or time.time())
+        item['indexed_day'] = _indexed_day(item['indexed_at'])
+        self.table.put_item(Item=item)
+
+    def _paginate(self, operation, request_kwargs):
+        while True:
+            response = operation(**request_kwargs)
+            yield from response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            request_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def scan_all(self):
+        return self._paginate(self.table.scan, {})
+
+    def entries_since(self, since):
+        """Einträge mit indexed_at >= since (ältere Einträge ohne 'indexed_at' liefert nur scan_all)."""
+        from boto3.dynamodb.conditions import Attr, Key
+        since = int(since)
+        if not self.time_index_name:
+            yield from self._paginate(self.table.scan, {'FilterExpression': Attr('indexed_at').gte(since)})
+            return
+        # Eine Query je Kalendertag seit `since`
+        day_start = since - since % DAY_SECONDS
+        while day_start <= time.time():
+            yield from self._paginate(self.table.query, {
+                'IndexName': self.time_index_name,
+                'KeyConditionExpression': Key('indexed_day').eq(_indexed_day(day_start)) & Key('indexed_at').gte(since)
+            })
+            day_start += DAY_SECONDS
+
+
+class ImageHashIndex:
+    """
+    Duplikat-Index für den Crawler. Einträge sind Dicts mit mindestens
+    'content_sha256', 'phash' (Hex-String) und 's3_key'.
+
+    Ohne `store` lebt der Index nur im Prozess. Mit `store` wird er beim ersten
+    Zugriff vollständig geladen und danach alle `refresh_interval_seconds` um die
+    seither hinzugekommenen Einträge ergänzt (`store.entries_since`), damit auch
+    Einträge anderer Instanzen gefunden werden. `refresh_overlap_seconds` fängt
+    Uhrenabweichungen zwischen den Instanzen ab.
+    """
+
+    def __init__(self, store=None, max_distance=4, refresh_interval_seconds=15 * 60, refresh_overlap_seconds=120):
+        self.store = store
+        self.max_distance = max_distance
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.refresh_overlap_seconds = refresh_overlap_seconds
+        self._by_sha = {}
+        self._tree = BKTree()
+        self._synced_until = None # Startzeit des letzten erfolgreichen Ladevorgangs
+        self._next_refresh = 0.0
+        self._refreshing = False
+        self._initial_load = threading.Event()
+        self._lock = threading.Lock()
+
+    def _add_local(self, entry):
+        if entry['content_sha256'] in self._by_sha:
+            return
+        self._by_sha[entry['content_sha256']] = entry
+        if entry.get('phash'):
+            self._tree.add(int(entry['phash'], 16), entry)
+
+    def _ensure_loaded(self):
+        # Nur ein Thread lädt, und zwar ohne `_lock`: die anderen suchen solange im bisherigen
+        # Stand weiter und warten lediglich auf den allerersten Ladevorgang
+        if not self.store:
+            return
+        with self._lock:
+            due = not self._refreshing and time.time() >= self._next_refresh
+            if due:
+                self._refreshing = True
+            since = self._synced_until
+        if not due:
+            self._initial_load.wait()
+            return
+        started = time.time()
+        try:
+            if since is None:
+                entries = list(self.store.scan_all())
+            else:
+                entries = list(self.store.entries_since(since - self.refresh_overlap_seconds))
+            with self._lock:
+                for entry in entries:
+                    self._add_local(entry)
+                self._synced_until = started
+                total = len(self._by_sha)
+            kind = 'geladen' if since is None else 'aktualisiert'
+            logging.info(f"Bild-Hash-Index {kind}: {len(entries)} Einträge gelesen, {total} gesamt, in {time.time() - started:.2f}s.")
+        except Exception as e:
+            logging.error(f"Bild-Hash-Index konnte nicht geladen werden: {e}")
+        finally:
+            # Auch nach Fehlern erst nach dem Intervall erneut versuchen, sonst liest jeder Aufruf die Tabelle
+            with self._lock:
+                self._refreshing = False
+                self._next_refresh = time.time() + self.refresh_interval_seconds
+            self._initial_load.set()
+
+    def find_exact(self, content_sha256):
+        """Eintrag mit identischem Inhalt (SHA-256) oder None. Benötigt keine Dekodierung."""
+        self._ensure_loaded()
+        with self._lock:
+            entry = self._by_sha.get(content_sha256)
+        if entry is None and self.store:
+            try:
+                entry = self.store.get(content_sha256)
+                if entry:
+                    with self._lock:
+                        self._add_local(entry)
+            except Exception as e:
+                logging.error(f"Bild-Hash-Index: Fehler beim Nachschlagen von {content_sha256}: {e}")
+        return entry
+
+    def find_similar(self, phash):
+        """Ähnlichster Eintrag mit dHash-Distanz <= max_distance oder None."""
+        if not phash or self.max_distance < 0:
+            return None
+        self._ensure_loaded()
+        with self._lock:
+            matches = self._tree.search(int(phash, 16), self.max_distance)
+        return matches[0][1] if matches else None
+
+    def find_duplicate(self, content_sha256, phash=None):
+        """Gibt den Eintrag eines exakten oder ähnlichen bereits gespeicherten Bildes zurück, sonst None."""
+        return self.find_exact(content_sha256) or self.find_similar(phash)
+
+    def add(self, entry):
+        with self._lock:
+            self._add_local(entry)
+        if self.store:
+            try:
+                self.store.put(entry)
+            except Exception as e:
+                logging.error(f"Bild-Hash-Index: Fehler beim Speichern von {entry['content_sha256']}: {e}")
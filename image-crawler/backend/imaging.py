@@ -0,0 +1,176 @@
+# imaging.py
+# Bildverarbeitung für den Ingest: Formaterkennung anhand der ersten Bytes,
+# größenbegrenztes Streaming und Transkodierung nur für Formate, die es brauchen.
+# PIL wird erst bei der ersten Dekodierung importiert (siehe _pil()).
+import hashlib
+import io
+from io import BytesIO
+
+from lazy_init import lazy_import
+
+IMAGE_SNIFF_BYTES = 64 * 1024 # Reicht in der Regel für JPEG/PNG-Header inkl. Abmessungen
+
+
+def _pil():
+    # Gibt die PIL-Module (Image, ImageOps, features) zurück; Import nur beim ersten Aufruf
+    return lazy_import('PIL.Image'), lazy_import('PIL.ImageOps'), lazy_import('PIL.features')
+
+
+class ImageTooLarge(ValueError):
+    """Bild überschreitet die konfigurierte maximale Byte- oder Pixelanzahl."""
+
+
+def sniff_image_format(head):
+    """Erkennt das Bildformat anhand der Magic Bytes. Gibt 'JPEG', 'PNG', 'GIF', 'WEBP' oder None zurück."""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'JPEG'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'GIF'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def read_image_size(head):
+    """
+    Liest die Abmessungen aus dem Dateianfang, ohne Pixeldaten zu dekodieren.
+    Gibt (breite, höhe) oder None zurück, falls der Header nicht vollständig im Anfang liegt.
+    """
+    Image, _, _ = _pil()
+    try:
+        with Image.open(BytesIO(head)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def check_pixel_limit(size, max_pixels):
+    if max_pixels and size[0] * size[1] > max_pixels:
+        raise ImageTooLarge(f"Bild hat {size[0]}x{size[1]} Pixel (Maximum {max_pixels}).")
+
+
+def read_head(chunks, min_bytes=IMAGE_SNIFF_BYTES):
+    """Liest aus einem Chunk-Iterator, bis mindestens `min_bytes` vorliegen oder der Stream endet."""
+    head = bytearray()
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= min_bytes:
+            break
+    return bytes(head)
+
+
+class BoundedStream(io.RawIOBase):
+    """
+    Lesbarer Stream aus bereits gelesenem Anfang (`head`) und den restlichen Chunks
+    einer HTTP-Antwort. Bricht mit ImageTooLarge ab, sobald mehr als `max_bytes`
+    gelesen würden. Es wird nie mehr als ein Chunk im Speicher gehalten.
+    """
+
+    def __init__(self, head, chunks, max_bytes=None):
+        super().__init__()
+        self._pending = memoryview(head)
+        self._chunks = iter(chunks)
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk)
+        count = min(len(buffer), len(self._pending))
+        buffer[:count] = self._pending[:count]
+        self._pending = self._pending[count:]
+        self.bytes_read += count
+        if self.max_bytes and self.bytes_read > self.max_bytes:
+            raise ImageTooLarge(f"Bild ist größer als {self.max_bytes} Bytes.")
+        return count
+
+
+def open_bounded_stream(head, chunks, max_bytes=None, buffer_size=1024 * 1024):
+    # BufferedReader liefert bei read(n) volle n Bytes (außer am Ende), was Multipart-Uploads erwarten
+    return io.BufferedReader(BoundedStream(head, chunks, max_bytes), buffer_size=buffer_size)
+
+
+def copy_with_sha256(source, target, chunk_size=1024 * 1024):
+    """Kopiert `source` nach `target` und berechnet dabei den SHA-256 (Hex). Gibt (hash, bytes) zurück."""
+    digest = hashlib.sha256()
+    total = 0
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+        target.write(chunk)
+        total += len(chunk)
+    return digest.hexdigest(), total
+
+
+def dhash_image(image, hash_size=8):
+    """Differenz-Hash (dHash) eines geöffneten Bildes als Hex-String mit hash_size*hash_size Bits."""
+    Image, _, _ = _pil()
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+def _encode(image, image_format, quality):
+    buffer = BytesIO()
+    if image_format == 'WEBP':
+        image.save(buffer, format='WEBP', quality=quality, method=4)
+    else:
+        image.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def process_image(fileobj, derivative_sizes=(), derivative_formats=('JPEG',), transcode=False,
+                  max_pixels=None, jpeg_quality=90, derivative_quality=82, hash_size=8):
+    """
+    Dekodiert ein Bild genau einmal und erzeugt daraus in einem Durchgang:
+    - 'phash': dHash des Bildes,
+    - 'derivatives': {größe: {format: bytes}} für jede Zielgröße (längste Kante),
+    - 'transcoded': das Original als JPEG (nur wenn `transcode` gesetzt ist, sonst None).
+
+    Muss das Original nicht transkodiert werden, dekodiert `draft` JPEGs direkt in der
+    kleinsten Auflösung, die für das größte Derivat noch reicht. Die Derivate werden
+    kaskadierend vom größten zum kleinsten berechnet (Pillow nutzt dabei reduce()).
+    """
+    Image, ImageOps, features = _pil()
+    sizes = sorted({int(size) for size in derivative_sizes}, reverse=True)
+    formats = [f.upper() for f in derivative_formats if f.upper() != 'WEBP' or features.check('webp')]
+    result = {'phash': None, 'derivatives': {}, 'transcoded': None}
+
+    with Image.open(fileobj) as image:
+        check_pixel_limit(image.size, max_pixels)
+        if not transcode:
+            draft_size = sizes[0] if sizes else hash_size * 8
+            image.draft('RGB', (draft_size, draft_size))
+        image.load()
+
+        result['phash'] = dhash_image(image, hash_size)
+
+        if transcode:
+            original = image if image.mode in ("RGB", "L", "CMYK") else image.convert("RGB")
+            result['transcoded'] = _encode(original, 'JPEG', jpeg_quality)
+
+        if sizes and formats:
+            current = ImageOps.exif_transpose(image)
+            if current.mode not in ("RGB", "L"):
+                current = current.convert("RGB")
+            for size in sizes:
+                current = current.copy() if current is image else current
+                current.thumbnail((size, size), Image.LANCZOS, reducing_gap=2.0)
+                result['derivatives'][size] = {image_format: _encode(current, image_format, derivative_quality) for image_format in formats}
+    return result
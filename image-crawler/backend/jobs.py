@@ -0,0 +1,146 @@
+# jobs.py
+# Hintergrund-Jobs für Suchaufträge aus dem Web-Frontend. Ein Job sammelt seine
+# Ereignisse (z.B. neu gespeicherte Bilder) in einer Liste; Leser (Status-Endpunkt,
+# Server-Sent Events) können ab einer beliebigen Position mitlesen.
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+
+class Job:
+    """Ein Suchauftrag. Ereignisse sind (typ, daten)-Tupel; ihre Position dient als Event-ID."""
+
+    def __init__(self, hashtag, mode, key=None):
+        self.job_id = uuid.uuid4().hex
+        self.hashtag = hashtag
+        self.key = key or hashtag
+        self.mode = mode
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.images_stored = 0
+        self.error = None
+        self._events = []
+        self._condition = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in (JOB_COMPLETED, JOB_FAILED)
+
+    def publish(self, event_type, data):
+        with self._condition:
+            if event_type == 'image':
+                self.images_stored += 1
+            self._events.append((event_type, data))
+            self._condition.notify_all()
+
+    def _set_status(self, status, error=None):
+        with self._condition:
+            self.status = status
+            if status == JOB_RUNNING:
+                self.started_at = time.time()
+            elif status in (JOB_COMPLETED, JOB_FAILED):
+                self.finished_at = time.time()
+                self.error = error
+            self._events.append(('status', self.snapshot(locked=True)))
+            self._condition.notify_all()
+
+    def wait_for_events(self, start_index, timeout):
+        """
+        Wartet bis zu `timeout` Sekunden auf Ereignisse ab Position `start_index`.
+        Gibt (ereignisse, job_beendet) zurück; eine leere Liste bei laufendem Job bedeutet Timeout.
+        """
+        with self._condition:
+            if start_index >= len(self._events) and not self.finished:
+                self._condition.wait(timeout)
+            return self._events[start_index:], self.finished
+
+    def snapshot(self, locked=False):
+        if not locked:
+            with self._condition:
+                return self.snapshot(locked=True)
+        return {
+            'job_id': self.job_id,
+            'hashtag': self.hashtag,
+            'mode': self.mode,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'images_stored': self.images_stored,
+            'event_count': len(self._events),
+            'error': self.error,
+        }
+
+
+class JobRegistry:
+    """
+    Führt Jobs in einem eigenen Thread-Pool aus, damit Web-Worker sofort antworten können.
+    Beendete Jobs bleiben `job_ttl_seconds` abrufbar; es werden höchstens `max_jobs` gehalten.
+    """
+
+    def __init__(self, max_workers=2, max_jobs=200, job_ttl_seconds=3600):
+        self.max_jobs = max_jobs
+        self.job_ttl_seconds = job_ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='crawl-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, hashtag, run_func, mode, key=None):
+        """Legt einen Job an und startet `run_func(job)` im Hintergrund. Gibt den Job zurück."""
+        job = Job(hashtag, mode, key)
+        with self._lock:
+            self._evict()
+            self._jobs[job.job_id] = job
+        self._executor.submit(self._run, job, run_func)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def find_recent(self, key, recent_seconds):
+        """Neuester Job mit Schlüssel `key`, der noch läuft oder vor weniger als `recent_seconds` endete."""
+        now = time.time()
+        with self._lock:
+            candidates = [job for job in self._jobs.values()
+                          if job.key == key and job.status != JOB_FAILED
+                          and (not job.finished or now - job.finished_at < recent_seconds)]
+        return max(candidates, key=lambda job: job.created_at) if candidates else None
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            'jobs': len(jobs),
+            'active_jobs': sum(1 for job in jobs if not job.finished),
+        }
+
+    def _run(self, job, run_func):
+        job._set_status(JOB_RUNNING)
+        try:
+            run_func(job)
+            job._set_status(JOB_COMPLETED)
+        except Exception as e:
+            logging.error(f"Job {job.job_id} für '{job.hashtag}' fehlgeschlagen: {e}", exc_info=True)
+            job._set_status(JOB_FAILED, error=str(e))
+
+    def _evict(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and now - job.finished_at > self.job_ttl_seconds]
+        for job_id in expired:
+            del self._jobs[job_id]
+        # Notfalls die ältesten beendeten Jobs verwerfen; laufende Jobs bleiben immer erhalten
+        if len(self._jobs) >= self.max_jobs:
+            finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.created_at)
+            for job in finished[:len(self._jobs) - self.max_jobs + 1]:
+                del self._jobs[job.job_id]
@@ -3,11 +3,18 @@
 import json
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import startup_timing
+from metrics import metrics
 
 # Importiere die notwendigen Funktionen aus deinem bestehenden Crawler-Skript
 # Stelle sicher, dass crawler.py und defines.py im selben Verzeichnis
 # wie lambda_function.py im Deployment-Paket liegen.
-from crawler import search_media_by_hashtag, getCreds, process_media
+with startup_timing.timed('import:crawler'):
+    from crawler import search_media_by_hashtag, getCreds, process_media, CRAWLER_MAX_WORKERS, CrawlFailed, crawl_failure_reason, release_crawl
+from hashtag_cache import HashtagIdCache
 
 # Konfigurationen laden (aus defines.py oder Umgebungsvariablen)
 # Für Lambda ist es Best Practice, Konfigurationen über Umgebungsvariablen zu managen.
@@ -23,88 +30,154 @@ INSTAGRAM_BUSINESS_ACCOUNT_ID = creds.get('instagram_business_id')
 logger = logging.getLogger()
 logger.setLevel(logging.INFO) # Setze das gewünschte Logging-Level
 
+LAMBDA_HASHTAG_LIMIT = int(creds.get('lambda_hashtag_limit', 25)) # Ein höheres Limit für Lambda
+LAMBDA_RECORD_CONCURRENCY = int(creds.get('lambda_record_concurrency', 4)) # Gleichzeitig gecrawlte Hashtags
+# Download-Worker je Hashtag, damit die Gesamtzahl der Threads etwa CRAWLER_MAX_WORKERS bleibt
+LAMBDA_WORKERS_PER_RECORD = int(creds.get('lambda_workers_per_record', max(2, CRAWLER_MAX_WORKERS // max(1, LAMBDA_RECORD_CONCURRENCY))))
+# Reserve vor dem Lambda-Timeout: laufende Downloads abschließen und antworten
+LAMBDA_FINISH_RESERVE_SECONDS = float(creds.get('lambda_finish_reserve_seconds', 20))
+LAMBDA_MIN_START_SECONDS = float(creds.get('lambda_min_start_seconds', 5)) # Kürzere Restzeit: Hashtag nicht mehr beginnen
+LAMBDA_METRICS_NAMESPACE = creds.get('lambda_metrics_namespace', 'ImageCrawler') # CloudWatch-Namespace für EMF (metrics_enabled)
+
+_cold_start = True # Erste Invocation dieser Ausführungsumgebung
+
+
+def _parse_record(record):
+    """
+    Gibt (hashtag, platform, claim_owner) einer SQS-Nachricht zurück; wirft ValueError bei
+    ungültigem Inhalt. `claim_owner` ist die Instanz, die den Crawl per claim_crawl beansprucht hat.
+    """
+    message_body_str = record.get('body')
+    if not message_body_str:
+        raise ValueError("SQS-Nachricht ohne Body.")
+    try:
+        message_body = json.loads(message_body_str)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON-Body nicht lesbar ({message_body_str}): {e}")
+    hashtag_query = message_body.get('hashtag') if isinstance(message_body, dict) else None
+    if not hashtag_query or not HashtagIdCache.normalize(hashtag_query):
+        raise ValueError(f"Kein 'hashtag' in der Nachricht gefunden: {message_body_str}")
+    # platform könnte für zukünftige Erweiterungen nützlich sein
+    return hashtag_query, message_body.get('platform'), message_body.get('claim_owner')
+
+
+def _crawl_hashtag(hashtag_query, platform, deadline, claim_owners=()):
+    # Schlägt der Crawl fehl, den Claim der sendenden Instanz(en) freigeben: sonst verfolgen neue
+    # Suchaufträge bis zu crawl_claim_ttl_seconds lang einen Crawl, der nicht mehr läuft
+    try:
+        return _run_hashtag_crawl(hashtag_query, platform, deadline)
+    except BaseException:
+        for claim_owner in claim_owners:
+            release_crawl(hashtag_query.strip().lstrip('#'), claim_owner) # Schlüssel wie in app.submit_crawl_job
+        raise
+
+
+def _run_hashtag_crawl(hashtag_query, platform, deadline):
+    # Zeitbudget wird erst beim Start berechnet, da wartende Hashtags später beginnen
+    time_budget_seconds = None
+    if deadline is not None:
+        time_budget_seconds = deadline - time.monotonic()
+        if time_budget_seconds < LAMBDA_MIN_START_SECONDS:
+            raise TimeoutError(f"Restzeit ({time_budget_seconds:.1f}s) reicht nicht mehr für '{hashtag_query}'.")
+
+    logger.info(f"Starte Hashtag-Suche aus Lambda für: '{hashtag_query}' auf Plattform '{platform}' (Zeitbudget: {time_budget_seconds}s)")
+    crawl_stats = {}
+    images_found = search_media_by_hashtag(
+        access_token=ACCESS_TOKEN,
+        user_id_for_api_calls=INSTAGRAM_BUSINESS_ACCOUNT_ID,
+        hashtag_query=hashtag_query,
+        limit_per_hashtag=LAMBDA_HASHTAG_LIMIT,
+        time_budget_seconds=time_budget_seconds,
+        max_workers=LAMBDA_WORKERS_PER_RECORD,
+        stats=crawl_stats
+    )
+    # search_media_by_hashtag meldet Fehler nur über die Statistik; ohne Exception würde
+    # SQS die Nachricht als erledigt löschen
+    failure_reason = crawl_failure_reason(crawl_stats)
+    if failure_reason:
+        raise CrawlFailed(f"Hashtag-Suche für '{hashtag_query}' unvollständig ({len(images_found)} neue Bilder): {failure_reason}", crawl_stats)
+    logger.info(f"Hashtag-Suche für '{hashtag_query}' abgeschlossen. {len(images_found)} neue Bilder verarbeitet und in DynamoDB/S3 gespeichert.")
+    return images_found
+
+
 def lambda_handler(event, context):
     """
     AWS Lambda Handler Funktion.
-    Wird durch SQS-Nachrichten ausgelöst.
-    Verarbeitet jede Nachricht, um Medien für einen Hashtag zu crawlen.
+    Wird durch SQS-Nachrichten ausgelöst. Die Hashtags eines Batches werden nebenläufig
+    gecrawlt (höchstens LAMBDA_RECORD_CONCURRENCY gleichzeitig), mehrfach enthaltene
+    Hashtags nur einmal. Alle Crawls teilen sich die Restlaufzeit der Invocation
+    (`context.get_remaining_time_in_millis()`) abzüglich LAMBDA_FINISH_RESERVE_SECONDS.
+
+    Rückgabe im Format für partielle Batch-Fehler (`ReportBatchItemFailures` muss am
+    Event Source Mapping aktiviert sein): nur die Nachrichten in `batchItemFailures`
+    werden von SQS erneut zugestellt bzw. nach maxReceiveCount in die DLQ verschoben.
     """
-    logger.info(f"Lambda-Funktion gestartet. Event empfangen: {json.dumps(event)}")
+    global _cold_start
+    records = event.get('Records', [])
+    logger.info(f"Lambda-Funktion gestartet. {len(records)} SQS-Nachrichten empfangen.")
+    if _cold_start:
+        logger.info(f"Kaltstart: Import/Initialisierung bis zum Handler: {json.dumps(startup_timing.report())}")
 
     if not ACCESS_TOKEN or not INSTAGRAM_BUSINESS_ACCOUNT_ID:
-        logger.error("Instagram Access Token oder Business Account ID nicht konfiguriert. Verarbeitung abgebrochen.")
-        # Hier könntest du die Nachricht ggf. in eine Dead-Letter Queue (DLQ) verschieben
-        # oder einen Fehler zurückgeben, damit SQS den Versuch wiederholt (abhängig von der SQS-Konfiguration).
-        return {'statusCode': 500, 'body': 'Konfigurationsfehler in Lambda'}
-
-    processed_messages = 0
-    failed_messages = 0
-
-    for record in event.get('Records', []):
+        logger.error("Instagram Access Token oder Business Account ID nicht konfiguriert. Alle Nachrichten werden erneut zugestellt.")
+        return {'batchItemFailures': [{'itemIdentifier': record.get('messageId')} for record in records]}
+
+    failed_message_ids = []
+    message_ids_by_hashtag = {} # normalisierter Hashtag -> Message-IDs (Duplikate im Batch)
+    first_query_by_hashtag = {}
+    claim_owners_by_hashtag = {}
+    for record in records:
         try:
-            message_body_str = record.get('body')
-            if not message_body_str:
-                logger.warning("SQS-Nachricht ohne Body empfangen. Überspringe.")
-                failed_messages += 1
-                continue
-
-            logger.info(f"Verarbeite SQS-Nachricht: {message_body_str}")
-            message_body = json.loads(message_body_str)
-
-            hashtag_query = message_body.get('hashtag')
-            platform = message_body.get('platform') # Könnte für zukünftige Erweiterungen nützlich sein
-
-            if not hashtag_query:
-                logger.warning(f"Kein 'hashtag' in der Nachricht gefunden: {message_body_str}. Überspringe.")
-                failed_messages += 1
-                continue
-
-            logger.info(f"Starte Hashtag-Suche aus Lambda für: '{hashtag_query}' auf Plattform '{platform}'")
-
-            # Rufe die Hauptfunktion des Crawlers auf
-            # Du könntest hier auch process_media aufrufen, wenn die SQS-Nachricht
-            # stattdessen das Crawlen eigener Medien auslösen soll.
-            # Für dieses Beispiel fokussieren wir uns auf die Hashtag-Suche.
-            # Das Limit kann hier angepasst oder über die SQS-Nachricht/Umgebungsvariablen gesteuert werden.
-            images_found = search_media_by_hashtag(
-                access_token=ACCESS_TOKEN,
-                user_id_for_api_calls=INSTAGRAM_BUSINESS_ACCOUNT_ID,
-                hashtag_query=hashtag_query,
-                limit_per_hashtag=creds.get('lambda_hashtag_limit', 25) # Beispiel: Ein höheres Limit für Lambda
-            )
-
-            logger.info(f"Hashtag-Suche für '{hashtag_query}' abgeschlossen. {len(images_found)} neue Bilder verarbeitet und in DynamoDB/S3 gespeichert.")
-            processed_messages += 1
-
-        except json.JSONDecodeError as e:
-            logger.error(f"Fehler beim Parsen des JSON-Bodys der SQS-Nachricht: {message_body_str}. Fehler: {e}")
-            failed_messages += 1
-        except Exception as e:
-            # Allgemeine Fehlerbehandlung für unerwartete Probleme während der Verarbeitung einer Nachricht
-            logger.error(f"Fehler bei der Verarbeitung der SQS-Nachricht (Body: {message_body_str}): {e}", exc_info=True)
-            failed_messages += 1
-            # Wichtig: Wenn hier ein Fehler auftritt, wird die Nachricht (abhängig von der SQS-Konfiguration)
-            # nach Ablauf der Visibility Timeout wieder sichtbar und erneut verarbeitet.
-            # Eine Dead-Letter Queue (DLQ) für SQS ist hier sehr empfehlenswert, um fehlerhafte Nachrichten
-            # nach mehreren erfolglosen Versuchen dorthin zu verschieben und Endlosschleifen zu vermeiden.
-
-    logger.info(f"Lambda-Funktion abgeschlossen. Verarbeitete Nachrichten: {processed_messages}, Fehlgeschlagene Nachrichten: {failed_messages}")
-
-    # Lambda sollte einen erfolgreichen Statuscode zurückgeben, wenn es die Batch-Verarbeitung
-    # der SQS-Nachrichten (ohne kritische Fehler, die einen Abbruch erfordern) abgeschlossen hat.
-    # SQS kümmert sich um das Löschen der Nachrichten aus der Queue, wenn die Lambda-Funktion
-    # erfolgreich (ohne Exception) zurückkehrt und der SQS-Trigger entsprechend konfiguriert ist.
-    if failed_messages > 0 and processed_messages == 0:
-         # Wenn alle Nachrichten fehlgeschlagen sind, könnte man einen Fehler signalisieren,
-         # um die gesamte Batch-Verarbeitung als fehlgeschlagen zu markieren (abhängig von der Fehlerstrategie).
-         # Für dieses Beispiel geben wir trotzdem 200 zurück, da SQS die einzelnen fehlerhaften Nachrichten
-         # erneut zustellen wird (bis zur maxReceiveCount).
-        pass
-
-    return {
-        'statusCode': 200,
-        'body': json.dumps(f'Verarbeitung von {processed_messages} Nachrichten abgeschlossen, {failed_messages} fehlgeschlagen.')
-    }
+            hashtag_query, platform, claim_owner = _parse_record(record)
+        except ValueError as e:
+            # Ungültige Nachrichten melden, damit sie nach maxReceiveCount in der DLQ landen
+            logger.error(f"Ungültige SQS-Nachricht {record.get('messageId')}: {e}")
+            failed_message_ids.append(record.get('messageId'))
+            continue
+        hashtag_key = HashtagIdCache.normalize(hashtag_query)
+        message_ids_by_hashtag.setdefault(hashtag_key, []).append(record.get('messageId'))
+        first_query_by_hashtag.setdefault(hashtag_key, (hashtag_query, platform))
+        if claim_owner:
+            claim_owners_by_hashtag.setdefault(hashtag_key, set()).add(claim_owner)
+
+    duplicates = sum(len(message_ids) - 1 for message_ids in message_ids_by_hashtag.values())
+    if duplicates:
+        logger.info(f"{duplicates} doppelte Hashtag-Nachrichten im Batch werden zusammengefasst.")
+
+    deadline = None
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000.0 - LAMBDA_FINISH_RESERVE_SECONDS
+
+    processed_hashtags = 0
+    if first_query_by_hashtag:
+        with ThreadPoolExecutor(max_workers=min(LAMBDA_RECORD_CONCURRENCY, len(first_query_by_hashtag))) as executor:
+            futures = {
+                executor.submit(_crawl_hashtag, hashtag_query, platform, deadline, claim_owners_by_hashtag.get(hashtag_key, ())): hashtag_key
+                for hashtag_key, (hashtag_query, platform) in first_query_by_hashtag.items()
+            }
+            wait(futures)
+            for future, hashtag_key in futures.items():
+                error = future.exception()
+                if error is None:
+                    processed_hashtags += 1
+                    continue
+                # Fehlgeschlagene Hashtags: alle zugehörigen Nachrichten erneut zustellen lassen
+                if isinstance(error, CrawlFailed):
+                    logger.warning(f"Hashtag '{hashtag_key}' wird erneut zugestellt: {error}")
+                else:
+                    logger.error(f"Fehler bei der Verarbeitung des Hashtags '{hashtag_key}': {error}", exc_info=error)
+                failed_message_ids.extend(message_ids_by_hashtag[hashtag_key])
+
+    if _cold_start:
+        # Erst jetzt sind auch die verzögert erzeugten Clients (S3, DynamoDB, PIL) enthalten
+        logger.info(f"Kaltstart: Import/Initialisierung nach der ersten Invocation: {json.dumps(startup_timing.report())}")
+        _cold_start = False
+    logger.info(f"Lambda-Funktion abgeschlossen. Gecrawlte Hashtags: {processed_hashtags}, fehlgeschlagene Nachrichten: {len(failed_message_ids)} von {len(records)}")
+    metrics.increment('lambda_records_total', len(records) - len(failed_message_ids), result='processed')
+    metrics.increment('lambda_records_total', len(failed_message_ids), result='failed')
+    # Messwerte dieser Invocation als EMF-Zeilen; CloudWatch erzeugt daraus die Metriken ohne API-Aufrufe
+    metrics.emit_emf(LAMBDA_METRICS_NAMESPACE, {'FunctionName': getattr(context, 'function_name', None) or 'local'})
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failed_message_ids]}
 
 # Für lokale Tests (optional)
 if __name__ == '__main__':
@@ -141,6 +214,6 @@ if __name__ == '__main__':
         print("WARNUNG: Instagram Access Token oder Business ID nicht in defines.py für lokalen Test gefunden.")
     else:
         print("Starte lokalen Test der Lambda-Funktion...")
-        lambda_handler(sample_event, None)
+        print(lambda_handler(sample_event, None))
         print("Lokaler Test abgeschlossen.")
 
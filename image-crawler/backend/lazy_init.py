@@ -0,0 +1,34 @@
+# lazy_init.py
+# Verzögerte, threadsichere Einmal-Initialisierung für teure Objekte und Importe
+# (AWS-Clients, PIL, Caches). Die Dauer jeder Initialisierung landet in startup_timing.
+import importlib
+import threading
+
+import startup_timing
+
+_MISSING = object()
+_instances = {}
+_lock = threading.RLock() # Reentrant: Fabriken dürfen selbst memoized() aufrufen
+
+
+def memoized(name, factory):
+    """
+    Gibt das unter `name` gemerkte Objekt zurück und erzeugt es beim ersten Aufruf mit
+    `factory()` (threadsicher, genau einmal). Auch None wird gemerkt; Exceptions nicht.
+    Die Dauer der Erzeugung wird in startup_timing erfasst.
+    """
+    instance = _instances.get(name, _MISSING)
+    if instance is not _MISSING:
+        return instance
+    with _lock:
+        instance = _instances.get(name, _MISSING)
+        if instance is _MISSING:
+            with startup_timing.timed(name):
+                instance = factory()
+            _instances[name] = instance
+        return instance
+
+
+def lazy_import(module_name):
+    """Importiert ein Modul beim ersten Aufruf und erfasst die Importdauer als 'import:<modul>'."""
+    return memoized(f"import:{module_name}", lambda: importlib.import_module(module_name))
@@ -0,0 +1,198 @@
+# metrics.py
+# Zeitmessung und Zähler für die heißen Pfade des Crawlers (Graph API, CDN-Download,
+# PIL-Dekodierung, Upload, DynamoDB). Export als Prometheus-Text (/metrics in app.py)
+# oder als CloudWatch Embedded Metric Format (EMF) am Ende jeder Lambda-Invocation.
+# Abgeschaltet (metrics_enabled = False) kosten alle Aufrufe nur eine Attributabfrage.
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from defines import getCreds
+
+creds = getCreds()
+
+# Obergrenzen der Histogramm-Buckets in Sekunden (wie prometheus_client plus 30s für Lambda-Crawls)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_PREFIX = 'crawler_'
+_NULL_TIMER = nullcontext()
+
+
+class _Histogram:
+    __slots__ = ('bucket_counts', 'sum', 'count')
+
+    def __init__(self, bucket_count):
+        self.bucket_counts = [0] * (bucket_count + 1) # letzter Bucket: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def copy(self):
+        histogram = _Histogram(len(self.bucket_counts) - 1)
+        histogram.bucket_counts = list(self.bucket_counts)
+        histogram.sum = self.sum
+        histogram.count = self.count
+        return histogram
+
+
+def _unit_for(name):
+    if name.endswith('_seconds'):
+        return 'Seconds'
+    if name.endswith('_bytes') or name.endswith('_bytes_total'):
+        return 'Bytes'
+    return 'Count'
+
+
+class MetricsRegistry:
+    """
+    Histogramme (`observe`, `timed`) und Zähler (`increment`) mit Labels.
+    Serien werden über (name, sortierte Labels) identifiziert; Labels sollten wenige
+    feste Werte haben (Stufe, Operation, Fehlertyp), keine IDs.
+    """
+
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._histograms = {} # (name, labels) -> _Histogram
+        self._counters = {} # (name, labels) -> Wert
+        self._emf_flushed = {} # Stand beim letzten EMF-Export (für Deltas)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _series_key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = self._series_key(name, labels)
+        bucket_index = len(self.buckets)
+        for index, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                bucket_index = index
+                break
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(len(self.buckets))
+            histogram.bucket_counts[bucket_index] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def increment(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = self._series_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def timed(self, name, **labels):
+        """Kontextmanager: misst die Dauer des Blocks als Histogramm `name` (auch bei Exceptions)."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timed(name, labels)
+
+    @contextmanager
+    def _timed(self, name, labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def count_error(self, stage, error):
+        # Fehler nach Stufe und Exception-Klasse (z.B. ClientError, Timeout)
+        self.increment('errors_total', stage=stage, type=type(error).__name__)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._emf_flushed.clear()
+
+    def render_prometheus(self):
+        """Alle Serien im Prometheus-Textformat (Version 0.0.4), kumulativ seit Prozessstart."""
+        with self._lock:
+            histograms = {key: histogram.copy() for key, histogram in self._histograms.items()}
+            counters = dict(self._counters)
+
+        def label_text(labels, extra=()):
+            pairs = [f'{key}="{value}"' for key, value in tuple(labels) + tuple(extra)]
+            return '{' + ','.join(pairs) + '}' if pairs else ''
+
+        lines = []
+        for name in sorted({key[0] for key in counters}):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} counter")
+            for (series_name, labels), value in sorted(counters.items()):
+                if series_name == name:
+                    lines.append(f"{METRIC_PREFIX}{name}{label_text(labels)} {value}")
+        for name in sorted({key[0] for key in histograms}):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} histogram")
+            for (series_name, labels), histogram in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for upper_bound, bucket_count in zip(self.buckets + ('+Inf',), histogram.bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f"{METRIC_PREFIX}{name}_bucket{label_text(labels, (('le', upper_bound),))} {cumulative}")
+                lines.append(f"{METRIC_PREFIX}{name}_sum{label_text(labels)} {histogram.sum}")
+                lines.append(f"{METRIC_PREFIX}{name}_count{label_text(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def emf_documents(self, namespace, dimensions=None):
+        """
+        Veränderungen seit dem letzten Aufruf als CloudWatch-EMF-Dokumente, eines pro
+        Label-Kombination. Histogramme werden als Values/Counts übertragen (Wert je Bucket:
+        dessen Obergrenze, für +Inf das Doppelte der letzten Grenze). `dimensions` sind
+        feste Dimensionen für alle Dokumente (z.B. {'FunctionName': ...}).
+        """
+        dimensions = dict(dimensions or {})
+        documents = {} # labels -> EMF-Dokument
+        with self._lock:
+            for key, value in self._counters.items():
+                delta = value - self._emf_flushed.get(('counter',) + key, 0)
+                self._emf_flushed[('counter',) + key] = value
+                if delta:
+                    self._emf_entry(documents, namespace, dimensions, key, delta)
+            for key, histogram in self._histograms.items():
+                previous = self._emf_flushed.get(('histogram',) + key) or _Histogram(len(self.buckets))
+                self._emf_flushed[('histogram',) + key] = histogram.copy()
+                counts = [now - before for now, before in zip(histogram.bucket_counts, previous.bucket_counts)]
+                if not any(counts):
+                    continue
+                values = list(self.buckets) + [self.buckets[-1] * 2]
+                self._emf_entry(documents, namespace, dimensions, key, {
+                    'Values': [value for value, count in zip(values, counts) if count],
+                    'Counts': [count for count in counts if count],
+                })
+        return list(documents.values())
+
+    @staticmethod
+    def _emf_entry(documents, namespace, dimensions, key, value):
+        name, labels = key
+        document = documents.get(labels)
+        if document is None:
+            document = dict(dimensions, **dict(labels))
+            document['_aws'] = {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': namespace,
+                    'Dimensions': [sorted(set(dimensions) | {label for label, _ in labels})],
+                    'Metrics': [],
+                }],
+            }
+            documents[labels] = document
+        document['_aws']['CloudWatchMetrics'][0]['Metrics'].append({'Name': name, 'Unit': _unit_for(name)})
+        document[name] = value
+
+    def emit_emf(self, namespace, dimensions=None, write=print):
+        """Schreibt jedes EMF-Dokument als eigene JSON-Zeile (CloudWatch Logs extrahiert die Metriken)."""
+        if not self.enabled:
+            return 0
+        documents = self.emf_documents(namespace, dimensions)
+        for document in documents:
+            write(json.dumps(document, separators=(',', ':')))
+        return len(documents)
+
+
+# Prozessweite Registry für Crawler, Web-App und Lambda
+metrics = MetricsRegistry(enabled=bool(creds.get('metrics_enabled', False)))
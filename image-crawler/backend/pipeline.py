@@ -0,0 +1,58 @@
+# pipeline.py
+# Kleine Hilfsbausteine für nebenläufige Verarbeitung im Crawler.
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def bounded_map(func, iterable, max_workers=8, max_in_flight=None, executor=None):
+    """
+    Wendet `func` nebenläufig auf alle Elemente von `iterable` an und liefert die
+    Ergebnisse in Eingabereihenfolge als Generator zurück.
+
+    Es sind höchstens `max_in_flight` Aufgaben gleichzeitig unterwegs. Neue Elemente
+    werden erst aus `iterable` gezogen, wenn ein Platz frei wird (Backpressure).
+    Da sowohl Eingabe als auch Ausgabe lazy sind, lassen sich mehrere Aufrufe
+    zu einer Pipeline mit mehreren Stufen verketten:
+
+        bounded_map(schreiben, bounded_map(herunterladen, items))
+
+    Ausnahmen einer Aufgabe werden beim Abholen des Ergebnisses erneut ausgelöst;
+    für Fehlerisolation pro Element muss `func` selbst Fehler abfangen.
+    """
+    if max_in_flight is None:
+        max_in_flight = max_workers * 2
+    max_in_flight = max(1, max_in_flight)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="crawler")
+
+    pending = deque()
+    try:
+        for item in iterable:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Bei Abbruch (z.B. Generator geschlossen) noch nicht gestartete Aufgaben verwerfen
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=True)
+
+
+def isolated(func, description="Element"):
+    """
+    Umhüllt `func`, sodass eine Ausnahme nur das betroffene Element betrifft:
+    Fehler werden geloggt und als `None` zurückgegeben.
+    """
+    def wrapper(item):
+        try:
+            return func(item)
+        except Exception as e:
+            logging.error(f"Unerwarteter Fehler bei der Verarbeitung von {description}: {e}", exc_info=True)
+            return None
+    return wrapper
@@ -0,0 +1,88 @@
+# presign_cache.py
+# LRU-Cache für Presigned URLs. Eine URL wird wiederverwendet, solange ihre
+# Restlaufzeit über `min_remaining_seconds` liegt; erst danach wird neu signiert.
+# Mit temporären Rollen-Credentials (Lambda, ECS, EC2-Instanzprofil) endet die
+# Gültigkeit einer URL spätestens mit dem Ablauf der signierenden Credentials.
+import threading
+import time
+from collections import OrderedDict
+
+
+def credentials_expiry(s3_client):
+    """
+    Ablaufzeitpunkt (Unix-Sekunden) der Credentials, mit denen `s3_client` signiert,
+    oder None bei dauerhaften Schlüsseln bzw. wenn botocore ihn nicht preisgibt.
+    """
+    signer = getattr(s3_client, '_request_signer', None)
+    credentials = getattr(signer, '_credentials', None)
+    expiry_time = getattr(credentials, '_expiry_time', None) # botocore RefreshableCredentials
+    return expiry_time.timestamp() if expiry_time is not None else None
+
+
+class PresignedUrlCache:
+    """
+    Begrenzter Cache (LRU mit Ablaufzeit) für GET-Presigned-URLs, Schlüssel ist (Bucket, Key).
+    Als Ablaufzeit eines Eintrags gilt das früheste von `expires_in`, dem Ablauf der
+    signierenden Credentials (credentials_expiry) und `max_cache_seconds` (Obergrenze für
+    Credentials, deren Ablauf nicht ermittelbar ist; None = keine).
+    `stats()` liefert Treffer/Fehlzugriffe, um die Größe passend zu wählen.
+    """
+
+    def __init__(self, max_entries=10000, expires_in=3600, min_remaining_seconds=900, max_cache_seconds=None):
+        if min_remaining_seconds >= expires_in:
+            raise ValueError("min_remaining_seconds muss kleiner als expires_in sein.")
+        if max_cache_seconds is not None and min_remaining_seconds >= max_cache_seconds:
+            raise ValueError("min_remaining_seconds muss kleiner als max_cache_seconds sein.")
+        self.max_entries = max_entries
+        self.expires_in = expires_in
+        self.min_remaining_seconds = min_remaining_seconds
+        self.max_cache_seconds = max_cache_seconds
+        self._entries = OrderedDict() # (bucket, key) -> (url, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_url(self, s3_client, bucket, key):
+        cache_key = (bucket, key)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[1] - now >= self.min_remaining_seconds:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Signieren außerhalb des Locks; ClientError wird an den Aufrufer weitergereicht
+        url = s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': bucket, 'Key': key},
+            ExpiresIn=self.expires_in
+        )
+        expires_at = now + self.expires_in
+        if self.max_cache_seconds is not None:
+            expires_at = min(expires_at, now + self.max_cache_seconds)
+        # Erst nach dem Signieren lesen: botocore erneuert bald ablaufende Credentials dabei
+        signing_expiry = credentials_expiry(s3_client)
+        if signing_expiry is not None:
+            expires_at = min(expires_at, signing_expiry)
+        with self._lock:
+            self._entries[cache_key] = (url, expires_at)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return url
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,204 @@
+# rate_limit.py
+# Adaptiver Governor für die Graph API: wertet die Usage-Header jeder Antwort aus
+# und verteilt neue Anfragen zeitlich, bevor Meta drosselt (Fehlercodes 4/17/32/613).
+import json
+import logging
+import threading
+import time
+from decimal import Decimal
+
+from defines import getCreds
+
+creds = getCreds()
+
+# Graph-API-Fehlercodes für Rate Limiting
+RATE_LIMIT_ERROR_CODES = {4, 17, 32, 613}
+USAGE_WINDOW_SECONDS = 60 * 60 # Meta rechnet die Nutzung über ein gleitendes Stundenfenster
+
+
+def parse_usage_headers(headers):
+    """
+    Liest X-App-Usage und X-Business-Use-Case-Usage aus und gibt
+    (höchste Nutzung in Prozent, Sekunden bis zur Freigabe) zurück.
+    """
+    usage = 0.0
+    regain_seconds = 0.0
+
+    app_usage = headers.get('X-App-Usage')
+    if app_usage:
+        try:
+            values = json.loads(app_usage)
+            usage = max([usage] + [float(values.get(k, 0)) for k in ('call_count', 'total_cputime', 'total_time')])
+        except (ValueError, TypeError, AttributeError) as e:
+            logging.warning(f"X-App-Usage konnte nicht gelesen werden: {e}")
+
+    buc_usage = headers.get('X-Business-Use-Case-Usage')
+    if buc_usage:
+        try:
+            for entries in json.loads(buc_usage).values():
+                for entry in entries:
+                    usage = max([usage] + [float(entry.get(k, 0)) for k in ('call_count', 'total_cputime', 'total_time')])
+                    # estimated_time_to_regain_access ist in Minuten angegeben
+                    regain_seconds = max(regain_seconds, float(entry.get('estimated_time_to_regain_access', 0)) * 60)
+        except (ValueError, TypeError, AttributeError) as e:
+            logging.warning(f"X-Business-Use-Case-Usage konnte nicht gelesen werden: {e}")
+
+    return usage, regain_seconds
+
+
+class DynamoRateLimitStore:
+    """Teilt den Governor-Zustand über eine DynamoDB-Tabelle (Partition Key 'governor') zwischen Instanzen."""
+
+    def __init__(self, table, governor_name='graph_api'):
+        self.table = table
+        self.governor_name = governor_name
+
+    def load(self):
+        item = self.table.get_item(Key={'governor': self.governor_name}).get('Item')
+        if not item:
+            return None
+        return {
+            'usage': float(item.get('usage', 0)),
+            'observed_at': float(item.get('observed_at', 0)),
+            'throttled_until': float(item.get('throttled_until', 0)),
+        }
+
+    def save(self, state):
+        self.table.put_item(Item={
+            'governor': self.governor_name,
+            'usage': Decimal(str(round(state['usage'], 2))),
+            'observed_at': Decimal(str(round(state['observed_at'], 3))),
+            'throttled_until': Decimal(str(round(state['throttled_until'], 3))),
+        })
+
+
+class RateLimitGovernor:
+    """
+    Verteilt Anfragen abhängig von der zuletzt gemeldeten Nutzung.
+
+    Unterhalb von `soft_limit` Prozent wird nicht gebremst. Zwischen `soft_limit` und
+    `hard_limit` wächst der Mindestabstand zwischen zwei Anfragen quadratisch bis
+    `max_interval_seconds`. Nach einem Rate-Limit-Fehler werden keine Anfragen
+    ausgegeben, bis die gemeldete (oder geschätzte) Sperrzeit abgelaufen ist.
+    Alle Threads teilen sich einen Zeitplan; optional wird der Zustand über
+    `shared_store` mit anderen Instanzen abgeglichen.
+    """
+
+    def __init__(self, soft_limit=75.0, hard_limit=95.0, max_interval_seconds=10.0,
+                 throttle_cooldown_seconds=60.0, max_wait_seconds=300.0, shared_store=None, sync_interval_seconds=5.0):
+        self.soft_limit = soft_limit
+        self.hard_limit = hard_limit
+        self.max_interval_seconds = max_interval_seconds
+        self.throttle_cooldown_seconds = throttle_cooldown_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.shared_store = shared_store
+        self.sync_interval_seconds = sync_interval_seconds
+        self._usage = 0.0
+        self._observed_at = 0.0
+        self._throttled_until = 0.0
+        self._next_slot = 0.0
+        self._last_sync = 0.0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def _current_usage(self, now):
+        # Die gemeldete Nutzung verfällt linear über das Stundenfenster
+        age = max(0.0, now - self._observed_at)
+        return self._usage * max(0.0, 1.0 - age / USAGE_WINDOW_SECONDS)
+
+    def usage(self):
+        with self._lock:
+            return self._current_usage(time.time())
+
+    def headroom(self):
+        """Verbleibender Spielraum in Prozentpunkten bis 100 % Nutzung (0, solange gedrosselt)."""
+        now = time.time()
+        with self._lock:
+            if self._throttled_until > now:
+                return 0.0
+            return max(0.0, 100.0 - self._current_usage(now))
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            return {
+                'usage_percent': round(self._current_usage(now), 2),
+                'headroom_percent': round(0.0 if self._throttled_until > now else max(0.0, 100.0 - self._current_usage(now)), 2),
+                'throttled_for_seconds': round(max(0.0, self._throttled_until - now), 2),
+                'request_interval_seconds': round(self._interval(now), 3),
+            }
+
+    def _interval(self, now):
+        usage = self._current_usage(now)
+        if usage <= self.soft_limit:
+            return 0.0
+        if usage >= self.hard_limit:
+            return self.max_interval_seconds
+        ratio = (usage - self.soft_limit) / (self.hard_limit - self.soft_limit)
+        return self.max_interval_seconds * ratio * ratio
+
+    def acquire(self):
+        """Blockiert, bis die nächste Anfrage ausgegeben werden darf. Gibt die Wartezeit zurück."""
+        self._maybe_sync()
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot, self._throttled_until)
+            self._next_slot = slot + self._interval(now)
+        wait = min(slot - now, self.max_wait_seconds)
+        if wait > 0:
+            logging.info(f"Rate-Limit-Governor: warte {wait:.2f}s (Nutzung {self.usage():.0f} %).")
+            time.sleep(wait)
+        return max(0.0, wait)
+
+    def observe(self, headers, error_code=None):
+        """Verarbeitet die Header (und ggf. den Fehlercode) einer Graph-API-Antwort."""
+        usage, regain_seconds = parse_usage_headers(headers)
+        now = time.time()
+        with self._lock:
+            if 'X-App-Usage' in headers or 'X-Business-Use-Case-Usage' in headers:
+                self._usage = usage
+                self._observed_at = now
+                self._dirty = True
+            if regain_seconds > 0 or error_code in RATE_LIMIT_ERROR_CODES:
+                cooldown = regain_seconds or self.throttle_cooldown_seconds
+                self._throttled_until = max(self._throttled_until, now + cooldown)
+                self._dirty = True
+                logging.warning(f"Graph API drosselt (Fehlercode {error_code}, Nutzung {usage:.0f} %). Pausiere Anfragen für {cooldown:.0f}s.")
+
+    def sync(self):
+        """Gleicht sofort mit `shared_store` ab, z.B. bevor `headroom()` ohne vorherige Anfrage gelesen wird."""
+        self._maybe_sync(force=True)
+
+    def _maybe_sync(self, force=False):
+        if not self.shared_store or (not force and time.time() - self._last_sync < self.sync_interval_seconds):
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return # Ein anderer Thread gleicht gerade ab
+        try:
+            self._last_sync = time.time()
+            remote = self.shared_store.load()
+            with self._lock:
+                if remote:
+                    if remote['observed_at'] > self._observed_at:
+                        self._usage = remote['usage']
+                        self._observed_at = remote['observed_at']
+                    self._throttled_until = max(self._throttled_until, remote['throttled_until'])
+                state = {'usage': self._usage, 'observed_at': self._observed_at, 'throttled_until': self._throttled_until}
+                dirty = self._dirty
+                self._dirty = False
+            if dirty:
+                self.shared_store.save(state)
+        except Exception as e:
+            logging.error(f"Rate-Limit-Governor: Abgleich mit gemeinsamem Speicher fehlgeschlagen: {e}")
+        finally:
+            self._sync_lock.release()
+
+
+# Prozessweiter Governor für alle Graph-API-Aufrufe (Zustand wird im crawler ggf. per DynamoDB geteilt)
+graph_governor = RateLimitGovernor(
+    soft_limit=float(creds.get('graph_usage_soft_limit', 75)),
+    hard_limit=float(creds.get('graph_usage_hard_limit', 95)),
+    max_interval_seconds=float(creds.get('graph_max_request_interval_seconds', 10)),
+    throttle_cooldown_seconds=float(creds.get('graph_throttle_cooldown_seconds', 60))
+)
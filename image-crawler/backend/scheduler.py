@@ -0,0 +1,324 @@
+# scheduler.py
+# Hält eine Beobachtungsliste von Hashtags aktuell, ohne das Graph-API-Budget zu sprengen.
+# Jeder Hashtag erhält eine Priorität = erwartete neue Bilder seit dem letzten Crawl
+# (EWMA der Neuzugänge pro Stunde x vergangene Stunden). Pro Durchlauf werden die
+# wertvollsten Crawls über search_media_by_hashtag ausgeführt; wie viele, hängt vom
+# Spielraum des Rate-Limit-Governors ab. Hashtags ohne gecachte ID kosten Kontingent
+# (30 verschiedene pro 7 Tage) und werden nur bei ausreichender Reserve neu aufgenommen.
+#
+# Beispiele:
+#   python scheduler.py --add bier,wein,kaffee     # Beobachtungsliste erweitern
+#   python scheduler.py --dry-run                   # geplante Reihenfolge anzeigen
+#   python scheduler.py --once                      # einen Durchlauf ausführen
+#   python scheduler.py                             # dauerhaft alle scheduler_interval_seconds
+import argparse
+import heapq
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+
+from defines import getCreds
+
+creds = getCreds()
+SCHEDULER_STATE_PATH = creds.get('scheduler_state_path', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scheduler_state.json'))
+SCHEDULER_INTERVAL_SECONDS = float(creds.get('scheduler_interval_seconds', 300))
+SCHEDULER_MAX_CRAWLS_PER_TICK = int(creds.get('scheduler_max_crawls_per_tick', 3))
+SCHEDULER_MIN_CRAWL_INTERVAL_SECONDS = float(creds.get('scheduler_min_crawl_interval_seconds', 900)) # Frühestens erneut nach
+SCHEDULER_MAX_BACKOFF_SECONDS = float(creds.get('scheduler_max_backoff_seconds', 6 * 3600)) # Obergrenze der Wartezeit nach Fehlschlägen
+SCHEDULER_MIN_HEADROOM_PERCENT = float(creds.get('scheduler_min_headroom_percent', 25)) # Darunter keine geplanten Crawls
+SCHEDULER_YIELD_ALPHA = float(creds.get('scheduler_yield_alpha', 0.3)) # Gewicht des letzten Crawls in der EWMA
+SCHEDULER_PRIOR_RATE_PER_HOUR = float(creds.get('scheduler_prior_rate_per_hour', 1.0)) # Annahme für neue Hashtags
+SCHEDULER_QUOTA_RESERVE = int(creds.get('scheduler_quota_reserve', 5)) # Kontingent für Nutzer-Suchen freihalten
+SCHEDULER_LIMIT_PER_HASHTAG = int(creds.get('scheduler_limit_per_hashtag', 50))
+SCHEDULER_TIME_BUDGET_SECONDS = float(creds.get('scheduler_time_budget_seconds', 120))
+
+
+def _new_entry():
+    return {'added_at': time.time(), 'last_crawled_at': None, 'rate_ewma': None, 'last_new_images': None,
+            'crawls': 0, 'failures': 0, 'consecutive_failures': 0, 'retry_after': None, 'total_new_images': 0}
+
+
+class CrawlScheduler:
+    """
+    Prioritätswarteschlange über die beobachteten Hashtags. Der Zustand (Beobachtungsliste,
+    letzte Crawls, Ertrags-EWMA) liegt als JSON in `state_path` und wird nach jedem Crawl
+    atomar gespeichert. `crawl(hashtag)` gibt die Anzahl neuer Bilder zurück (Exception =
+    fehlgeschlagen, danach exponentieller Backoff); `headroom()` liefert den Rate-Limit-Spielraum in Prozent,
+    `quota_remaining()` und `is_resolved(hashtag)` den Stand des Hashtag-Kontingents.
+    """
+
+    def __init__(self, state_path, crawl, headroom, quota_remaining, is_resolved,
+                 max_crawls_per_tick=3, min_crawl_interval_seconds=900, min_headroom_percent=25,
+                 yield_alpha=0.3, prior_rate_per_hour=1.0, quota_reserve=5, max_backoff_seconds=6 * 3600):
+        self.state_path = state_path
+        self.crawl = crawl
+        self.headroom = headroom
+        self.quota_remaining = quota_remaining
+        self.is_resolved = is_resolved
+        self.max_crawls_per_tick = max_crawls_per_tick
+        self.min_crawl_interval_seconds = min_crawl_interval_seconds
+        self.min_headroom_percent = min_headroom_percent
+        self.yield_alpha = yield_alpha
+        self.prior_rate_per_hour = prior_rate_per_hour
+        self.quota_reserve = quota_reserve
+        self.max_backoff_seconds = max_backoff_seconds
+        self._lock = threading.Lock()
+        self.hashtags = self._load()
+
+    # --- Zustand ---
+
+    def _load(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as state_file:
+                return json.load(state_file).get('hashtags', {})
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.error(f"Scheduler: Zustand {self.state_path} nicht lesbar ({e}). Starte mit leerer Liste.")
+            return {}
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({'saved_at': time.time(), 'hashtags': self.hashtags}, indent=2, sort_keys=True)
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.scheduler-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, self.state_path) # Atomar: ein Abbruch hinterlässt nie eine halbe Datei
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def add(self, hashtags):
+        with self._lock:
+            for hashtag in hashtags:
+                key = hashtag.strip().lstrip('#').lower()
+                if key and key not in self.hashtags:
+                    self.hashtags[key] = _new_entry()
+
+    def remove(self, hashtags):
+        with self._lock:
+            for hashtag in hashtags:
+                self.hashtags.pop(hashtag.strip().lstrip('#').lower(), None)
+
+    # --- Planung ---
+
+    def score(self, entry, now):
+        """Erwartete neue Bilder, wenn jetzt gecrawlt wird (noch nie gecrawlt: Prior x 24 h)."""
+        rate = entry['rate_ewma'] if entry['rate_ewma'] is not None else self.prior_rate_per_hour
+        since = entry['last_crawled_at'] or (now - 24 * 3600)
+        # Kleiner Sockel, damit auch ertragslose Hashtags irgendwann wieder geprüft werden
+        return (max(rate, 0.0) + 0.01) * max(0.0, now - since) / 3600.0
+
+    def plan(self, now=None):
+        """
+        Gibt (reihenfolge, budget) zurück. `reihenfolge` enthält alle Hashtags, wertvollste
+        zuerst, je mit 'score', 'eligible', 'reason' und 'dispatch' (wird in diesem Durchlauf
+        gecrawlt). `budget` beschreibt Spielraum, Kontingent und die Zahl erlaubter Crawls.
+        """
+        now = now or time.time()
+        headroom = self.headroom()
+        quota_remaining = self.quota_remaining()
+        if headroom < self.min_headroom_percent:
+            slots = 0
+        else:
+            # Linear von 1 Crawl (an der Schwelle) bis max_crawls_per_tick (volles Budget)
+            share = (headroom - self.min_headroom_percent) / max(1e-9, 100.0 - self.min_headroom_percent)
+            slots = max(1, math.ceil(self.max_crawls_per_tick * share))
+        new_hashtag_slots = max(0, quota_remaining - self.quota_reserve)
+
+        with self._lock:
+            entries = {hashtag: dict(entry) for hashtag, entry in self.hashtags.items()}
+        heap = [(-self.score(entry, now), hashtag) for hashtag, entry in entries.items()]
+        heapq.heapify(heap)
+
+        schedule = []
+        while heap:
+            negative_score, hashtag = heapq.heappop(heap)
+            entry = entries[hashtag]
+            planned = {'hashtag': hashtag, 'score': round(-negative_score, 2), 'eligible': True, 'reason': '', 'dispatch': False,
+                       'rate_ewma': entry['rate_ewma'], 'last_crawled_at': entry['last_crawled_at'], 'crawls': entry['crawls']}
+            if entry.get('retry_after') and now < entry['retry_after']:
+                planned.update(eligible=False, reason=f"Backoff nach {entry.get('consecutive_failures', 0)} Fehlschlägen")
+            elif entry['last_crawled_at'] and now - entry['last_crawled_at'] < self.min_crawl_interval_seconds:
+                planned.update(eligible=False, reason='zu kurz seit letztem Crawl')
+            elif not self.is_resolved(hashtag):
+                if new_hashtag_slots <= 0:
+                    planned.update(eligible=False, reason=f"Hashtag-Kontingent (Rest {quota_remaining}, Reserve {self.quota_reserve})")
+                else:
+                    planned['reason'] = 'verbraucht 1 Kontingent'
+            if planned['eligible'] and slots > 0:
+                planned['dispatch'] = True
+                slots -= 1
+                if not self.is_resolved(hashtag):
+                    new_hashtag_slots -= 1
+            elif planned['eligible'] and not planned['reason']:
+                planned['reason'] = 'kein Budget in diesem Durchlauf'
+            schedule.append(planned)
+
+        budget = {'headroom_percent': round(headroom, 1), 'quota_remaining': quota_remaining,
+                  'crawls_allowed': sum(1 for planned in schedule if planned['dispatch'])}
+        return schedule, budget
+
+    # --- Ausführung ---
+
+    def record_result(self, hashtag, new_images, now=None):
+        """Aktualisiert die Ertrags-EWMA (neue Bilder pro Stunde seit dem vorigen Crawl)."""
+        now = now or time.time()
+        with self._lock:
+            entry = self.hashtags.setdefault(hashtag, _new_entry())
+            # Ohne vorigen Crawl: Zeitraum ab Aufnahme in die Liste, mindestens eine Stunde
+            since = entry['last_crawled_at'] or entry['added_at']
+            observed_rate = new_images / max(1.0, (now - since) / 3600.0)
+            if entry['rate_ewma'] is None:
+                entry['rate_ewma'] = observed_rate
+            else:
+                entry['rate_ewma'] = self.yield_alpha * observed_rate + (1 - self.yield_alpha) * entry['rate_ewma']
+            entry['rate_ewma'] = round(entry['rate_ewma'], 4)
+            entry['last_crawled_at'] = now
+            entry['last_new_images'] = new_images
+            entry['crawls'] += 1
+            entry['total_new_images'] += new_images
+            entry['consecutive_failures'] = 0
+            entry['retry_after'] = None
+
+    def record_failure(self, hashtag, now=None):
+        """
+        Nicht als ertragslos werten (EWMA und last_crawled_at bleiben unverändert); erneuter
+        Versuch frühestens nach min_crawl_interval x 2^(Fehlschläge in Folge - 1), höchstens
+        nach max_backoff_seconds.
+        """
+        now = now or time.time()
+        with self._lock:
+            entry = self.hashtags.setdefault(hashtag, _new_entry())
+            entry['failures'] += 1
+            entry['consecutive_failures'] = entry.get('consecutive_failures', 0) + 1
+            backoff = min(self.max_backoff_seconds, self.min_crawl_interval_seconds * 2 ** (entry['consecutive_failures'] - 1))
+            entry['retry_after'] = now + backoff
+            return backoff
+
+    def tick(self):
+        """Ein Durchlauf: planen und die ausgewählten Crawls nacheinander ausführen. Gibt den Plan zurück."""
+        schedule, budget = self.plan()
+        dispatched = [planned for planned in schedule if planned['dispatch']]
+        logging.info(f"Scheduler: {len(dispatched)} von {len(schedule)} Hashtags werden gecrawlt (Spielraum {budget['headroom_percent']} %, Kontingent {budget['quota_remaining']}).")
+        for planned in dispatched:
+            hashtag = planned['hashtag']
+            try:
+                new_images = self.crawl(hashtag)
+                self.record_result(hashtag, new_images)
+                logging.info(f"Scheduler: '{hashtag}' lieferte {new_images} neue Bilder (Score {planned['score']}).")
+            except Exception as e:
+                backoff = self.record_failure(hashtag)
+                logging.error(f"Scheduler: Crawl für '{hashtag}' fehlgeschlagen: {e}. Nächster Versuch frühestens in {backoff:.0f}s.")
+            self.save()
+        return schedule, budget
+
+    def run_forever(self, interval_seconds):
+        while True:
+            started = time.monotonic()
+            try:
+                self.tick()
+            except Exception as e:
+                logging.error(f"Scheduler: Durchlauf fehlgeschlagen: {e}", exc_info=True)
+            time.sleep(max(0.0, interval_seconds - (time.monotonic() - started)))
+
+
+def format_schedule(schedule, budget):
+    lines = [f"Spielraum {budget['headroom_percent']} %, Hashtag-Kontingent {budget['quota_remaining']}, Crawls in diesem Durchlauf: {budget['crawls_allowed']}",
+             f"{'':2}{'Hashtag':<28}{'Score':>10}{'Rate/h':>10}{'Crawls':>8}  Letzter Crawl         Hinweis"]
+    for planned in schedule:
+        last = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(planned['last_crawled_at'])) if planned['last_crawled_at'] else '-'
+        rate = '-' if planned['rate_ewma'] is None else f"{planned['rate_ewma']:.2f}"
+        marker = '=>' if planned['dispatch'] else ('  ' if planned['eligible'] else ' x')
+        lines.append(f"{marker} {planned['hashtag']:<27}{planned['score']:>10}{rate:>10}{planned['crawls']:>8}  {last:<20}  {planned['reason']}")
+    return '\n'.join(lines)
+
+
+def build_scheduler(state_path=SCHEDULER_STATE_PATH):
+    # Verdrahtung mit Crawler, Governor und Hashtag-Cache des laufenden Prozesses
+    from crawler import search_media_by_hashtag, get_hashtag_id_cache, get_graph_governor, CrawlFailed, crawl_failure_reason
+    access_token = creds.get('access_token')
+    business_id = creds.get('instagram_business_id')
+    graph_governor = get_graph_governor()
+
+    def crawl(hashtag):
+        crawl_stats = {}
+        images = search_media_by_hashtag(
+            access_token, business_id, hashtag,
+            limit_per_hashtag=SCHEDULER_LIMIT_PER_HASHTAG,
+            time_budget_seconds=SCHEDULER_TIME_BUDGET_SECONDS,
+            stats=crawl_stats
+        )
+        # Unvollständige Crawls als Fehlschlag werten (record_failure), nicht als ertragslos
+        failure_reason = crawl_failure_reason(crawl_stats)
+        if failure_reason:
+            raise CrawlFailed(failure_reason, crawl_stats)
+        return len(images)
+
+    def headroom():
+        # Nutzung anderer Instanzen übernehmen, bevor geplant wird (plan() ruft die Graph API nicht auf)
+        graph_governor.sync()
+        return graph_governor.headroom()
+
+    return CrawlScheduler(
+        state_path,
+        crawl=crawl,
+        headroom=headroom,
+        quota_remaining=lambda: get_hashtag_id_cache().quota_remaining(),
+        is_resolved=lambda hashtag: get_hashtag_id_cache().is_resolved(hashtag),
+        max_crawls_per_tick=SCHEDULER_MAX_CRAWLS_PER_TICK,
+        min_crawl_interval_seconds=SCHEDULER_MIN_CRAWL_INTERVAL_SECONDS,
+        min_headroom_percent=SCHEDULER_MIN_HEADROOM_PERCENT,
+        yield_alpha=SCHEDULER_YIELD_ALPHA,
+        prior_rate_per_hour=SCHEDULER_PRIOR_RATE_PER_HOUR,
+        quota_reserve=SCHEDULER_QUOTA_RESERVE,
+        max_backoff_seconds=SCHEDULER_MAX_BACKOFF_SECONDS
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawlt beobachtete Hashtags nach Aktualität und Ertrag.")
+    parser.add_argument('--state', default=SCHEDULER_STATE_PATH, help="JSON-Datei mit Beobachtungsliste und Verlauf")
+    parser.add_argument('--add', default='', help="Kommagetrennte Hashtags in die Beobachtungsliste aufnehmen")
+    parser.add_argument('--remove', default='', help="Kommagetrennte Hashtags entfernen")
+    parser.add_argument('--dry-run', action='store_true', help="Nur den geplanten Ablauf anzeigen, nichts crawlen oder speichern")
+    parser.add_argument('--once', action='store_true', help="Genau einen Durchlauf ausführen")
+    parser.add_argument('--interval', type=float, default=SCHEDULER_INTERVAL_SECONDS, help="Sekunden zwischen Durchläufen")
+    args = parser.parse_args(argv)
+
+    scheduler = build_scheduler(args.state)
+    changed = False
+    if args.add:
+        scheduler.add(args.add.split(','))
+        changed = True
+    if args.remove:
+        scheduler.remove(args.remove.split(','))
+        changed = True
+    if changed and not args.dry_run:
+        scheduler.save()
+
+    if args.dry_run:
+        print(format_schedule(*scheduler.plan()))
+        return 0
+    if not scheduler.hashtags:
+        print("Beobachtungsliste ist leer. Hashtags mit --add aufnehmen.")
+        return 1
+    if args.once:
+        print(format_schedule(*scheduler.tick()))
+        return 0
+    if changed:
+        print(f"Beobachtungsliste gespeichert: {', '.join(sorted(scheduler.hashtags))}")
+        return 0
+    scheduler.run_forever(args.interval)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
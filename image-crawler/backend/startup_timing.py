@@ -0,0 +1,54 @@
+# startup_timing.py
+# Erfasst, wie lange Importe und die Initialisierung einzelner Komponenten dauern
+# (z.B. 'import:boto3', 'aws:s3:eu-north-1'), um Kaltstarts von Lambda und
+# Gunicorn-Workern messen und gezielt verkürzen zu können.
+import threading
+import time
+from contextlib import contextmanager
+
+PROCESS_STARTED_AT = time.time()
+
+_records = [] # (komponente, sekunden, sekunden_seit_prozessstart, verschachtelungstiefe)
+_lock = threading.Lock()
+_nesting = threading.local() # Tiefe offener timed()-Blöcke je Thread
+
+
+def record(component, seconds, depth=0):
+    with _lock:
+        _records.append((component, seconds, time.time() - PROCESS_STARTED_AT, depth))
+
+
+@contextmanager
+def timed(component):
+    """
+    Misst die Dauer des Blocks und erfasst sie unter `component`, auch bei Exceptions.
+    Verschachtelte Blöcke (z.B. get_storage -> get_s3_client) werden mit ihrer Tiefe
+    erfasst, damit report() sie nicht doppelt summiert.
+    """
+    depth = getattr(_nesting, 'depth', 0)
+    _nesting.depth = depth + 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _nesting.depth = depth
+        record(component, time.perf_counter() - started, depth)
+
+
+def report():
+    """
+    Erfasste Komponenten, teuerste zuerst, plus Summe und Prozesslaufzeit (Sekunden).
+    `total_seconds` summiert nur äußerste Blöcke (depth 0); verschachtelte sind in ihnen enthalten.
+    """
+    with _lock:
+        records = list(_records)
+    components = [
+        {'component': component, 'seconds': round(seconds, 4), 'started_after_seconds': round(offset - seconds, 4), 'depth': depth}
+        for component, seconds, offset, depth in sorted(records, key=lambda entry: entry[1], reverse=True)
+    ]
+    return {
+        'process_started_at': PROCESS_STARTED_AT,
+        'uptime_seconds': round(time.time() - PROCESS_STARTED_AT, 3),
+        'total_seconds': round(sum(entry[1] for entry in records if entry[3] == 0), 4),
+        'components': components,
+    }
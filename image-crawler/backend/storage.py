@@ -0,0 +1,235 @@
+# storage.py
+# Ablage für Bilder und Derivate hinter einer gemeinsamen Schnittstelle:
+# put / put_stream / put_chunks / get / exists / url_for. S3Storage nutzt einen S3-Bucket,
+# LocalStorage das lokale Dateisystem (z.B. frontend/static/images), damit
+# Einzelrechner-Installationen und Offline-Läufe ohne S3 und ohne Signieren auskommen.
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from io import BytesIO
+
+DEFAULT_LOCAL_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "static", "images")
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+COPY_CHUNK_SIZE = 64 * 1024
+MIN_MULTIPART_PART_SIZE = 5 * 1024 * 1024 # S3-Minimum für alle Teile außer dem letzten
+
+
+class S3Storage:
+    """
+    Objekte in einem S3-Bucket. URLs sind Presigned URLs; mit `url_cache`
+    (PresignedUrlCache) werden sie wiederverwendet statt jedes Mal neu signiert.
+    Fehler (ClientError) werden an den Aufrufer weitergereicht.
+    """
+    name = 's3'
+
+    def __init__(self, s3_client, bucket, transfer_config=None, url_cache=None):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.transfer_config = transfer_config
+        self.url_cache = url_cache
+
+    def put(self, key, data, content_type, cache_control=None):
+        return self.put_stream(key, BytesIO(data), content_type, cache_control)
+
+    def put_stream(self, key, fileobj, content_type, cache_control=None):
+        extra_args = {'ContentType': content_type}
+        if cache_control:
+            extra_args['CacheControl'] = cache_control
+        upload_kwargs = {'ExtraArgs': extra_args}
+        if self.transfer_config is not None:
+            upload_kwargs['Config'] = self.transfer_config
+        self.s3_client.upload_fileobj(fileobj, self.bucket, key, **upload_kwargs)
+        return key
+
+    def put_chunks(self, key, chunks, content_type, part_size=MIN_MULTIPART_PART_SIZE, cache_control=None):
+        """
+        Lädt einen Strom von Byte-Chunks (z.B. iter_content eines Downloads) per Multipart-Upload
+        hoch. Im Speicher liegt höchstens ein Teil (`part_size`, mind. 5 MB); Exceptions aus
+        `chunks` oder von S3 brechen den Upload ab (abort_multipart_upload).
+        """
+        part_size = max(int(part_size), MIN_MULTIPART_PART_SIZE)
+        extra_args = {'ContentType': content_type}
+        if cache_control:
+            extra_args['CacheControl'] = cache_control
+        upload_id = self.s3_client.create_multipart_upload(Bucket=self.bucket, Key=key, **extra_args)['UploadId']
+        parts = []
+
+        def upload_part(data):
+            part_number = len(parts) + 1
+            response = self.s3_client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data)
+            parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+
+        try:
+            buffer = bytearray()
+            for chunk in chunks:
+                buffer += chunk
+                while len(buffer) >= part_size:
+                    upload_part(bytes(buffer[:part_size]))
+                    del buffer[:part_size]
+            if buffer or not parts:
+                upload_part(bytes(buffer)) # Letzter Teil darf kleiner sein
+            self.s3_client.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+        except BaseException:
+            try:
+                self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            except Exception:
+                pass # Die ursprüngliche Exception ist aussagekräftiger; Reste räumt eine Lifecycle-Regel auf
+            raise
+        return key
+
+    def get(self, key, bucket=None):
+        response = self.s3_client.get_object(Bucket=bucket or self.bucket, Key=key)
+        return response['Body'].read()
+
+    def exists(self, key, bucket=None):
+        try:
+            self.s3_client.head_object(Bucket=bucket or self.bucket, Key=key)
+            return True
+        except Exception as e:
+            error_code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+            if error_code in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def url_for(self, key, bucket=None):
+        bucket = bucket or self.bucket
+        if self.url_cache is not None:
+            return self.url_cache.get_url(self.s3_client, bucket, key)
+        return self.s3_client.generate_presigned_url('get_object', Params={'Bucket': bucket, 'Key': key}, ExpiresIn=3600)
+
+    def describe(self):
+        return {'backend': self.name, 'bucket': self.bucket}
+
+
+class LocalStorage:
+    """
+    Inhaltsadressierte Ablage im Dateisystem. Der Inhalt liegt genau einmal unter
+    objects/<sha[0:2]>/<sha[2:4]>/<sha> (gleiche Bilder unter verschiedenen Keys teilen
+    sich die Datei); unter refs/<key>.json steht, welcher Inhalt zu einem Key gehört.
+    Geschrieben wird immer in eine temporäre Datei und dann atomar umbenannt, sodass
+    Leser nie halbe Dateien sehen. URLs zeigen auf `url_prefix` (Flask-Route /media/).
+    """
+    name = 'local'
+    bucket = None
+
+    def __init__(self, root=DEFAULT_LOCAL_ROOT, url_prefix='/media/'):
+        self.root = os.path.abspath(root)
+        self.url_prefix = url_prefix.rstrip('/') + '/'
+        self._objects_dir = os.path.join(self.root, 'objects')
+        self._refs_dir = os.path.join(self.root, 'refs')
+        self._lock = threading.Lock()
+        os.makedirs(self._objects_dir, exist_ok=True)
+        os.makedirs(self._refs_dir, exist_ok=True)
+
+    def object_path(self, content_sha256):
+        return os.path.join(self._objects_dir, content_sha256[0:2], content_sha256[2:4], content_sha256)
+
+    def _ref_path(self, key):
+        # Keys stammen aus URLs (/media/<key>); Pfade außerhalb von refs/ abweisen
+        normalized = os.path.normpath(key.replace('\\', '/')).lstrip('/')
+        if not normalized or normalized.startswith('..') or os.path.isabs(normalized):
+            raise ValueError(f"Ungültiger Storage-Key: {key!r}")
+        return os.path.join(self._refs_dir, normalized + '.json')
+
+    def _write_atomic(self, path, write_func):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                result = write_func(tmp_file)
+            os.replace(tmp_path, path)
+            return result
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def put(self, key, data, content_type, cache_control=None):
+        return self.put_stream(key, BytesIO(data), content_type, cache_control)
+
+    def put_stream(self, key, fileobj, content_type, cache_control=None):
+        return self.put_chunks(key, iter(lambda: fileobj.read(COPY_CHUNK_SIZE), b''), content_type, cache_control=cache_control)
+
+    def put_chunks(self, key, chunks, content_type, part_size=None, cache_control=None):
+        # `part_size` nur für die gemeinsame Schnittstelle; Chunks werden direkt geschrieben
+        ref_path = self._ref_path(key)
+        # Inhalt zunächst unter temporärem Namen im objects-Verzeichnis ablegen und dabei hashen
+        fd, tmp_path = tempfile.mkstemp(dir=self._objects_dir, prefix='.tmp-')
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, 'wb') as tmp_file:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    tmp_file.write(chunk)
+                    size += len(chunk)
+            content_sha256 = digest.hexdigest()
+            object_path = self.object_path(content_sha256)
+            with self._lock:
+                if os.path.exists(object_path):
+                    os.remove(tmp_path) # Inhalt bereits vorhanden
+                else:
+                    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                    os.replace(tmp_path, object_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        ref = {'sha256': content_sha256, 'content_type': content_type, 'size': size}
+        if cache_control:
+            ref['cache_control'] = cache_control
+        self._write_atomic(ref_path, lambda ref_file: ref_file.write(json.dumps(ref).encode('utf-8')))
+        return key
+
+    def get_ref(self, key):
+        """Metadaten des Keys (sha256, content_type, size, ggf. cache_control) oder None."""
+        try:
+            with open(self._ref_path(key), 'rb') as ref_file:
+                return json.loads(ref_file.read().decode('utf-8'))
+        except FileNotFoundError:
+            return None
+
+    def resolve(self, key):
+        """Gibt (dateipfad, ref) für die Auslieferung zurück, oder (None, None) wenn der Key fehlt."""
+        ref = self.get_ref(key)
+        if not ref:
+            return None, None
+        object_path = self.object_path(ref['sha256'])
+        if not os.path.exists(object_path):
+            return None, None
+        return object_path, ref
+
+    def get(self, key, bucket=None):
+        object_path, _ = self.resolve(key)
+        if not object_path:
+            return None
+        with open(object_path, 'rb') as object_file:
+            return object_file.read()
+
+    def exists(self, key, bucket=None):
+        return self.resolve(key)[0] is not None
+
+    def url_for(self, key, bucket=None):
+        return self.url_prefix + key.lstrip('/')
+
+    def describe(self):
+        return {'backend': self.name, 'root': self.root, 'url_prefix': self.url_prefix}
+
+
+def create_storage(backend, s3_client_factory=None, bucket=None, transfer_config_factory=None,
+                   url_cache=None, local_root=None, local_url_prefix='/media/'):
+    """
+    Erzeugt das konfigurierte Backend ('s3' oder 'local'). Für S3 werden Client und
+    TransferConfig über Fabriken geholt; ohne Client (fehlende Konfiguration) gibt es None.
+    """
+    if (backend or 's3').lower() == 'local':
+        return LocalStorage(local_root or DEFAULT_LOCAL_ROOT, local_url_prefix)
+    s3_client = s3_client_factory() if s3_client_factory else None
+    if not (s3_client and bucket):
+        return None
+    transfer_config = transfer_config_factory() if transfer_config_factory else None
+    return S3Storage(s3_client, bucket, transfer_config, url_cache)
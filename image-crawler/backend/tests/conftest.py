@@ -0,0 +1,7 @@
+# conftest.py
+# Die Backend-Module liegen flach in image-crawler/backend und werden direkt importiert
+# (wie im Lambda-Paket); Tests laufen mit `python -m pytest tests` aus diesem Verzeichnis.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,44 @@
+import pytest
+
+import app
+from app import decode_gallery_cursor, encode_gallery_cursor, parse_gallery_fields
+
+
+def test_gallery_cursor_round_trip():
+    last_evaluated_key = {'hashtag_source': 'bier', 'download_timestamp_utc': '2024-05-01T10:00:00Z', 'media_id': '42'}
+    cursor = encode_gallery_cursor(last_evaluated_key)
+    assert decode_gallery_cursor(cursor, 'bier') == last_evaluated_key
+    # Ohne Padding (z.B. von Proxys abgeschnitten) weiterhin lesbar
+    assert decode_gallery_cursor(cursor.rstrip('='), 'bier') == last_evaluated_key
+
+
+def test_gallery_cursor_rejects_other_hashtag():
+    cursor = encode_gallery_cursor({'hashtag_source': 'bier', 'media_id': '42'})
+    with pytest.raises(ValueError):
+        decode_gallery_cursor(cursor, 'wein')
+
+
+@pytest.mark.parametrize('cursor', ['kein-base64!', encode_gallery_cursor(['liste']), ''])
+def test_gallery_cursor_rejects_garbage(cursor):
+    with pytest.raises(ValueError):
+        decode_gallery_cursor(cursor, 'bier')
+
+
+def test_parse_gallery_fields_without_parameter():
+    assert parse_gallery_fields(None) == (None, None)
+    assert parse_gallery_fields('') == (None, None)
+
+
+def test_parse_gallery_fields_builds_projection():
+    fields, projection = parse_gallery_fields('media_id, caption,caption,display_url')
+    assert fields == ['media_id', 'caption', 'display_url']
+    attributes = list(projection['ExpressionAttributeNames'].values())
+    # display_url braucht die Storage-Attribute, media_id nur einmal
+    assert attributes == ['media_id', 'caption'] + [field for field in app.DISPLAY_URL_SOURCE_FIELDS if field != 'media_id']
+    assert projection['ProjectionExpression'] == ', '.join(projection['ExpressionAttributeNames'])
+
+
+@pytest.mark.parametrize('fields_param', ['media_id,passwort', ' , '])
+def test_parse_gallery_fields_rejects_unknown_or_empty(fields_param):
+    with pytest.raises(ValueError):
+        parse_gallery_fields(fields_param)
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+from coalescer import CrawlCoalescer
+from jobs import JobRegistry
+
+
+@pytest.fixture
+def registry():
+    return JobRegistry(max_workers=4)
+
+
+def _wait_until_finished(job, timeout=5):
+    deadline = time.time() + timeout
+    while not job.finished and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_started_then_joined(registry):
+    suppressed = []
+    coalescer = CrawlCoalescer(registry, claim=lambda hashtag: True, on_suppressed=suppressed.append)
+    release = threading.Event()
+    job, outcome = coalescer.submit('Bier', lambda job: release.wait(5), lambda job: None, 'local')
+    assert outcome == 'started'
+    joined_job, joined_outcome = coalescer.submit('#bier', lambda job: None, lambda job: None, 'local')
+    assert joined_outcome == 'joined' and joined_job is job
+    release.set()
+    _wait_until_finished(job)
+    assert suppressed == ['#bier']
+    assert coalescer.stats() == {'crawls_started': 1, 'crawls_saved': 1, 'saved_in_process': 1, 'saved_shared': 0}
+
+
+def test_following_when_another_instance_holds_the_claim(registry):
+    followed = []
+    coalescer = CrawlCoalescer(registry, claim=lambda hashtag: False)
+    job, outcome = coalescer.submit('bier', lambda job: None, lambda job: followed.append(job.hashtag), 'local')
+    _wait_until_finished(job)
+    assert outcome == 'following'
+    assert job.mode == 'follow' and followed == ['bier']
+    assert coalescer.stats()['saved_shared'] == 1
+
+
+def test_failed_job_is_not_joined(registry):
+    coalescer = CrawlCoalescer(registry, claim=lambda hashtag: True)
+
+    def fail(job):
+        raise RuntimeError("kaputt")
+    job, _ = coalescer.submit('bier', fail, lambda job: None, 'local')
+    _wait_until_finished(job)
+    assert coalescer.submit('bier', lambda job: None, lambda job: None, 'local')[1] == 'started'
+
+
+def test_slow_claim_blocks_only_its_own_hashtag(registry):
+    claimed = []
+
+    def slow_claim(hashtag):
+        claimed.append(hashtag)
+        if hashtag == 'langsam':
+            time.sleep(0.3)
+        return True
+    coalescer = CrawlCoalescer(registry, claim=slow_claim)
+    outcomes = {}
+
+    def submit(name, hashtag):
+        outcomes[name] = coalescer.submit(hashtag, lambda job: time.sleep(0.5), lambda job: None, 'local')[1]
+    slow = [threading.Thread(target=submit, args=(f"langsam{index}", 'langsam')) for index in range(3)]
+    for thread in slow:
+        thread.start()
+    time.sleep(0.05)
+    started = time.time()
+    submit('schnell', 'schnell')
+    assert time.time() - started < 0.2 # Wartet nicht auf den Claim eines anderen Hashtags
+    for thread in slow:
+        thread.join(5)
+    assert sorted(outcomes[f"langsam{index}"] for index in range(3)) == ['joined', 'joined', 'started']
+    assert claimed.count('langsam') == 1
@@ -0,0 +1,90 @@
+import dynamo_batch
+import pytest
+from dynamo_batch import BatchMetadataWriter, batch_get_existing_keys
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(dynamo_batch, '_backoff_sleep', lambda attempt: None)
+
+
+class StubDynamo:
+    """Beantwortet Batch-Aufrufe aus vorbereiteten Antworten und merkt sich die Anfragen."""
+
+    def __init__(self, get_responses=(), write_responses=()):
+        self.get_responses = list(get_responses)
+        self.write_responses = list(write_responses)
+        self.get_requests = []
+        self.write_requests = []
+
+    def batch_get_item(self, RequestItems):
+        self.get_requests.append(RequestItems)
+        return self.get_responses.pop(0)
+
+    def batch_write_item(self, RequestItems):
+        self.write_requests.append(RequestItems)
+        return self.write_responses.pop(0)
+
+
+def _keys(*values):
+    return {'media': {'Keys': [{'media_id': value} for value in values]}}
+
+
+def test_batch_get_retries_unprocessed_keys():
+    stub = StubDynamo(get_responses=[
+        {'Responses': {'media': [{'media_id': 'a'}]}, 'UnprocessedKeys': _keys('b', 'c')},
+        {'Responses': {'media': [{'media_id': 'c'}]}, 'UnprocessedKeys': {}},
+    ])
+    assert batch_get_existing_keys(stub, 'media', 'media_id', ['a', 'b', 'c', 'a', None]) == {'a', 'c'}
+    assert len(stub.get_requests) == 2
+    assert stub.get_requests[1] == _keys('b', 'c')
+
+
+def test_batch_get_gives_up_after_max_attempts():
+    unprocessed = {'Responses': {'media': []}, 'UnprocessedKeys': _keys('b')}
+    stub = StubDynamo(get_responses=[unprocessed] * 3)
+    assert batch_get_existing_keys(stub, 'media', 'media_id', ['b'], max_attempts=3) == set()
+    assert len(stub.get_requests) == 3
+
+
+def test_batch_get_splits_into_chunks_of_100():
+    values = [f"id{index}" for index in range(150)]
+    stub = StubDynamo(get_responses=[{'Responses': {'media': []}}] * 2)
+    batch_get_existing_keys(stub, 'media', 'media_id', values)
+    assert [len(request['media']['Keys']) for request in stub.get_requests] == [100, 50]
+
+
+def _put(media_id):
+    return {'PutRequest': {'Item': {'media_id': media_id}}}
+
+
+def test_writer_retries_unprocessed_items():
+    stub = StubDynamo(write_responses=[
+        {'UnprocessedItems': {'media': [_put('b')]}},
+        {'UnprocessedItems': {}},
+    ])
+    writer = BatchMetadataWriter(stub, 'media', batch_size=25)
+    writer.add({'media_id': 'a'})
+    writer.add({'media_id': 'b'})
+    stored = writer.flush()
+    assert sorted(item['media_id'] for item in stored) == ['a', 'b']
+    assert stub.write_requests[1] == {'media': [_put('b')]}
+
+
+def test_writer_reports_only_confirmed_items():
+    still_unprocessed = {'UnprocessedItems': {'media': [_put('b')]}}
+    stub = StubDynamo(write_responses=[still_unprocessed] * 2)
+    writer = BatchMetadataWriter(stub, 'media', max_attempts=2)
+    writer.add({'media_id': 'a'})
+    writer.add({'media_id': 'b'})
+    assert [item['media_id'] for item in writer.flush()] == ['a']
+    assert len(stub.write_requests) == 2
+
+
+def test_writer_flushes_full_batches_and_deduplicates_keys():
+    stub = StubDynamo(write_responses=[{'UnprocessedItems': {}}])
+    writer = BatchMetadataWriter(stub, 'media', batch_size=2)
+    assert writer.add({'media_id': 'a', 'version': 1}) == []
+    assert writer.add({'media_id': 'a', 'version': 2}) == [] # Gleicher Schlüssel ersetzt das Item
+    stored = writer.add({'media_id': 'b'})
+    assert stored == [{'media_id': 'a', 'version': 2}, {'media_id': 'b'}]
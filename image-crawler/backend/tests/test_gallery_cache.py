@@ -0,0 +1,24 @@
+from gallery_cache import GalleryResponseCache
+
+
+def test_versions_are_bounded_and_never_repeat_after_eviction():
+    shared_versions = {}
+    cache = GalleryResponseCache(lambda hashtag: shared_versions.get(hashtag, '0'), max_entries=2, version_check_interval_seconds=60)
+    before = cache.current_version('bier')
+    cache.notify_version('bier')
+    after_bump = cache.current_version('bier')
+    assert after_bump != before
+    for hashtag in ('wein', 'kaffee', 'tee'):
+        cache.notify_version(hashtag)
+        cache.current_version(hashtag)
+    assert cache.stats()['tracked_hashtags'] == 2
+    # 'bier' wurde verdrängt; die neue Version darf keiner früheren gleichen
+    assert cache.current_version('bier') not in (before, after_bump)
+
+
+def test_shared_version_change_is_picked_up():
+    shared_versions = {'bier': '1'}
+    cache = GalleryResponseCache(lambda hashtag: shared_versions[hashtag], version_check_interval_seconds=0)
+    first = cache.current_version('bier')
+    shared_versions['bier'] = '2'
+    assert cache.current_version('bier') != first
@@ -0,0 +1,45 @@
+from hashtag_cache import DAY_SECONDS, HashtagIdCache
+
+
+def _lookup(name):
+    return f"id-{name}"
+
+
+def test_quota_blocks_new_hashtags_after_limit():
+    cache = HashtagIdCache(quota_limit=30)
+    for index in range(30):
+        assert cache.resolve(f"tag{index}", _lookup) == f"id-tag{index}"
+    assert cache.quota_remaining() == 0
+    calls = []
+    assert cache.resolve('tag30', lambda name: calls.append(name) or 'id') is None
+    assert calls == [] # Keine Suche über das Kontingent hinaus
+
+
+def test_cached_and_repeated_hashtags_do_not_use_quota():
+    cache = HashtagIdCache(quota_limit=2)
+    cache.resolve('bier', _lookup)
+    cache.resolve('#Bier ', _lookup) # Gleicher Hashtag nach Normalisierung, aus dem Cache
+    assert cache.quota_used() == 1
+    cache.resolve('wein', _lookup)
+    assert cache.quota_remaining() == 0
+    assert cache.resolve('BIER', _lookup) == 'id-bier'
+    assert cache.is_resolved('wein')
+    assert not cache.is_resolved('kaffee')
+
+
+def test_quota_window_slides_after_seven_days():
+    cache = HashtagIdCache(quota_limit=1, negative_ttl_seconds=DAY_SECONDS)
+    cache.resolve('bier', _lookup)
+    week_later = cache.store._entries['bier']['last_lookup_at'] + 7 * DAY_SECONDS + 1
+    assert cache.quota_remaining() == 0
+    assert cache.quota_remaining(now=week_later) == 1
+
+
+def test_failed_lookup_counts_against_quota_but_is_not_cached():
+    cache = HashtagIdCache(quota_limit=5)
+
+    def failing(name):
+        raise RuntimeError("Graph API nicht erreichbar")
+    assert cache.resolve('bier', failing) is None
+    assert not cache.is_resolved('bier')
+    assert cache.quota_used() == 1
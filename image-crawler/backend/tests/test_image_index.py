@@ -0,0 +1,33 @@
+import random
+
+from image_index import BKTree, ImageHashIndex, hamming_distance
+
+
+def test_bk_tree_matches_linear_search():
+    rng = random.Random(7)
+    hashes = [rng.getrandbits(64) for _ in range(300)]
+    tree = BKTree()
+    for index, hash_value in enumerate(hashes):
+        tree.add(hash_value, index)
+    for _ in range(20):
+        query = rng.choice(hashes) ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64))
+        for radius in (0, 2, 6, 24):
+            expected = sorted(index for index, hash_value in enumerate(hashes) if hamming_distance(query, hash_value) <= radius)
+            found = tree.search(query, radius)
+            assert sorted(index for _, index in found) == expected
+            assert [distance for distance, _ in found] == sorted(distance for distance, _ in found)
+
+
+def test_bk_tree_search_on_empty_tree():
+    assert BKTree().search(0, 10) == []
+
+
+def test_index_finds_exact_and_similar_entries():
+    index = ImageHashIndex(max_distance=4)
+    entry = {'content_sha256': 'sha-a', 'phash': f"{0xFF00FF00FF00FF00:016x}", 's3_key': 'a.jpg'}
+    index.add(entry)
+    assert index.find_exact('sha-a') is entry
+    near = f"{0xFF00FF00FF00FF00 ^ 0b111:016x}" # Distanz 3
+    far = f"{0xFF00FF00FF00FF00 ^ 0b11111:016x}" # Distanz 5
+    assert index.find_duplicate('sha-x', near) is entry
+    assert index.find_duplicate('sha-x', far) is None
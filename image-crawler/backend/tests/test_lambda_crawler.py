@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+import lambda_crawler
+
+
+def _record(message_id, body):
+    return {'messageId': message_id, 'body': body if isinstance(body, str) else json.dumps(body)}
+
+
+@pytest.fixture
+def crawls(monkeypatch):
+    """Ersetzt search_media_by_hashtag: Hashtags mit 'kaputt' melden einen Fehler über die Statistik."""
+    calls = {'crawled': [], 'released': []}
+
+    def fake_search(access_token, user_id_for_api_calls, hashtag_query, stats=None, **kwargs):
+        calls['crawled'].append(hashtag_query)
+        if 'kaputt' in hashtag_query:
+            stats.update(stop_reason='error', failed_items=0)
+            return []
+        stats.update(stop_reason='end', failed_items=0)
+        return [{'media_id': '1'}]
+
+    monkeypatch.setattr(lambda_crawler, 'search_media_by_hashtag', fake_search)
+    monkeypatch.setattr(lambda_crawler, 'release_crawl', lambda term, owner: calls['released'].append((term, owner)))
+    monkeypatch.setattr(lambda_crawler, 'ACCESS_TOKEN', 'token')
+    monkeypatch.setattr(lambda_crawler, 'INSTAGRAM_BUSINESS_ACCOUNT_ID', '123')
+    return calls
+
+
+def _failed_ids(response):
+    return sorted(failure['itemIdentifier'] for failure in response['batchItemFailures'])
+
+
+def test_crawl_failed_record_is_reported_as_batch_item_failure(crawls):
+    event = {'Records': [
+        _record('m1', {'hashtag': 'bier', 'platform': 'instagram'}),
+        _record('m2', {'hashtag': 'kaputt', 'platform': 'instagram', 'claim_owner': 'web:1'}),
+    ]}
+    response = lambda_crawler.lambda_handler(event, None)
+    assert _failed_ids(response) == ['m2']
+    assert sorted(crawls['crawled']) == ['bier', 'kaputt']
+    assert crawls['released'] == [('kaputt', 'web:1')]
+
+
+def test_duplicate_messages_share_the_outcome(crawls):
+    event = {'Records': [
+        _record('m1', {'hashtag': 'kaputt'}),
+        _record('m2', {'hashtag': '#Kaputt'}),
+        _record('m3', {'hashtag': 'bier'}),
+    ]}
+    response = lambda_crawler.lambda_handler(event, None)
+    assert _failed_ids(response) == ['m1', 'm2']
+    assert len(crawls['crawled']) == 2 # Jeder Hashtag nur einmal gecrawlt
+
+
+def test_invalid_messages_are_reported(crawls):
+    event = {'Records': [_record('m1', 'kein json'), _record('m2', {'platform': 'instagram'}), _record('m3', {'hashtag': 'bier'})]}
+    assert _failed_ids(lambda_crawler.lambda_handler(event, None)) == ['m1', 'm2']
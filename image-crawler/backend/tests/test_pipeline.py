@@ -0,0 +1,60 @@
+import threading
+import time
+
+from pipeline import bounded_map, isolated
+
+
+def test_bounded_map_keeps_input_order():
+    # Spätere Elemente sind schneller fertig; die Ausgabe folgt trotzdem der Eingabe
+    def slow_for_small(value):
+        time.sleep(0.01 * (5 - value))
+        return value * 10
+    assert list(bounded_map(slow_for_small, range(5), max_workers=5)) == [0, 10, 20, 30, 40]
+
+
+def test_bounded_map_limits_items_in_flight():
+    pulled = []
+    release = threading.Event()
+
+    def source():
+        for value in range(10):
+            pulled.append(value)
+            yield value
+
+    def blocked(value):
+        release.wait(5)
+        return value
+
+    results = bounded_map(blocked, source(), max_workers=2, max_in_flight=3)
+    first = threading.Thread(target=lambda: next(results))
+    first.start()
+    time.sleep(0.1)
+    # Ohne freien Platz wird nicht weiter aus der Quelle gelesen (Backpressure)
+    assert pulled == [0, 1, 2]
+    release.set()
+    first.join(5)
+    assert list(results) == list(range(1, 10))
+
+
+def test_bounded_map_reraises_without_isolation():
+    def fail_on_two(value):
+        if value == 2:
+            raise RuntimeError("kaputt")
+        return value
+    results = bounded_map(fail_on_two, range(4), max_workers=2)
+    assert next(results) == 0
+    assert next(results) == 1
+    try:
+        next(results)
+    except RuntimeError as e:
+        assert str(e) == "kaputt"
+    else:
+        raise AssertionError("RuntimeError erwartet")
+
+
+def test_isolated_turns_errors_into_none():
+    def fail_on_two(value):
+        if value == 2:
+            raise RuntimeError("kaputt")
+        return value
+    assert list(bounded_map(isolated(fail_on_two, "Testelement"), range(4), max_workers=2)) == [0, 1, None, 3]
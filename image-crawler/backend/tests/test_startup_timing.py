@@ -0,0 +1,17 @@
+import time
+
+import startup_timing
+
+
+def test_nested_components_are_not_counted_twice(monkeypatch):
+    monkeypatch.setattr(startup_timing, '_records', [])
+    with startup_timing.timed('crawler:storage'):
+        with startup_timing.timed('aws:s3'):
+            time.sleep(0.05)
+    with startup_timing.timed('import:PIL'):
+        time.sleep(0.02)
+    report = startup_timing.report()
+    seconds = {entry['component']: entry['seconds'] for entry in report['components']}
+    depths = {entry['component']: entry['depth'] for entry in report['components']}
+    assert depths == {'crawler:storage': 0, 'aws:s3': 1, 'import:PIL': 0}
+    assert abs(report['total_seconds'] - (seconds['crawler:storage'] + seconds['import:PIL'])) < 0.001
@@ -0,0 +1,251 @@
+# transcode.py
+# Eigene Stufe für die CPU-lastige Bildverarbeitung (PIL-Dekodierung, convert("RGB"),
+# JPEG/WebP-Encode). In Threads serialisiert der GIL diese Arbeit, der TranscodePool
+# verteilt process_image deshalb auf einen Prozess-Pool (ein Prozess je Kern).
+# Die Download-/Upload-Threads der Crawl-Pipeline bleiben I/O-gebunden und speisen den Pool;
+# Bildbytes wandern in beide Richtungen über multiprocessing.shared_memory statt als
+# gepickelte Kopie durch die Pipe des Pools.
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory, resource_tracker
+
+from imaging import process_image, _pil
+
+COPY_CHUNK_SIZE = 1024 * 1024
+# Worker nie per fork starten: der Crawler hat beim Start des Pools bereits Download-Threads,
+# deren Locks (logging, boto3, requests) im Kind sonst im gesperrten Zustand landen können
+WORKER_START_METHODS = ('forkserver', 'spawn')
+
+
+def available_cores():
+    # Berücksichtigt CPU-Affinität (taskset, Container-cpusets), sofern das OS sie kennt
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def resolve_process_count(setting):
+    """
+    Übersetzt die Einstellung in eine Prozessanzahl: 'auto' = ein Prozess je Kern
+    (bei nur einem Kern und in AWS Lambda 0), sonst die angegebene Zahl.
+    0 bedeutet: process_image läuft wie bisher im aufrufenden Thread.
+    """
+    if setting in (None, '', 'auto'):
+        if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+            return 0 # Lambda hat weder /dev/shm noch POSIX-Semaphoren für multiprocessing
+        cores = available_cores()
+        return cores if cores > 1 else 0
+    return max(0, int(setting))
+
+
+class _SharedMemoryReader(io.RawIOBase):
+    """Lesbare, seekbare Datei über einem memoryview, ohne die Bytes zu kopieren (für Image.open)."""
+
+    def __init__(self, view):
+        self._view = view
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = min(len(buffer), len(self._view) - self._position)
+        if count <= 0:
+            return 0
+        buffer[:count] = self._view[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        else:
+            position = len(self._view) + offset
+        self._position = max(0, position)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+def _worker_context():
+    # Worker-Einstiegspunkte (_init_worker, _process_shared) liegen auf Modulebene und sind importierbar
+    available = multiprocessing.get_all_start_methods()
+    for method in WORKER_START_METHODS:
+        if method in available:
+            return multiprocessing.get_context(method)
+    return multiprocessing.get_context()
+
+
+def _init_worker():
+    # PIL einmal pro Worker-Prozess importieren, nicht beim ersten Bild
+    _pil()
+
+
+def _pack_result(result):
+    """
+    Legt transkodiertes Original und Derivate hintereinander in ein neues Shared-Memory-Segment.
+    Zurück an den Elternprozess gehen nur Name, Layout [(pfad, offset, länge)] und der dHash.
+    """
+    blobs = []
+    if result['transcoded'] is not None:
+        blobs.append((('transcoded',), result['transcoded']))
+    for size, by_format in result['derivatives'].items():
+        for image_format, data in by_format.items():
+            blobs.append((('derivatives', size, image_format), data))
+    packed = {'phash': result['phash'], 'segment': None, 'layout': []}
+    total_bytes = sum(len(data) for _, data in blobs)
+    if not total_bytes:
+        return packed
+
+    segment = shared_memory.SharedMemory(create=True, size=total_bytes)
+    offset = 0
+    try:
+        for path, data in blobs:
+            segment.buf[offset:offset + len(data)] = data
+            packed['layout'].append((path, offset, len(data)))
+            offset += len(data)
+    except BaseException:
+        segment.close()
+        segment.unlink()
+        raise
+    packed['segment'] = segment.name
+    # Das Segment gehört ab jetzt dem Elternprozess, der es nach dem Auslesen freigibt (unlink)
+    segment.close()
+    return packed
+
+
+def _process_shared(segment_name, size, options):
+    # Läuft im Worker-Prozess: Eingabe direkt aus dem Segment des Elternprozesses dekodieren
+    segment = shared_memory.SharedMemory(name=segment_name)
+    view = segment.buf[:size]
+    try:
+        with io.BufferedReader(_SharedMemoryReader(view), buffer_size=COPY_CHUNK_SIZE) as reader:
+            result = process_image(reader, **options)
+    finally:
+        view.release()
+        segment.close()
+    return _pack_result(result)
+
+
+def _unpack_result(packed):
+    result = {'phash': packed['phash'], 'derivatives': {}, 'transcoded': None}
+    if not packed['segment']:
+        return result
+    segment = shared_memory.SharedMemory(name=packed['segment'])
+    try:
+        for path, offset, length in packed['layout']:
+            data = bytes(segment.buf[offset:offset + length])
+            if path[0] == 'transcoded':
+                result['transcoded'] = data
+            else:
+                result['derivatives'].setdefault(path[1], {})[path[2]] = data
+    finally:
+        segment.close()
+        segment.unlink()
+    return result
+
+
+def _copy_into(fileobj, buffer, size):
+    position = 0
+    while position < size:
+        chunk = fileobj.read(min(COPY_CHUNK_SIZE, size - position))
+        if not chunk:
+            raise IOError(f"Bilddaten zu kurz: {position} statt {size} Bytes.")
+        buffer[position:position + len(chunk)] = chunk
+        position += len(chunk)
+
+
+class TranscodePool:
+    """
+    Führt process_image in `processes` Worker-Prozessen aus. `process` hat dieselbe
+    Signatur und dasselbe Ergebnis wie process_image (plus Größe der Eingabe) und blockiert
+    den aufrufenden Thread bis zum Ergebnis; Exceptions des Workers (ImageTooLarge,
+    PIL-Fehler) werden dort erneut ausgelöst.
+
+    Höchstens `max_pending` Bilder liegen gleichzeitig im Shared Memory (Backpressure für
+    die Download-Threads). Ist kein Shared Memory verfügbar oder fällt der Pool aus
+    (BrokenProcessPool, z.B. OOM-Kill eines Workers), wird das Bild im aufrufenden Thread
+    verarbeitet; ein ausgefallener Pool wird beim nächsten Bild neu aufgebaut.
+    """
+
+    def __init__(self, processes, max_pending=None):
+        self.processes = max(1, int(processes))
+        self._slots = threading.BoundedSemaphore(max_pending or self.processes * 2)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._shared_memory_available = True
+        self._stats = {'submitted': 0, 'completed': 0, 'fallbacks': 0, 'pool_restarts': 0}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Resource-Tracker vor den Workern starten, damit alle Prozesse denselben nutzen
+                # und Segmente eines abgestürzten Crawlers beim Beenden aufgeräumt werden
+                resource_tracker.ensure_running()
+                context = _worker_context()
+                self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=context, initializer=_init_worker)
+                logging.info(f"Transkodier-Pool mit {self.processes} Prozessen gestartet (Startmethode {context.get_start_method()}).")
+            return self._executor
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _discard_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self._stats['pool_restarts'] += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _process_local(self, fileobj, options):
+        self._count('fallbacks')
+        fileobj.seek(0)
+        return process_image(fileobj, **options)
+
+    def process(self, fileobj, size, **options):
+        if not self._shared_memory_available or size <= 0:
+            return self._process_local(fileobj, options)
+        with self._slots:
+            try:
+                segment = shared_memory.SharedMemory(create=True, size=size)
+            except OSError as e:
+                self._shared_memory_available = False
+                logging.warning(f"Kein Shared Memory verfügbar ({e}); Bilder werden im Crawler-Thread transkodiert.")
+                return self._process_local(fileobj, options)
+            try:
+                _copy_into(fileobj, segment.buf, size)
+                executor = self._get_executor()
+                self._count('submitted')
+                try:
+                    packed = executor.submit(_process_shared, segment.name, size, options).result()
+                except BrokenProcessPool as e:
+                    logging.error(f"Transkodier-Pool ausgefallen ({e}); Bild wird im Crawler-Thread verarbeitet.")
+                    self._discard_executor(executor)
+                    return self._process_local(fileobj, options)
+            finally:
+                segment.close()
+                segment.unlink()
+        self._count('completed')
+        return _unpack_result(packed)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, processes=self.processes, running=self._executor is not None)
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)